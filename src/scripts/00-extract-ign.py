@@ -1,10 +1,13 @@
 # Importation des librairies
-import requests
-from requests.exceptions import HTTPError, ProxyError, Timeout, RequestException
+from requests.exceptions import RequestException
 from pathlib import Path
 from dotenv import load_dotenv
 import os
-import concurrent.futures
+import time
+from manifest import BuildManifest
+from settings import PATHS
+from instrument import RunReport, span, file_written
+from download import make_session, download_all, remote_size, verify, DownloadError, ProgressReporter
 
 # Charger les variables d'environnement
 load_dotenv()
@@ -18,39 +21,56 @@ proxies = {
     "https": proxy
 } if proxy else None
 
-def download_file(link, path_output):
+# Configuration des téléchargements (voir download.py)
+WORKERS = 3  # Téléchargements simultanés, limité pour éviter la surcharge
+RETRIES = 5  # Nouvelles tentatives après une erreur transitoire
+BACKOFF = 2.0  # Délai avant la première nouvelle tentative (secondes), doublé ensuite
+CHECKSUMS = {}  # Empreintes attendues par nom de fichier ("md5:..." ou "sha256:..."), optionnel
+
+# Headers pour éviter les blocages
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+def build_manifest():
     """
-    Télécharge le fichier à partir du lien donné vers le répertoire de sortie.
+    Manifeste de construction : un fichier n'est retéléchargé que s'il est absent,
+    incomplet ou modifié depuis son dernier téléchargement.
+    """
+    return BuildManifest("00-extract-ign", code=[__file__])
+
+def pending_downloads(session, links, path_output, manifest):
+    """
+    Liste les fichiers à télécharger sous la forme (url, destination, taille, empreinte).
     
     Parameters:
-    link (str): URL du fichier à télécharger.
+    session (Session): Session HTTP partagée.
+    links (list): URLs des fichiers.
     path_output (Path): Chemin du répertoire de sortie.
+    manifest (BuildManifest): Manifeste du téléchargement.
     """
-    try:
-        # Headers pour éviter les blocages
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        
-        response = requests.get(link, headers=headers, proxies=proxies, stream=True)
-        response.raise_for_status()
-        
-        # Détermination du nom de fichier
+    pending = []
+    for link in links:
         file_name = Path(link).name
         file_dest = path_output / file_name
+        checksum = CHECKSUMS.get(file_name)
         
-        if not file_dest.exists():
-            print(f"Début du téléchargement: {file_name}...")
-            with open(file_dest, "wb") as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        file.write(chunk)
-            print(f"Téléchargement terminé: {file_name}")
-        else:
+        if manifest.is_up_to_date([file_dest], params={"url": link, "checksum": checksum}):
             print(f"Fichier déjà existant: {file_name}")
-    
-    except (HTTPError, ProxyError, Timeout, RequestException) as e:
-        print(f"Erreur lors du téléchargement de {link} : {e}")
+            continue
+        
+        # Fichier complet téléchargé avant la mise en place du manifeste
+        if file_dest.exists():
+            try:
+                verify(file_dest, remote_size(session, link), checksum)
+                print(f"Fichier déjà existant: {file_name}")
+                manifest.record([file_dest], params={"url": link, "checksum": checksum})
+                continue
+            except (DownloadError, RequestException):
+                pass
+        
+        pending.append((link, file_dest, None, checksum))
+    return pending
 
 # Liste des URLs spécifiques à télécharger
 specific_files = [
@@ -71,12 +91,84 @@ for url in specific_files:
     if not re.search(pattern, url):
         print(f"ATTENTION: L'URL {url} ne correspond pas au pattern")
 
+# Territoire de chaque archive (FXX : France métropolitaine, FRA dans les étapes suivantes)
+TERRITORY_CODES = {
+    "LAMB93_FXX": "FRA",
+    "RGAF09UTM20_GLP": "GLP",
+    "RGAF09UTM20_MTQ": "MTQ",
+    "UTM22RGFG95_GUF": "GUF",
+    "RGR92UTM40S_REU": "REU",
+    "RGM04UTM38S_MYT": "MYT",
+}
+
+def territory_links(territories=None):
+    """
+    Associe à chaque territoire l'URL de son archive.
+    
+    Parameters:
+    territories (list, optional): Codes des territoires (FRA, GLP...), tous par défaut.
+    """
+    links = {}
+    for url in specific_files:
+        match = re.search(pattern, url)
+        if match and (territories is None or TERRITORY_CODES[match.group(1)] in territories):
+            links[TERRITORY_CODES[match.group(1)]] = url
+    return links
+
 # Chemin de sortie
-path_output = Path("./src/raw_data/ign/")
-path_output.mkdir(parents=True, exist_ok=True)
+path_output = PATHS["raw_data"]
+
+def download_files(links, manifest, workers=WORKERS):
+    """
+    Télécharge les fichiers absents ou incomplets (reprise des fichiers .part interrompus).
+    Retourne les statistiques des téléchargements réussis et les erreurs (url, erreur).
+    
+    Parameters:
+    links (list): URLs des fichiers.
+    manifest (BuildManifest): Manifeste du téléchargement, mis à jour.
+    workers (int): Téléchargements simultanés.
+    """
+    path_output.mkdir(parents=True, exist_ok=True)
+    session = make_session(proxies=proxies, headers=HEADERS, pool_size=workers)
+    files = pending_downloads(session, links, path_output, manifest)
+    start = time.monotonic()
+    with span("download", files=len(files)):
+        results, errors = download_all(
+            session, files, workers=workers, progress=ProgressReporter(), retries=RETRIES, backoff=BACKOFF
+        )
 
-# Téléchargement des fichiers spécifiques
-with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:  # Réduit à 3 workers pour éviter la surcharge
-    executor.map(lambda url: download_file(url, path_output), specific_files)
+    for stats in results:
+        manifest.record([stats.path], params={"url": stats.url, "checksum": CHECKSUMS.get(stats.path.name)})
+        file_written(stats.path, transferred=stats.bytes, seconds=stats.seconds, attempts=stats.attempts)
+        resumed = f", repris à {stats.resumed_from / 1e6:.1f} MB" if stats.resumed_from else ""
+        print(f"Téléchargement terminé: {stats.path.name} ({stats.size / 1e6:.1f} MB, "
+              f"{stats.throughput / 1e6:.1f} MB/s, {stats.attempts} tentative(s){resumed})")
+    for link, error in errors:
+        print(f"Erreur lors du téléchargement de {link} : {error}")
+
+    if files:
+        elapsed = time.monotonic() - start
+        transferred = sum(stats.bytes for stats in results)
+        print(f"Téléchargements terminés : {len(results)}/{len(files)} fichier(s), "
+              f"{transferred / 1e6:.1f} MB en {elapsed:.0f}s ({transferred / 1e6 / max(elapsed, 1e-9):.1f} MB/s).")
+    return results, errors
+
+def download_archive(link, manifest):
+    """
+    Télécharge l'archive d'un territoire (tâche de pipeline.py).
+    Lève une DownloadError si le téléchargement a échoué.
+    
+    Parameters:
+    link (str): URL de l'archive.
+    manifest (BuildManifest): Manifeste du téléchargement, mis à jour.
+    """
+    results, errors = download_files([link], manifest, workers=1)
+    if errors:
+        raise DownloadError(f"{Path(link).name} : {errors[0][1]}")
+    return path_output / Path(link).name
 
-print("Téléchargements terminés.")
\ No newline at end of file
+if __name__ == "__main__":
+    with RunReport("00-extract-ign"):
+        manifest = build_manifest()
+        download_files(specific_files, manifest)
+        manifest.save()
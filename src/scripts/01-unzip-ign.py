@@ -3,48 +3,123 @@ from pathlib import Path
 import py7zr  # Pour les archives .7z
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from manifest import BuildManifest
+from instrument import RunReport, span, file_written
+from settings import PATHS
 
 # Configuration du journal
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Chemin
-path = Path("./src/raw_data/ign/")
-
-# Récupération des fichiers .7z
-files = list(path.glob('*.7z'))
-
-# Vérifie si un fichier 7z est déjà extrait
-def is_extracted(archive_path, destination):
-    try:
-        with py7zr.SevenZipFile(archive_path, 'r') as archive:
-            members = archive.getnames()
-            for member in members:
-                member_path = destination / member
-                if not member_path.exists():
-                    return False
-        return True
-    except Exception as e:
-        logging.error(f"Erreur lors de la vérification de {archive_path.name}: {e}")
-        return False
-
-# Filtre des fichiers .7z non extraits
-files_filtered = [file for file in files if not is_extracted(file, path)]
-
-# Décompression des fichiers .7z
-for file in files_filtered:
-    try:
-        logging.info(f"Décompression de {file.name}...")
-        
-        # Création d'un sous-dossier avec le même nom que l'archive (sans extension)
-        output_dir = path / file.stem
-        output_dir.mkdir(exist_ok=True)
-        
-        with py7zr.SevenZipFile(file, 'r') as archive:
-            archive.extractall(output_dir)
-        
-        logging.info(f"{file.name} a été extrait dans {output_dir}")
-        
-    except Exception as e:
-        logging.error(f"Erreur lors de la décompression de {file.name}: {e}")
-
-logging.info("Traitement terminé.")
\ No newline at end of file
+path = PATHS["raw_data"]
+
+# Couches extraites des archives ADMIN-EXPRESS et extensions de fichiers conservées
+# (seul COMMUNE.shp et ses fichiers associés sont lus par 02-convert-ign.py)
+LAYERS = {
+    "COMMUNE": [".shp", ".shx", ".dbf", ".prj", ".cpg"],
+}
+
+# Nombre d'archives extraites en parallèle (une par processus)
+WORKERS = min(6, os.cpu_count() or 1)
+
+def select_members(names, layers=LAYERS):
+    """
+    Sélectionne les fichiers de l'archive appartenant aux couches demandées.
+
+    Parameters:
+    names (list): Chemins des fichiers dans l'archive.
+    layers (dict): Extensions conservées par nom de couche.
+    """
+    extensions = {layer.upper(): {ext.lower() for ext in exts} for layer, exts in layers.items()}
+    selected = []
+    for name in names:
+        member = Path(name)
+        if member.suffix.lower() in extensions.get(member.stem.upper(), ()):
+            selected.append(name)
+    return selected
+
+def extract_archive(file, output_dir, layers=LAYERS):
+    """
+    Extrait les couches demandées d'une archive .7z (exécuté dans un processus séparé).
+
+    Parameters:
+    file (Path): Archive .7z.
+    output_dir (Path): Dossier d'extraction.
+    layers (dict): Extensions conservées par nom de couche.
+    """
+    output_dir.mkdir(exist_ok=True)
+    with py7zr.SevenZipFile(file, 'r') as archive:
+        targets = select_members(archive.getnames(), layers)
+        if not targets:
+            raise ValueError(f"Aucune couche {', '.join(layers)} dans l'archive")
+        archive.extract(path=output_dir, targets=targets)
+    return len(targets)
+
+def build_manifest():
+    """
+    Manifeste de construction : une archive n'est extraite que si elle a changé,
+    si les couches demandées ont changé ou si son dossier d'extraction a été modifié depuis.
+    """
+    return BuildManifest("01-unzip-ign", code=[__file__])
+
+def unzip_archive(file, manifest):
+    """
+    Extrait une archive si besoin et l'enregistre dans le manifeste.
+    Retourne le nombre de fichiers extraits (0 si l'archive est déjà extraite).
+
+    Parameters:
+    file (Path): Archive .7z.
+    manifest (BuildManifest): Manifeste de l'extraction.
+    """
+    params = {"layers": LAYERS}
+    if manifest.is_up_to_date([path / file.stem], inputs=[file], params=params):
+        logging.info(f"{file.name} est déjà extrait")
+        return 0
+    with span("extract", archives=1):
+        count = extract_archive(file, path / file.stem)
+        for extracted in sorted((path / file.stem).rglob("*")):
+            if extracted.is_file():
+                file_written(extracted, archive=file.name)
+    manifest.record([path / file.stem], inputs=[file], params=params)
+    logging.info(f"{file.name} : {count} fichier(s) extrait(s) dans {path / file.stem}")
+    return count
+
+def main(workers=WORKERS):
+    # Récupération des fichiers .7z
+    files = list(path.glob('*.7z'))
+
+    manifest = build_manifest()
+    params = {"layers": LAYERS}
+
+    # Filtre des fichiers .7z non extraits
+    files_filtered = [file for file in files if not manifest.is_up_to_date([path / file.stem], inputs=[file], params=params)]
+    for file in sorted(set(files) - set(files_filtered)):
+        logging.info(f"{file.name} est déjà extrait")
+
+    # Décompression des fichiers .7z en parallèle, un dossier par archive
+    # (même nom que l'archive, sans extension)
+    with span("extract", archives=len(files_filtered)), ProcessPoolExecutor(max_workers=max(1, min(workers, len(files_filtered)))) as executor:
+        futures = {}
+        for file in files_filtered:
+            logging.info(f"Décompression de {file.name}...")
+            futures[executor.submit(extract_archive, file, path / file.stem)] = file
+
+        for future in as_completed(futures):
+            file = futures[future]
+            try:
+                count = future.result()
+                manifest.record([path / file.stem], inputs=[file], params=params)
+                for extracted in sorted((path / file.stem).rglob("*")):
+                    if extracted.is_file():
+                        file_written(extracted, archive=file.name)
+                logging.info(f"{file.name} : {count} fichier(s) extrait(s) dans {path / file.stem}")
+            except Exception as e:
+                logging.error(f"Erreur lors de la décompression de {file.name}: {e}")
+
+    manifest.save()
+    logging.info("Traitement terminé.")
+
+if __name__ == "__main__":
+    with RunReport("01-unzip-ign"):
+        main()
@@ -1,17 +1,28 @@
 import geopandas as gpd
+import pyogrio
+import shapely
 from pathlib import Path
 import re
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from manifest import BuildManifest
+from geoparquet import write_geoparquet, COMPRESSION_LEVEL
+from instrument import RunReport, span, vertices
+import settings
 
-# Configuration
-COG_YEAR = "2025"
-BASE_PATHS = [Path("./src/raw_data/ign/")]
-OUTPUT_DIR = Path("./src/processed_data/standard")
-OUTPUT_DIR.mkdir(exist_ok=True)
+# Configuration (millésime, projections et chemins : voir settings.py)
+COG_YEAR = settings.COG_YEAR
+BASE_PATHS = [settings.PATHS["raw_data"]]
+OUTPUT_DIR = settings.PATHS["processed_data"] / "standard"
+OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-CRS_CONFIG = {
-    "FRA": 2154, "GLP": 5490, "MTQ": 5490,
-    "GUF": 2972, "REU": 2975, "MYT": 4471
-}
+CRS_CONFIG = settings.CRS_CONFIG
+
+# Colonnes lues dans COMMUNE.shp (nom normalisé -> nom de sortie)
+COLUMNS = {"insee_com": "com_insee", "nom": "com_nom"}
+PARQUET_COMPRESSION_LEVEL = COMPRESSION_LEVEL  # Niveau zstd des fichiers produits
+WORKERS = min(len(CRS_CONFIG), os.cpu_count() or 1)  # Territoires convertis en parallèle, modifiable par --workers
 
 def find_shapefile(territory: str) -> Path:
     """Trouve le fichier COMMUNE.shp avec debug des chemins."""
@@ -29,17 +40,26 @@ def find_shapefile(territory: str) -> Path:
             return max(files, key=lambda f: f.stat().st_mtime)
     raise FileNotFoundError(f"Aucun fichier COMMUNE.shp trouvé pour {territory}")
 
-def process_territory(territory: str) -> gpd.GeoDataFrame:
+def normalize_column(col: str) -> str:
+    return re.sub(r'\W+', '_', col).lower()
+
+def process_territory(territory: str, timings: dict = None) -> gpd.GeoDataFrame:
     """Charge et valide les données."""
+    timings = {} if timings is None else timings
     shp_path = find_shapefile(territory)
     print(f"Chargement de {shp_path}...")
     
-    # Lecture avec reset_index
-    gdf = gpd.read_file(shp_path).reset_index(drop=True)
+    # Lecture Arrow des seules colonnes utiles
+    with span("read", territory=territory) as record:
+        fields = pyogrio.read_info(shp_path)["fields"]
+        columns = [col for col in fields if normalize_column(col) in COLUMNS]
+        gdf = gpd.read_file(shp_path, columns=columns, engine="pyogrio", use_arrow=True).reset_index(drop=True)
+        record.update(rows_out=len(gdf), vertices_out=vertices(gdf.geometry.values))
+    timings["read"] = record["seconds"]
     
     # Nettoyage
-    gdf.columns = [re.sub(r'\W+', '_', col).lower() for col in gdf.columns]
-    gdf = gdf.rename(columns={'insee_com': 'com_insee', 'nom': 'com_nom'})
+    gdf.columns = [normalize_column(col) if col != "geometry" else col for col in gdf.columns]
+    gdf = gdf.rename(columns=COLUMNS)
     gdf = gdf[['com_insee', 'com_nom', 'geometry']]
     
     # Validation
@@ -47,41 +67,124 @@ def process_territory(territory: str) -> gpd.GeoDataFrame:
     if any(gdf['com_insee'].str.len() != 5):
         raise ValueError("Code INSEE invalide")
     
-    # Correction géométries + reset_index
-    if not gdf.geometry.is_valid.all():
-        gdf.geometry = gdf.geometry.buffer(0)
+    # Correction des seules géométries invalides, en un seul lot
+    with span("repair", territory=territory) as record:
+        geometries = gdf.geometry.values.to_numpy()
+        invalid = ~shapely.is_valid(geometries)
+        if invalid.any():
+            geometries[invalid] = shapely.buffer(geometries[invalid], 0)
+            gdf = gdf.set_geometry(gpd.GeoSeries(geometries, index=gdf.index, crs=gdf.crs))
+            print(f"{territory} : {int(invalid.sum())} géométrie(s) corrigée(s)")
+        record["repaired"] = int(invalid.sum())
+    timings["repair"] = record["seconds"]
     
     # Reprojection et tri final
-    return (
-        gdf.to_crs(epsg=CRS_CONFIG[territory])
-           .sort_values('com_insee')
-           .reset_index(drop=True)
-    )
+    with span("reproject", territory=territory) as record:
+        gdf = (
+            gdf.to_crs(epsg=CRS_CONFIG[territory])
+               .sort_values('com_insee')
+               .reset_index(drop=True)
+        )
+    timings["reproject"] = record["seconds"]
+    return gdf
 
 def export_geoparquet(gdf: gpd.GeoDataFrame, territory: str) -> None:
-    """Exporte en GeoParquet avec gestion de l'index."""
+    """Exporte en GeoParquet 1.1 (tri Hilbert, colonne bbox, zstd)."""
     filename = f"com-{territory.lower()}-{COG_YEAR}.parquet"
     
     # Export sans index
-    gdf.to_parquet(
-        OUTPUT_DIR / filename,
-        compression="gzip",
-        schema_version="1.0.0",
-        index=False  # ← Désactive l'export de l'index
-    )
+    write_geoparquet(gdf, OUTPUT_DIR / filename, compression_level=PARQUET_COMPRESSION_LEVEL)
     print(f"Export réussi : {filename}")
 
-def main():
+def shapefile_inputs(shp_path: Path) -> list:
+    """Fichiers du shapefile (.shp et fichiers associés)."""
+    return sorted(p for p in shp_path.parent.glob(f"{shp_path.stem}.*") if p.is_file())
+
+def convert_territory(territory: str) -> tuple:
+    """
+    Convertit un territoire (exécuté dans un processus séparé), renvoie le
+    nombre de communes, les durées et les mesures du rapport d'exécution.
+    """
+    report = RunReport("02-convert-ign").activate()
+    timings = {}
+    with span("territory", territory=territory) as total:
+        gdf = process_territory(territory, timings)
+        with span("write", territory=territory) as record:
+            export_geoparquet(gdf, territory)
+    timings["write"] = record["seconds"]
+    timings["total"] = total["seconds"]
+    return len(gdf), timings, report.take()
+
+def build_manifest():
+    """Manifeste de construction de la conversion."""
+    return BuildManifest("02-convert-ign", code=[__file__, Path(__file__).with_name("geoparquet.py")])
+
+def territory_build(territory: str) -> tuple:
+    """Fichier produit, fichiers lus et paramètres de la conversion d'un territoire."""
+    output_path = OUTPUT_DIR / f"com-{territory.lower()}-{COG_YEAR}.parquet"
+    inputs = shapefile_inputs(find_shapefile(territory))
+    params = {"crs": CRS_CONFIG[territory], "columns": COLUMNS, "compression_level": PARQUET_COMPRESSION_LEVEL}
+    return output_path, inputs, params
+
+def convert(territory: str, manifest: BuildManifest):
+    """
+    Convertit un territoire s'il n'est pas à jour et l'enregistre dans le
+    manifeste. Renvoie le nombre de communes (None si déjà à jour).
+    """
+    output_path, inputs, params = territory_build(territory)
+    if manifest.is_up_to_date([output_path], inputs=inputs, params=params):
+        print(f"À jour : {output_path.name}")
+        return None
+    with span("territory", territory=territory):
+        gdf = process_territory(territory)
+        with span("write", territory=territory):
+            export_geoparquet(gdf, territory)
+    manifest.record([output_path], inputs=inputs, params=params)
+    print(f"Communes: {len(gdf)} | CRS: EPSG:{CRS_CONFIG[territory]}")
+    return len(gdf)
+
+def main(workers=WORKERS, report=None):
+    report = report or RunReport("02-convert-ign")
+    manifest = build_manifest()
+    
+    # Territoires à convertir
+    pending = {}
     for territory in CRS_CONFIG.keys():
-        print(f"\n--- Traitement de {territory} ---")
         try:
-            gdf = process_territory(territory)
-            print(f"Communes: {len(gdf)} | CRS: EPSG:{CRS_CONFIG[territory]}")
-            export_geoparquet(gdf, territory)
+            output_path, inputs, params = territory_build(territory)
+            if manifest.is_up_to_date([output_path], inputs=inputs, params=params):
+                print(f"À jour : {output_path.name}")
+                continue
+            pending[territory] = (output_path, inputs, params)
         except FileNotFoundError:
             print(f"⚠️ Données manquantes pour {territory}. Vérifiez les fichiers IGN.")
-        except Exception as e:
-            print(f"❌ Erreur : {e}")
+    
+    # Conversion en parallèle, un territoire par processus
+    timings = {}
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(pending)))) as executor:
+        futures = {executor.submit(convert_territory, territory): territory for territory in pending}
+        for future in as_completed(futures):
+            territory = futures[future]
+            print(f"\n--- Traitement de {territory} ---")
+            try:
+                count, timings[territory], measures = future.result()
+                report.merge(*measures)
+                print(f"Communes: {count} | CRS: EPSG:{CRS_CONFIG[territory]}")
+                output_path, inputs, params = pending[territory]
+                manifest.record([output_path], inputs=inputs, params=params)
+            except Exception as e:
+                print(f"❌ Erreur : {e}")
+    manifest.save()
+    
+    # Durées par territoire (secondes), du plus long au plus court
+    if timings:
+        print("\nDurées (s) : territoire | lecture | correction | reprojection | écriture | total")
+        for territory, t in sorted(timings.items(), key=lambda item: -item[1]["total"]):
+            print(f"  {territory} | {t['read']:.1f} | {t['repair']:.1f} | {t['reproject']:.1f} | {t['write']:.1f} | {t['total']:.1f}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Convertit les shapefiles COMMUNE de l'IGN en GeoParquet")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Nombre de processus (1 = un territoire à la fois)")
+    args = parser.parse_args()
+    with RunReport("02-convert-ign") as report:
+        main(workers=args.workers, report=report)
@@ -2,6 +2,14 @@ import geopandas as gpd
 import os
 from pathlib import Path
 import re
+import numpy as np
+import shapely
+from topology import build_topology, rebuild_geometries
+from generalize import generalize_arcs
+from manifest import BuildManifest
+from geoparquet import write_geoparquet, COMPRESSION_LEVEL
+from instrument import RunReport, span, vertices
+import settings
 
 
 # Nouveau test
@@ -22,17 +30,35 @@ import re
 # Config Windows
 # GRASS_BIN = r"C:\Program Files\QGIS 3.30.3\bin\grass82.bat"  # À adapter!
 
+# Recettes v.generalize ci-dessus, exécutées sans GRASS (voir generalize.py).
+# Les étapes sans tolérance utilisent la tolérance de la sortie produite.
+# "distance weighting" n'a pas d'équivalent : remplacé par sliding averaging.
+RECIPES = {
+    "douglas": [("douglas", {})],
+    "grass": [
+        ("reumann", {}),
+        ("douglas", {}),
+        ("sliding_averaging", {"look_ahead": 11}),
+        ("chaiken", {"threshold": 50}),
+    ],
+    "grass-fra": [
+        ("reumann", {}),
+        ("douglas", {}),
+        ("douglas", {"tolerance": 5}),
+        ("sliding_averaging", {"look_ahead": 11}),
+    ],
+}
 
+# Simplification
+SIMPLIFICATION_MODE = "coverage"  # "coverage" (shared borders simplified once) or "polygon"
+TOLERANCES = [50, 200, 1000]  # Tolérances produites en une lecture (mètres)
+RECIPE = "douglas"
+MAX_HALVINGS = 4  # Divisions par deux de la tolérance des arcs de communes qui se chevauchent, avant de les garder intacts
+PARQUET_COMPRESSION_LEVEL = COMPRESSION_LEVEL  # zstd level of the outputs
 
-# Projections
-CRS_CONFIG = {
-    "FRA": 2154,  # France métropolitaine
-    "GLP": 5490,  # Guadeloupe
-    "MTQ": 5490,  # Martinique
-    "GUF": 2972,  # Guyane française
-    "REU": 2975,  # Réunion
-    "MYT": 4471,  # Mayotte
-}
+
+# Projections (voir settings.py)
+CRS_CONFIG = settings.CRS_CONFIG
 
 def extract_territory_code(filename):
     """
@@ -54,14 +80,22 @@ def extract_territory_code(filename):
     
     return None
 
-def simplify_geometries(input_path, simplification_distance=200):
+def simplify_geometries(input_path, simplification_distance=200, manifest=None):
     """
     Simplify geometries while preserving topology with a single distance.
     
     Parameters:
     - input_path: Path to the input Parquet file
     - simplification_distance: Simplification distance in meters
+    - manifest: Optional BuildManifest, the output is skipped when up to date
     """
+    stem, suffix = Path(input_path).stem, Path(input_path).suffix
+    output_path = Path(input_path).parent / f"{stem}-simplified-{simplification_distance}m{suffix}"
+    params = {"mode": "polygon", "tolerance": simplification_distance, "compression_level": PARQUET_COMPRESSION_LEVEL}
+    if manifest and manifest.is_up_to_date([output_path], inputs=[input_path], params=params):
+        print(f"Up to date: {output_path}")
+        return
+    
     # Read the original geometries
     gdf = gpd.read_file(input_path)
     
@@ -94,31 +128,165 @@ def simplify_geometries(input_path, simplification_distance=200):
         preserve_topology=True
     )
     
-    # Create the output filename
-    output_filename = f"{filename}-simplified-{simplification_distance}m{file_extension}"
-    output_path = input_dir / output_filename
-    
     # Export the simplified geometries
-    simplified_gdf.to_file(output_path, driver='Parquet')
+    write_geoparquet(simplified_gdf, output_path, compression_level=PARQUET_COMPRESSION_LEVEL)
+    if manifest:
+        manifest.record([output_path], inputs=[input_path], params=params)
     print(f"Exported simplified geometries: {output_path}")
     print(f"Used CRS: EPSG:{target_crs}")
 
+def invalid_features(geometries):
+    """Features with invalid coverage edges (overlap with a neighbour or mismatching border)."""
+    present = ~shapely.is_missing(geometries)
+    invalid = np.zeros(len(geometries), dtype=bool)
+    invalid[present] = ~shapely.is_empty(shapely.coverage_invalid_edges(geometries[present]))
+    return invalid
+
+def generalize_coverage(topology, steps, tolerance, max_halvings=MAX_HALVINGS):
+    """
+    Generalize the arcs of a coverage and rebuild its features.
+
+    Arcs are simplified one by one, so two simplified arcs can cross and
+    their features overlap. The arcs of the features whose coverage edges
+    became invalid, and of their neighbours, are generalized again at half
+    the tolerance, up to max_halvings times, then kept unsimplified.
+    Returns the arcs and the feature geometries.
+    """
+    arcs = generalize_arcs(topology.arcs, steps, tolerance=tolerance)
+    geometries = rebuild_geometries(topology, arcs)
+    baseline = invalid_features(topology.geometries)
+    for halving in range(1, max_halvings + 2):
+        invalid = invalid_features(geometries) & ~baseline
+        if not invalid.any():
+            break
+        # Arcs of the invalid features and of the features they touch (EXTERIOR is the last index)
+        present = np.flatnonzero(~shapely.is_missing(geometries))
+        around = np.zeros(len(geometries) + 1, dtype=bool)
+        around[present[shapely.STRtree(geometries[present]).query(geometries[invalid], predicate="intersects")[1]]] = True
+        around[:-1] |= invalid
+        redo = around[topology.left] | around[topology.right]
+        if halving > max_halvings:
+            arcs[redo] = topology.arcs[redo]
+        else:
+            arcs[redo] = generalize_arcs(topology.arcs[redo], steps, tolerance=tolerance / 2 ** halving)
+        print(f"{invalid.sum()} overlapping feature(s) at {tolerance} m: {redo.sum()} arcs simplified again")
+        geometries = rebuild_geometries(topology, arcs)
+    return arcs, geometries
+
+def simplify_frame(gdf, tolerances=TOLERANCES, recipe=RECIPE, name="coverage"):
+    """
+    Simplify a commune coverage held in memory at several tolerances.
+    
+    The topology is built once for all tolerances. Yields (tolerance,
+    simplified GeoDataFrame) pairs, communes whose geometry collapsed
+    being dropped.
+    """
+    with span("topology", layer=name) as record:
+        topology = build_topology(gdf, id_col="com_insee")
+        record.update(rows_in=len(gdf), arcs=topology.n_arcs)
+    print(f"Topology of {name}: {topology.n_arcs} arcs")
+    
+    for tolerance in tolerances:
+        with span("simplify", layer=name, tolerance=tolerance) as record:
+            arcs, geometries = generalize_coverage(topology, RECIPES[recipe], tolerance)
+            simplified_gdf = gdf.copy()
+            simplified_gdf.geometry = geometries
+            simplified_gdf = simplified_gdf[~simplified_gdf.geometry.isna()]
+            record.update(
+                rows_in=len(gdf), rows_out=len(simplified_gdf),
+                vertices_in=vertices(topology.arcs), vertices_out=vertices(arcs),
+            )
+        yield tolerance, simplified_gdf
+
+def simplify_coverage(input_path, tolerances=TOLERANCES, recipe=RECIPE, manifest=None, outputs=None):
+    """
+    Simplify a commune coverage at several tolerances from a single read.
+    
+    Each border shared by two communes is simplified once, on the arcs of
+    the commune topology, so neighbouring communes stay coincident (no gaps
+    or slivers).
+    
+    Parameters:
+    - input_path: Path to the input Parquet file
+    - tolerances: Simplification distances in meters, one output each
+    - recipe: Name of the generalization recipe in RECIPES
+    - manifest: Optional BuildManifest, outputs up to date are skipped
+    - outputs: Optional output path per tolerance (default: next to the input)
+    """
+    input_dir = Path(input_path).parent
+    filename = Path(input_path).stem
+    file_extension = Path(input_path).suffix
+    
+    outputs = outputs or {
+        tolerance: input_dir / f"{filename}-simplified-{tolerance}m{file_extension}"
+        for tolerance in tolerances
+    }
+    params = {
+        tolerance: {"mode": "coverage", "tolerance": tolerance, "recipe": recipe, "steps": RECIPES[recipe],
+                    "compression_level": PARQUET_COMPRESSION_LEVEL}
+        for tolerance in tolerances
+    }
+    if manifest:
+        tolerances = [
+            tolerance for tolerance in tolerances
+            if not manifest.is_up_to_date([outputs[tolerance]], inputs=[input_path], params=params[tolerance])
+        ]
+        if not tolerances:
+            print(f"Up to date: {filename}")
+            return
+    
+    gdf = gpd.read_parquet(input_path)
+    
+    territory_code = extract_territory_code(filename)
+    if territory_code is None:
+        print(f"Skipping {filename} - No valid territory code")
+        return
+    
+    target_crs = CRS_CONFIG.get(territory_code, 2154)
+    if gdf.crs is None or gdf.crs.is_geographic:
+        gdf = gdf.to_crs(epsg=target_crs)
+    
+    for tolerance, simplified_gdf in simplify_frame(gdf, tolerances, recipe, name=filename):
+        output_path = outputs[tolerance]
+        write_geoparquet(simplified_gdf, output_path, compression_level=PARQUET_COMPRESSION_LEVEL)
+        if manifest:
+            manifest.record([output_path], inputs=[input_path], params=params[tolerance])
+        print(f"Exported simplified geometries: {output_path}")
+    print(f"Used CRS: EPSG:{target_crs}")
+
+def build_manifest():
+    """Build manifest of the simplification."""
+    return BuildManifest(
+        "03-simplify-ign",
+        code=[__file__, Path(__file__).with_name("topology.py"), Path(__file__).with_name("generalize.py"),
+              Path(__file__).with_name("geoparquet.py")],
+    )
+
 def main():
     # Input directory where raw Parquet files are stored
-    input_dir = "./src/processed_data/"
+    input_dir = settings.PATHS["processed_data"]
     
     # Simplification distance (in meters)
     simplification_distance = 200
     
+    manifest = build_manifest()
+    
     # Process all Parquet files in the input directory
     for filename in os.listdir(input_dir):
         if filename.endswith(".parquet"):
             input_path = os.path.join(input_dir, filename)
             
             try:
-                simplify_geometries(input_path, simplification_distance)
+                with span("file", file=filename):
+                    if SIMPLIFICATION_MODE == "coverage":
+                        simplify_coverage(input_path, TOLERANCES, RECIPE, manifest=manifest)
+                    else:
+                        simplify_geometries(input_path, simplification_distance, manifest=manifest)
             except Exception as e:
                 print(f"Error processing {filename}: {e}")
+    
+    manifest.save()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with RunReport("03-simplify-ign"):
+        main()
\ No newline at end of file
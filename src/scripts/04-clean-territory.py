@@ -1,24 +1,115 @@
 import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
 from pathlib import Path
 import logging
-from shapely.validation import make_valid
+from manifest import BuildManifest
+from geoparquet import write_geoparquet, COMPRESSION_LEVEL
+from instrument import RunReport, span, add, file_written, vertices
+from settings import PATHS
 
 # Configuration
-INPUT_DIR = Path("./src/processed_data/temp")
-OUTPUT_DIR = Path("./src/processed_data/gen")
-OUTPUT_DIR.mkdir(exist_ok=True)
-SURFACE_THRESHOLD = 100000  # 100 000 m²
+INPUT_DIR = PATHS["processed_data"] / "temp"
+OUTPUT_DIR = PATHS["processed_data"] / "gen"
+OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+REPORT_DIR = PATHS["processed_data"] / "reports"  # Diagnostics par commune
+SURFACE_THRESHOLD = 100000  # 100 000 m², seuil par défaut
+# Seuil de surface par territoire (code du nom de fichier), SURFACE_THRESHOLD sinon
+SURFACE_THRESHOLDS = {
+    "FRA": 100000,
+    "GLP": 100000,
+    "MTQ": 100000,
+    "GUF": 100000,
+    "REU": 100000,
+    "MYT": 100000,
+}
+GAP_WIDTH = 1.0  # Largeur maximale des interstices détectés entre communes (m)
+# Contrôle qualité : nombre maximal de communes invalides après réparation et de communes
+# en défaut de couverture (chevauchement, interstice, limite non coïncidente), None pour ne pas contrôler
+MAX_INVALID = 0
+MAX_COVERAGE_ERRORS = 0
+PARQUET_COMPRESSION_LEVEL = COMPRESSION_LEVEL  # Niveau zstd des fichiers produits
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def process_file(input_path: Path) -> gpd.GeoDataFrame:
-    """Charge, valide et traite un fichier Parquet."""
-    logger.info(f"Traitement de {input_path.name}...")
-    
-    gdf = gpd.read_parquet(input_path)
+def territory_threshold(input_path: Path) -> float:
+    """Seuil de surface du territoire d'un fichier (com-<territoire>-...)."""
+    territory = input_path.name.split('-')[1].upper()
+    return SURFACE_THRESHOLDS.get(territory, SURFACE_THRESHOLD)
+
+def drop_small_parts(area, owner, n_communes, threshold):
+    """
+    Masque des parties conservées : les parties de moins de threshold m² sont
+    supprimées des communes en plusieurs parties, la plus grande partie étant
+    toujours conservée.
+    """
+    order = np.lexsort((-area, owner))
+    largest = np.zeros(len(area), dtype=bool)
+    largest[order[np.r_[True, owner[order][1:] != owner[order][:-1]]]] = True
+    n_parts = np.bincount(owner, minlength=n_communes)
+    return (n_parts[owner] == 1) | (area >= threshold) | largest
+
+def assemble_communes(parts, owner, n_communes):
+    """
+    Reconstitue une géométrie par commune à partir de ses parties.
+
+    Les parties disjointes sont regroupées en multipolygone ; celles qui ont
+    des limites communes sont fusionnées par union de couverture.
+    """
+    order = np.argsort(owner, kind="stable")
+    parts, owner = parts[order], owner[order]
+    counts = np.bincount(owner, minlength=n_communes)
+    owners = np.flatnonzero(counts)
+    geometries = np.full(n_communes, None, dtype=object)
+    geometries[owners] = shapely.multipolygons(parts, indices=np.searchsorted(owners, owner))
+    single = np.flatnonzero(counts == 1)
+    geometries[single] = parts[np.searchsorted(owner, single)]
+
+    # Parties adjacentes d'une même commune : union de couverture (union générale si elles se chevauchent)
+    adjacent = np.flatnonzero((counts > 1) & ~shapely.is_valid(geometries))
+    starts = np.r_[0, np.cumsum(counts)]
+    for i in adjacent:
+        commune_parts = parts[starts[i]:starts[i + 1]]
+        union = shapely.coverage_union_all(commune_parts)
+        geometries[i] = union if union.is_valid else shapely.union_all(commune_parts)
+    return geometries
+
+def coverage_diagnostics(geometries):
+    """
+    Contrôle de l'ensemble des communes en un seul lot.
+
+    Retourne par commune : le motif d'invalidité, le nombre de communes
+    chevauchées et la longueur des limites en défaut de couverture
+    (chevauchement, interstice de moins de GAP_WIDTH, limite non coïncidente).
+    """
+    reason = shapely.is_valid_reason(geometries)
+    tree = shapely.STRtree(geometries)
+    overlapping, _ = tree.query(geometries, predicate="overlaps")
+    edges = shapely.coverage_invalid_edges(geometries, gap_width=GAP_WIDTH)
+    return pd.DataFrame({
+        "invalid_reason": np.where(reason == "Valid Geometry", "", reason),
+        "overlaps": np.bincount(overlapping, minlength=len(geometries)),
+        "invalid_edge_length": np.nan_to_num(shapely.length(edges)),
+    })
+
+def process_file(input_path: Path, threshold: float = SURFACE_THRESHOLD):
+    """
+    Charge, nettoie et contrôle un fichier Parquet.
+
+    Retourne les communes nettoyées et leurs diagnostics.
+    """
+    logger.info(f"Traitement de {input_path.name} (seuil {threshold:,.0f} m²)...")
+    return clean_communes(gpd.read_parquet(input_path), threshold)
+
+def clean_communes(gdf: gpd.GeoDataFrame, threshold: float = SURFACE_THRESHOLD):
+    """
+    Nettoie et contrôle des communes déjà chargées (fichier ou pipeline en mémoire).
     
+    Retourne les communes nettoyées et leurs diagnostics.
+    """
     # Validation
     required_cols = {'com_insee', 'com_nom', 'geometry'}
     if missing := required_cols - set(gdf.columns):
@@ -26,20 +117,63 @@ def process_file(input_path: Path) -> gpd.GeoDataFrame:
     if gdf.crs is None:
         raise ValueError("CRS non défini")
     
-    # Traitement
-    gdf = gdf[['com_insee', 'com_nom', 'geometry']].copy()
-    gdf['surface'] = gdf.geometry.area
+    # Communes (couple code, nom) de chaque ligne
+    gdf = gdf[~(gdf.geometry.isna() | gdf.geometry.is_empty)]
+    grouped = gdf.groupby(['com_insee', 'com_nom'], sort=True)
+    communes = grouped.size().reset_index()[['com_insee', 'com_nom']]
+    row_commune = grouped.ngroup().to_numpy()
+    rows = row_commune >= 0
+    n_communes = len(communes)
+    
+    # Décomposition en parties, en une seule fois
+    parts, part_row = shapely.get_parts(gdf.geometry.values[rows], return_index=True)
+    owner = row_commune[rows][part_row]
     
-    counts = gdf.groupby(['com_insee', 'com_nom']).size().reset_index(name='count')
-    gdf = gdf.merge(counts, on=['com_insee', 'com_nom'])
+    # Suppression des petites parties
+    area = shapely.area(parts)
+    keep = drop_small_parts(area, owner, n_communes, threshold)
     
-    gdf = gdf[~((gdf['count'] > 1) & (gdf['surface'] < SURFACE_THRESHOLD))]
+    # Reconstitution des communes
+    geometries = assemble_communes(parts[keep], owner[keep], n_communes)
     
-    dissolved = gdf.dissolve(by=['com_insee', 'com_nom'], aggfunc='first').reset_index()
-    dissolved = dissolved[['com_insee', 'com_nom', 'geometry']]
-    dissolved.geometry = dissolved.geometry.apply(lambda geom: make_valid(geom) if not geom.is_valid else geom)
+    # Réparation des géométries invalides, puis contrôle de la couverture
+    repaired = ~shapely.is_valid(geometries)
+    repaired_reason = np.full(n_communes, "", dtype=object)
+    repaired_reason[repaired] = shapely.is_valid_reason(geometries[repaired])
+    geometries[repaired] = shapely.make_valid(geometries[repaired], method="structure", keep_collapsed=False)
     
-    return dissolved
+    diagnostics = communes.copy()
+    diagnostics['parts'] = np.bincount(owner, minlength=n_communes)
+    diagnostics['parts_dropped'] = np.bincount(owner[~keep], minlength=n_communes)
+    diagnostics['area_dropped'] = np.bincount(owner[~keep], weights=area[~keep], minlength=n_communes)
+    diagnostics['repaired'] = repaired_reason
+    diagnostics = pd.concat([diagnostics, coverage_diagnostics(geometries)], axis=1)
+    
+    cleaned = gpd.GeoDataFrame(communes, geometry=geometries, crs=gdf.crs)
+    add(rows_in=len(gdf), rows_out=n_communes, vertices_in=vertices(gdf.geometry.values), vertices_out=vertices(geometries))
+    return cleaned, diagnostics
+
+def check_quality(diagnostics: pd.DataFrame) -> list:
+    """Écarts aux seuils de qualité MAX_INVALID et MAX_COVERAGE_ERRORS."""
+    failures = []
+    invalid = int((diagnostics['invalid_reason'] != "").sum())
+    coverage_errors = int(((diagnostics['overlaps'] > 0) | (diagnostics['invalid_edge_length'] > 0)).sum())
+    if MAX_INVALID is not None and invalid > MAX_INVALID:
+        failures.append(f"{invalid} commune(s) invalide(s) (maximum {MAX_INVALID})")
+    if MAX_COVERAGE_ERRORS is not None and coverage_errors > MAX_COVERAGE_ERRORS:
+        failures.append(f"{coverage_errors} commune(s) en défaut de couverture (maximum {MAX_COVERAGE_ERRORS})")
+    return failures
+
+def summarize(diagnostics: pd.DataFrame) -> str:
+    """Résumé des diagnostics d'un fichier."""
+    return (
+        f"{len(diagnostics)} communes, "
+        f"{diagnostics['parts_dropped'].sum()} partie(s) supprimée(s) ({diagnostics['area_dropped'].sum():,.0f} m²), "
+        f"{(diagnostics['repaired'] != '').sum()} réparée(s), "
+        f"{(diagnostics['invalid_reason'] != '').sum()} invalide(s), "
+        f"{(diagnostics['overlaps'] > 0).sum()} en chevauchement, "
+        f"{(diagnostics['invalid_edge_length'] > 0).sum()} avec limites en défaut"
+    )
 
 def get_output_filename(input_filename: str) -> str:
     """Génère le nom de fichier de sortie avec '-gen'."""
@@ -47,22 +181,60 @@ def get_output_filename(input_filename: str) -> str:
         raise ValueError(f"Format de fichier invalide : {input_filename}")
     return input_filename.replace("-temp.parquet", "-gen.parquet")
 
+def build_manifest():
+    """Manifeste de construction du nettoyage."""
+    return BuildManifest("04-clean-territory", code=[__file__, Path(__file__).with_name("geoparquet.py")])
+
+def clean_file(parquet_file: Path, manifest: BuildManifest):
+    """
+    Nettoie un fichier -temp.parquet s'il n'est pas à jour, exporte le fichier
+    -gen.parquet et ses diagnostics, et les enregistre dans le manifeste.
+    Lève une ValueError si le contrôle qualité échoue.
+    """
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    output_filename = get_output_filename(parquet_file.name)
+    output_path = OUTPUT_DIR / output_filename
+    report_path = REPORT_DIR / output_filename.replace(".parquet", "-diagnostics.csv")
+    threshold = territory_threshold(parquet_file)
+    params = {
+        "threshold": threshold,
+        "gap_width": GAP_WIDTH,
+        "max_invalid": MAX_INVALID,
+        "max_coverage_errors": MAX_COVERAGE_ERRORS,
+        "compression_level": PARQUET_COMPRESSION_LEVEL,
+    }
+    
+    if manifest.is_up_to_date([output_path, report_path], inputs=[parquet_file], params=params):
+        logger.info(f"À jour : {output_filename}")
+        return
+    if output_path.exists():
+        logger.warning(f"Écrasement du fichier existant : {output_filename}")
+    
+    processed_gdf, diagnostics = process_file(parquet_file, threshold)
+    diagnostics.to_csv(report_path, index=False)
+    file_written(report_path)
+    logger.info(f"{output_filename} : {summarize(diagnostics)}")
+    
+    # Contrôle qualité : le fichier n'est pas exporté si les seuils sont dépassés
+    if failures := check_quality(diagnostics):
+        raise ValueError(f"Contrôle qualité échoué ({'; '.join(failures)}), voir {report_path}")
+    
+    write_geoparquet(processed_gdf, output_path, compression_level=PARQUET_COMPRESSION_LEVEL)
+    manifest.record([output_path, report_path], inputs=[parquet_file], params=params)
+    logger.info(f"Exporté : {output_filename}")
+
 def main():
     """Parcourt et traite tous les fichiers .parquet."""
+    manifest = build_manifest()
     for parquet_file in INPUT_DIR.glob("*.parquet"):
         try:
-            output_filename = get_output_filename(parquet_file.name)
-            output_path = OUTPUT_DIR / output_filename
-            
-            if output_path.exists():
-                logger.warning(f"Écrasement du fichier existant : {output_filename}")
-                
-            processed_gdf = process_file(parquet_file)
-            processed_gdf.to_parquet(output_path, compression="gzip", index=False)
-            logger.info(f"Exporté : {output_filename}")
-            
+            with span("file", file=parquet_file.name):
+                clean_file(parquet_file, manifest)
         except Exception as e:
             logger.error(f"Erreur avec {parquet_file.name} : {str(e)}", exc_info=True)
+    
+    manifest.save()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with RunReport("04-clean-territory"):
+        main()
@@ -3,24 +3,30 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import os
+import json
+import re
+import argparse
+import shapely
+from manifest import BuildManifest
+from geoparquet import write_geoparquet, COMPRESSION_LEVEL
+from instrument import RunReport, span, file_written, vertices
+import settings
 
-# Configuration
-COG_YEAR = "2025"
+# Configuration (millésime, projections et chemins : voir settings.py)
+COG_YEAR = settings.COG_YEAR
+DATA_DIR = settings.PATHS["processed_data"]
+PARQUET_COMPRESSION_LEVEL = COMPRESSION_LEVEL  # Niveau zstd des fichiers produits
+REPROJECTION_CACHE_DIR = DATA_DIR / "cache" / "reprojected"  # Territoires reprojetés (clé : empreinte et EPSG)
 
 # Projections
-CRS_CONFIG = {
-    "FRA": 2154,  # France métropolitaine
-    "GLP": 5490,  # Guadeloupe
-    "MTQ": 5490,  # Martinique
-    "GUF": 2972,  # Guyane française
-    "REU": 2975,  # Réunion
-    "MYT": 4471,  # Mayotte
-}
+CRS_CONFIG = settings.CRS_CONFIG
 
 # Projections cibles
 TARGET_PROJ_NATURAL = 3395  # Projection Mercator (position naturelle)
 TARGET_PROJ_COMPACT = 2154  # Projection Lambert 93 (position compacte)
 
+DROM_TERRITORIES = ['GLP', 'MTQ', 'GUF', 'REU', 'MYT']
+
 # Configuration du positionnement pour le style compact
 SIDE_MAX_BOX = [100000, 100000, 100000, 100000, 100000]  # Taille maximale pour chaque DROM
 SPACE_BETWEEN_BOX = 40000  # Espace entre les boîtes
@@ -34,7 +40,22 @@ COORD_DEST = [
     [120000 + (SIDE_MAX_BOX[0] + SPACE_BETWEEN_BOX), 6500000 - 3 * (SIDE_MAX_BOX[0] + SPACE_BETWEEN_BOX)]
 ]
 
-def main(input_dir=None, output_dir=None, is_generalized=False):
+# Dispositions des DROM produites à partir d'un même chargement : taille maximale et centre
+# de destination de chaque DROM (Lambert 93). Le style "compact" est celui utilisé par
+# 06-generate-ngeo.py ; d'autres variantes peuvent être lues d'un fichier JSON (--layouts).
+# Chaque variante est écrite sous com-frdrom-<nom>-<année> et traitée par 06 dans public/frdrom-<nom>.
+LAYOUTS = {
+    "compact": {
+        terr: {"side_max_box": SIDE_MAX_BOX[i], "coord_dest": COORD_DEST[i]}
+        for i, terr in enumerate(DROM_TERRITORIES)
+    },
+}
+
+def build_manifest():
+    """Manifeste de construction de l'assemblage."""
+    return BuildManifest("05-merge-frdrom", code=[__file__, Path(__file__).with_name("geoparquet.py")])
+
+def main(input_dir=None, output_dir=None, is_generalized=False, layouts=None, manifest=None):
     """
     Fonction principale qui charge, transforme et exporte les données géographiques.
     
@@ -42,14 +63,15 @@ def main(input_dir=None, output_dir=None, is_generalized=False):
         input_dir (str/Path): Répertoire contenant les fichiers d'entrée
         output_dir (str/Path): Répertoire où seront stockés les fichiers de sortie
         is_generalized (bool): Indique si on traite les fichiers généralisés
+        layouts (dict): Dispositions des DROM à produire (LAYOUTS par défaut)
+        manifest (BuildManifest): Manifeste à compléter, enregistré par l'appelant (sinon chargé et enregistré ici)
     """
-    # Définition des chemins relatifs
-    base_dir = Path(__file__).parent.parent  # Racine du projet (ngeofr-maps)
-    default_data_dir = base_dir / "src" / "processed_data"
+    layouts = LAYOUTS if layouts is None else layouts
+    check_layouts(layouts)
     
     # Gestion des chemins d'entrée/sortie
-    input_dir = Path(input_dir) if input_dir else default_data_dir
-    output_dir = Path(output_dir) if output_dir else default_data_dir
+    input_dir = Path(input_dir) if input_dir else DATA_DIR
+    output_dir = Path(output_dir) if output_dir else DATA_DIR
     
     # Création des répertoires de sortie
     if is_generalized:
@@ -63,14 +85,34 @@ def main(input_dir=None, output_dir=None, is_generalized=False):
     # Suffixe pour les fichiers généralisés
     gen_suffix = "-gen" if is_generalized else ""
     
-    # Vérification si les fichiers de sortie existent déjà
-    natural_output = get_output_filename("natural", output_dir, gen_suffix)
-    compact_output = get_output_filename("compact", output_dir, gen_suffix)
+    # Sorties reconstruites seulement si les territoires, la configuration ou le code ont changé
+    save = manifest is None
+    manifest = manifest or build_manifest()
+    inputs = territory_paths(input_dir, gen_suffix)
+    outputs = {
+        "natural": (get_output_filename("natural", output_dir, gen_suffix), None, {
+            "projection": TARGET_PROJ_NATURAL,
+            "compression_level": PARQUET_COMPRESSION_LEVEL,
+        }),
+    }
+    for style, layout in layouts.items():
+        outputs[style] = (get_output_filename(style, output_dir, gen_suffix), layout, {
+            "projection": TARGET_PROJ_COMPACT,
+            "layout": layout,
+            "compression_level": PARQUET_COMPRESSION_LEVEL,
+        })
+    # Fichiers suivis par style (les dispositions exportent aussi leurs transformations)
+    tracked = {
+        style: [output[0]] + ([get_transforms_filename(output_dir, gen_suffix, style)] if style != "natural" else [])
+        for style, output in outputs.items()
+    }
+    pending = {
+        style: output for style, output in outputs.items()
+        if not manifest.is_up_to_date(tracked[style], inputs=inputs, params=output[2])
+    }
     
-    both_exist = natural_output.exists() and compact_output.exists()
-    
-    if both_exist:
-        print(f"Les fichiers existent déjà dans {output_dir}. Traitement ignoré.")
+    if not pending:
+        print(f"Les fichiers sont à jour dans {output_dir}. Traitement ignoré.")
         return
     
     print(f"Chargement des territoires{' généralisés' if is_generalized else ''}...")
@@ -80,31 +122,55 @@ def main(input_dir=None, output_dir=None, is_generalized=False):
         print("Erreur : Aucun territoire chargé. Vérifiez le répertoire d'entrée.")
         return
     
-    if not natural_output.exists():
-        print("Traitement en position naturelle...")
-        fr_drom_natural = transform_natural(geometries)
-        export_geometries(fr_drom_natural, COG_YEAR, "natural", output_dir, gen_suffix)
-    else:
-        print(f"Le fichier {natural_output.name} existe déjà. Traitement ignoré.")
+    for style, (output_path, layout, params) in outputs.items():
+        if style not in pending:
+            print(f"Le fichier {output_path.name} est à jour. Traitement ignoré.")
+            continue
+        with span("style", style=style, gen=is_generalized) as record:
+            if style == "natural":
+                print("Traitement en position naturelle...")
+                transformed = transform_natural(geometries, input_dir, gen_suffix, manifest)
+            else:
+                print(f"Traitement en position {style}...")
+                transformed = transform_compact(geometries, layout)
+                export_transforms(transformed.attrs["transforms"], output_dir, gen_suffix, style)
+            record.update(rows_out=len(transformed), vertices_out=vertices(transformed.geometry.values))
+            export_geometries(transformed, COG_YEAR, style, output_dir, gen_suffix)
+        manifest.record(tracked[style], inputs=inputs, params=params)
     
-    if not compact_output.exists():
-        print("Traitement en position compacte...")
-        fr_drom_compact = transform_compact(geometries)
-        export_geometries(fr_drom_compact, COG_YEAR, "compact", output_dir, gen_suffix)
-    else:
-        print(f"Le fichier {compact_output.name} existe déjà. Traitement ignoré.")
+    if save:
+        manifest.save()
+
+def check_layouts(layouts):
+    """
+    Vérifie les noms des dispositions : ils forment le style des fichiers
+    produits et le répertoire de leurs mailles dans public/.
+    """
+    for style in layouts:
+        if style == "natural" or not re.fullmatch(r"[a-z][a-z0-9_]*", style):
+            raise ValueError(f"Nom de disposition invalide : {style!r} (minuscules, chiffres et _, autre que 'natural')")
 
 def get_output_filename(style, output_dir, gen_suffix=""):
     """
     Génère le nom du fichier de sortie en fonction du style et du suffixe.
     """
-    if style == "compact":
-        filename = f"com-frdrom-compact-{COG_YEAR}{gen_suffix}.parquet"
-    else:
+    if style == "natural":
         filename = f"com-frdrom-{COG_YEAR}{gen_suffix}.parquet"
+    else:
+        filename = f"com-frdrom-{style}-{COG_YEAR}{gen_suffix}.parquet"
     
     return Path(output_dir) / filename
 
+def territory_paths(input_dir, gen_suffix=""):
+    """
+    Fichiers d'entrée existants des territoires.
+    """
+    paths = [
+        Path(input_dir) / f"com-{territory.lower()}-{COG_YEAR}{gen_suffix}.parquet"
+        for territory in CRS_CONFIG.keys()
+    ]
+    return [path for path in paths if path.exists()]
+
 def load_territories(input_dir, gen_suffix=""):
     """
     Charge les fichiers géographiques pour chaque territoire spécifié.
@@ -118,58 +184,83 @@ def load_territories(input_dir, gen_suffix=""):
             print(f"Avertissement : Fichier introuvable pour {territory} ({filename})")
             continue
         
-        gdf = gpd.read_file(file_path)
+        with span("load", territory=territory) as record:
+            gdf = gpd.read_file(file_path)
+            record["rows_out"] = len(gdf)
         geometries[territory] = gdf
         print(f"  Chargé: {filename}")
     
     return geometries
 
-def transform_natural(geometries):
+def reproject(gdf, source_path, epsg, manifest):
     """
-    Transforme les géométries en projection Mercator (position naturelle).
+    Reprojette un territoire, en réutilisant le résultat mis en cache pour
+    le même fichier source (empreinte SHA-256) et la même projection.
     """
-    fra_gdf = geometries['FRA']
-    drom_territories = ['GLP', 'MTQ', 'GUF', 'REU', 'MYT']
+    source_hash = manifest.file_hash(source_path)[:16]
+    cache_path = REPROJECTION_CACHE_DIR / f"{Path(source_path).stem}-{epsg}-{source_hash}.parquet"
+    if cache_path.exists():
+        print(f"  Reprojection en cache : {cache_path.name}")
+        return gpd.read_parquet(cache_path)
     
-    fra_3395 = fra_gdf.to_crs(epsg=TARGET_PROJ_NATURAL)
-    
-    drom_3395 = []
-    for terr in drom_territories:
-        if terr in geometries:
-            drom_3395.append(geometries[terr].to_crs(epsg=TARGET_PROJ_NATURAL))
+    reprojected = gdf.to_crs(epsg=epsg)
+    REPROJECTION_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Une seule version en cache par fichier source et projection
+    for stale in REPROJECTION_CACHE_DIR.glob(f"{Path(source_path).stem}-{epsg}-*.parquet"):
+        stale.unlink()
+    write_geoparquet(reprojected, cache_path, compression_level=1, sort=False)
+    return reprojected
+
+def transform_natural(geometries, input_dir, gen_suffix="", manifest=None):
+    """
+    Transforme les géométries en projection Mercator (position naturelle).
+    """
+    reprojected = []
+    for terr in ['FRA'] + DROM_TERRITORIES:
+        if terr not in geometries:
+            continue
+        if manifest is None:
+            reprojected.append(geometries[terr].to_crs(epsg=TARGET_PROJ_NATURAL))
+        else:
+            source_path = Path(input_dir) / f"com-{terr.lower()}-{COG_YEAR}{gen_suffix}.parquet"
+            reprojected.append(reproject(geometries[terr], source_path, TARGET_PROJ_NATURAL, manifest))
     
     fr_drom_natural = gpd.GeoDataFrame(
-        pd.concat([fra_3395] + drom_3395, ignore_index=True),
+        pd.concat(reprojected, ignore_index=True),
         crs=f"EPSG:{TARGET_PROJ_NATURAL}"
     )
     
     return fr_drom_natural
 
-def transform_compact(geometries):
+def transform_compact(geometries, layout=LAYOUTS["compact"]):
     """
     Réorganise les DROM dans une position compacte près de la France métropolitaine.
     """
     fra_gdf = geometries['FRA'].set_crs(epsg=TARGET_PROJ_COMPACT, allow_override=True)
     
-    drom_territories = ['GLP', 'MTQ', 'GUF', 'REU', 'MYT']
-    droms = [geometries[t].set_crs(epsg=TARGET_PROJ_COMPACT, allow_override=True) 
-             for t in drom_territories if t in geometries]
-    
     droms_transformed = []
-    for i, gdf in enumerate(droms):
+    transforms = {"FRA": {"scale": 1.0, "translation": [0.0, 0.0]}}
+    for terr in DROM_TERRITORIES:
+        if terr not in geometries or terr not in layout:
+            continue
+        gdf = geometries[terr].set_crs(epsg=TARGET_PROJ_COMPACT, allow_override=True)
         scale, translation = calculate_transformation_parameters(
             gdf, 
-            SIDE_MAX_BOX[i], 
-            COORD_DEST[i]
+            layout[terr]["side_max_box"], 
+            layout[terr]["coord_dest"]
         )
         
         transformed = transform_geometry(gdf, scale, translation)
         droms_transformed.append(transformed)
+        transforms[terr] = {"scale": float(scale), "translation": [float(v) for v in translation]}
     
-    return gpd.GeoDataFrame(
+    compact = gpd.GeoDataFrame(
         pd.concat([fra_gdf] + droms_transformed, ignore_index=True),
         crs=f"EPSG:{TARGET_PROJ_COMPACT}"
     ).reset_index(drop=True)
+    # Transformations appliquées à chaque territoire (réutilisées par 06-generate-ngeo.py)
+    compact.attrs["transforms"] = transforms
+    return compact
 
 def calculate_transformation_parameters(gdf, target_size, target_center):
     """
@@ -187,45 +278,61 @@ def calculate_transformation_parameters(gdf, target_size, target_center):
 
 def transform_geometry(gdf, scale_factor, translation):
     """
-    Applique une transformation géométrique (mise à l'échelle + translation).
+    Applique une transformation géométrique (mise à l'échelle + translation)
+    en un seul passage sur le tableau des coordonnées.
     """
     transformed = gdf.copy()
-    transformed.geometry = transformed.geometry.scale(
-        xfact=scale_factor,
-        yfact=scale_factor,
-        origin=(0, 0)
-    ).translate(
-        xoff=translation[0],
-        yoff=translation[1]
+    offset = np.asarray(translation, dtype=float)
+    transformed.geometry = shapely.transform(
+        gdf.geometry.values,
+        lambda coords: coords * scale_factor + offset
     )
     return transformed
 
+def get_transforms_filename(output_dir, gen_suffix="", style="compact"):
+    """
+    Fichier des transformations (échelle, translation) de chaque territoire d'une disposition.
+    """
+    return Path(output_dir) / f"com-frdrom-{style}-{COG_YEAR}{gen_suffix}-transforms.json"
+
+def export_transforms(transforms, output_dir, gen_suffix="", style="compact"):
+    """
+    Exporte les transformations d'une disposition : les points d'étiquette
+    des territoires peuvent ainsi être repris par 06-generate-ngeo.py.
+    """
+    output_path = get_transforms_filename(output_dir, gen_suffix, style)
+    output_path.write_text(json.dumps(transforms, indent=2))
+    file_written(output_path)
+    print(f"Exporté : {output_path.name}")
+
 def export_geometries(gdf, proj_year, style, output_dir, gen_suffix=""):
     """
     Exporte les géométries transformées.
     """
-    if style == "compact":
-        filename = f"com-frdrom-compact-{proj_year}{gen_suffix}.parquet"
-    else:
+    if style == "natural":
         filename = f"com-frdrom-{proj_year}{gen_suffix}.parquet"
+    else:
+        filename = f"com-frdrom-{style}-{proj_year}{gen_suffix}.parquet"
     
     output_path = Path(output_dir) / filename
     
-    gdf.reset_index(drop=True).to_parquet(
-        output_path,
-        compression='gzip',
-        index=False,
-        schema_version="1.0.0"
-    )
+    write_geoparquet(gdf, output_path, compression_level=PARQUET_COMPRESSION_LEVEL)
     
     file_size = output_path.stat().st_size / (1024 * 1024)
     print(f"Exporté : {filename} ({file_size:.2f} MB)")
 
 if __name__ == "__main__":
-    # Traitement des fichiers standards
-    print("\n=== TRAITEMENT DES FICHIERS STANDARDS ===")
-    main(is_generalized=False)
+    parser = argparse.ArgumentParser(description="Assemblage de la France et des DROM en position naturelle et compacte")
+    parser.add_argument("--layouts", help="Fichier JSON des dispositions à produire, {nom: {territoire: {side_max_box, coord_dest}}}")
+    parser.add_argument("--output-dir", help="Répertoire de sortie (src/processed_data par défaut)")
+    args = parser.parse_args()
+    layouts = json.loads(Path(args.layouts).read_text()) if args.layouts else LAYOUTS
     
-    # Traitement des fichiers généralisés
-    print("\n=== TRAITEMENT DES FICHIERS GÉNÉRALISÉS ===")
-    main(is_generalized=True)
\ No newline at end of file
+    with RunReport("05-merge-frdrom"):
+        # Traitement des fichiers standards
+        print("\n=== TRAITEMENT DES FICHIERS STANDARDS ===")
+        main(output_dir=args.output_dir, is_generalized=False, layouts=layouts)
+        
+        # Traitement des fichiers généralisés
+        print("\n=== TRAITEMENT DES FICHIERS GÉNÉRALISÉS ===")
+        main(output_dir=args.output_dir, is_generalized=True, layouts=layouts)
\ No newline at end of file
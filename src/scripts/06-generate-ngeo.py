@@ -1,51 +1,122 @@
 import geopandas as gpd
 import pandas as pd
+import pyarrow.parquet as pq
+import shapely
 from pathlib import Path
-import duckdb
 from shapely.ops import unary_union
 import os
+import re
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+import hashlib
+from topology import build_topology, assemble_mesh, shared_borders, stitch_borders
+from membership import load_membership, project_membership, save_snapshot, load_snapshot, snapshot_path
+from millesime import changed_communes, affected_units, patch_layer, patch_borders, change_table
+from lod import export_pyramid, LOD_LEVELS
+from manifest import BuildManifest
+from geoparquet import write_geoparquet, GeoParquetWriter, COMPRESSION_LEVEL, COVERING_COLUMN
+from duckdb_engine import connect, layer_crs, build_units, export_layer, fetch_units, LABEL_SQL, BOUNDARY_SQL
+from labels import LabelCache, cache_path, cached_label_points, affine_labels
+from instrument import RunReport, span, add, vertices, file_written
+from settings import COG_YEAR, PATHS
+import json
 
-# Configuration
+# Configuration (paths and millésime: see settings.py)
 INPUT_DIRS = [
-    "O:/Document/carto-engine/ngeofr-maps/src/processed_data/standard",
-    "O:/Document/carto-engine/ngeofr-maps/src/processed_data/gen"
+    str(PATHS["processed_data"] / "standard"),
+    str(PATHS["processed_data"] / "gen"),
 ]
-DB_PATH = "O:/Document/carto-engine/ngeofr/public/ngeo2025.duckdb"
-OUTPUT_DIR = "./public/"
-COG_YEAR = "2025"
-
-# Get all parquet files from both directories
-GEOMETRIES_PATHS = []
-for input_dir in INPUT_DIRS:
-    for file in os.listdir(input_dir):
-        if file.endswith(".parquet"):
-            is_gen = "gen" in input_dir  # True if from gen folder
-            GEOMETRIES_PATHS.append((input_dir, file, is_gen))
+DB_PATH = str(PATHS["membership_db"])
+EPCI_EPT_QUERY_PATH = str(PATHS["epci_ept_query"])
+MEMBERSHIP_CACHE_DIR = str(PATHS["processed_data"] / "cache")
+MILLESIME_DIR = str(PATHS["processed_data"] / "millesimes")  # Membership table of each millésime built
+OUTPUT_DIR = str(PATHS["public"])
+LAYOUT_PATTERN = re.compile(r"^[a-z]+-frdrom-(?P<style>[a-z][a-z0-9_]*)-\d{4}")  # Layouts of 05-merge-frdrom.py, each in its own public/frdrom-<layout>
+MESH_ENGINE = "topology"  # "topology" (shared arcs), "dissolve" (GeoPandas union per group) or "duckdb" (DuckDB spatial, see duckdb_engine.py)
+DUCKDB_THREADS = None  # Threads of the "duckdb" engine per worker process (None: DuckDB default, one per core)
+WORKERS = 1  # Worker processes for the (file x mesh) tasks, overridden by --workers
+LOD_PYRAMID = True  # Also export a level-of-detail pyramid of generalized surfaces (see lod.py)
+EXPORT_BORDERS = True  # Also export deduplicated borders with left/right units (see topology.shared_borders)
+PARQUET_COMPRESSION_LEVEL = COMPRESSION_LEVEL  # zstd level of the outputs (see geoparquet.py)
+LABEL_METHOD = "centroid"  # Points of the centroid layers: "centroid", "representative" or "polylabel" (see labels.py)
+LABEL_TOLERANCE = None  # polylabel tolerance in layer units (None: 1/1000 of each unit extent)
+LABEL_CACHE = True  # Cache label points by geometry hash in src/processed_data/cache/labels
+UPDATE_FROM = None  # Previous millésime whose layers are patched instead of rebuilt (--update-from), None: full build
+PARTITIONED = False  # Process large standard layers per partition, memory bounded by the largest one (--partitioned)
+PARTITION_MIN_COMMUNES = 5000  # Commune files with fewer rows are processed whole
+# Membership column partitioning the communes for each mesh (the coarsest one of a chain is used,
+# from PARTITION_LEVELS); partitions spanned by a unit are merged, so no unit is split
+PARTITION_LEVELS = ["dep_insee", "reg_insee"]
+PARTITION_COLUMNS = {
+    "com": "dep_insee",
+    "arr": "dep_insee",
+    "dep": "dep_insee",
+    "reg": "reg_insee",
+    "epci": "reg_insee",
+    "ept": "reg_insee",
+    "epciept": "reg_insee",
+}
 
+# Build manifest: outputs are rebuilt only when their inputs, parameters or code changed
+MANIFEST_STAGE = "06-generate-ngeo"
+MANIFEST_CODE = [
+    Path(__file__),
+    *(Path(__file__).with_name(name) for name in ["topology.py", "membership.py", "lod.py", "generalize.py", "geoparquet.py", "labels.py", "millesime.py", "duckdb_engine.py"]),
+]
+
+def list_geometries_paths(input_dirs=INPUT_DIRS):
+    """Get all parquet files from the input directories as (input_dir, filename, is_gen)"""
+    geometries_paths = []
+    for input_dir in input_dirs:
+        for file in os.listdir(input_dir):
+            if file.endswith(".parquet"):
+                is_gen = Path(input_dir).name == "gen"  # True if from gen folder
+                geometries_paths.append((input_dir, file, is_gen))
+    return geometries_paths
+
+# Membership columns (id, name) of each mesh in the cached ngeofr table
 MESHES = [
-    {"id_col": "dep_insee", "name_col": "dep_nom", "mesh_type": "dep", "query": "SELECT com_insee, dep_insee, dep_nom FROM ngeofr"},
-    {"id_col": "reg_insee", "name_col": "reg_nom", "mesh_type": "reg", "query": "SELECT com_insee, reg_insee, reg_nom FROM ngeofr"},
-    {"id_col": "arr_insee", "name_col": "arr_nom", "mesh_type": "arr", "query": "SELECT com_insee, arr_insee, arr_nom FROM ngeofr"},
-    {"id_col": "epci_siren", "name_col": "epci_nom", "mesh_type": "epci", "query": "SELECT com_insee, epci_siren, epci_nom FROM ngeofr"},
-    {"id_col": "ept_siren", "name_col": "ept_nom", "mesh_type": "ept", "query": "SELECT com_insee, ept_siren, ept_nom FROM ngeofr"},
-    {"id_col": "com_insee", "name_col": "com_nom", "mesh_type": "com", "query": "SELECT com_insee, com_nom FROM ngeofr"}
+    {"id_col": "com_insee", "name_col": "com_nom", "mesh_type": "com", "columns": ("com_insee", "com_nom")},
+    {"id_col": "arr_insee", "name_col": "arr_nom", "mesh_type": "arr", "columns": ("arr_insee", "arr_nom")},
+    {"id_col": "dep_insee", "name_col": "dep_nom", "mesh_type": "dep", "columns": ("dep_insee", "dep_nom")},
+    {"id_col": "reg_insee", "name_col": "reg_nom", "mesh_type": "reg", "columns": ("reg_insee", "reg_nom")},
+    {"id_col": "epci_siren", "name_col": "epci_nom", "mesh_type": "epci", "columns": ("epci_siren", "epci_nom")},
+    {"id_col": "ept_siren", "name_col": "ept_nom", "mesh_type": "ept", "columns": ("ept_siren", "ept_nom")},
+    {"id_col": "epci_siren", "name_col": "epci_nom", "mesh_type": "epciept", "columns": ("epciept_siren", "epciept_nom")}
 ]
 
-def load_data_from_duckdb(db_path, query):
-    conn = duckdb.connect(db_path)
-    df = conn.execute(query).df()
-    conn.close()
-    return df
+# Finer meshes each mesh can be dissolved from, tried in order (communes otherwise).
+# Meshes must be processed after their sources: MESHES is ordered accordingly.
+# Only used by the "dissolve" engine (--engine dissolve): the topology engine assembles
+# every mesh from the commune arcs, polygonizing only the arcs between different units,
+# and the duckdb engine unions the communes of each unit.
+MESH_HIERARCHY = {
+    "arr": [],
+    "dep": ["arr"],
+    "reg": ["dep"],
+    "epci": [],
+    "ept": [],
+    "epciept": ["ept", "epci"],
+}
 
 def extract_territory_prefix(geom_file):
     """Extract territory prefix from filename"""
     return geom_file.split('-')[1]
 
+def extract_layout_style(geom_file):
+    """Layout of a commune file: the layout name of 05-merge-frdrom.py (com-frdrom-<layout>-<year>), "natural" otherwise"""
+    match = LAYOUT_PATTERN.match(Path(geom_file).name)
+    return match["style"] if match else "natural"
+
+def style_suffix(style):
+    """Directory and file name suffix of a layout ("" for the natural position)"""
+    return "" if style == "natural" else f"-{style}"
+
 def create_output_directory(prefix, style):
     """Create output directory"""
-    directory = f"{prefix}"
-    if style == "compact":
-        directory += "-compact"
+    directory = f"{prefix}{style_suffix(style)}"
     output_path = Path(OUTPUT_DIR) / directory
     output_path.mkdir(parents=True, exist_ok=True)
     return output_path
@@ -60,39 +131,127 @@ def is_valid_geometry(gdf):
         return False
     return True
 
-def process_mesh(geometries_df, data_df, id_col, name_col, output_dir, year, style, mesh_type, territory, is_gen):
-    print(f"\nProcessing {mesh_type} mesh ({'generalized' if is_gen else 'standard'}):")
+def dissolve_with_topology(topology, merged_gdf, id_col, name_col):
+    """Assemble mesh units from the commune topology instead of a polygon union"""
+    units_by_com = merged_gdf.drop_duplicates('com_insee').set_index('com_insee')[id_col]
+    units = assemble_mesh(topology, units_by_com.reindex(topology.ids))
+    if units.attrs["dissolved"]:
+        print(f"{len(units.attrs['dissolved'])} unit(s) with non-coincident borders dissolved with GeoPandas")
+    names = merged_gdf.groupby(id_col)[name_col].first()
+    units = units.rename(columns={"unit": id_col})
+    units[name_col] = units[id_col].map(names)
+    return units[[id_col, name_col, 'geometry']]
 
-    # Skip specific mesh types for certain territories
-    if mesh_type in ["epciept", "ept", "epci"] and territory not in ['fra', 'frdrom']:
-        print(f"Skipping {mesh_type} mesh for territory {territory} (not applicable)")
-        return
+def nested_units(membership, id_col, source_col):
+    """
+    Return the units of id_col that are exact unions of source_col units.
 
-    # Check for empty or invalid data
-    if not is_valid_geometry(geometries_df) or data_df.empty:
-        print(f"Empty or invalid data for {mesh_type}-{territory}, skipping")
-        return
+    A source unit is nested when all its communes belong to the same unit
+    (communes without a unit counting as another unit); a unit can be
+    rebuilt from its sources when all its communes belong to a nested
+    source unit.
+    """
+    targets_per_source = membership.groupby(source_col)[id_col].nunique(dropna=False)
+    nested_sources = targets_per_source.index[targets_per_source == 1]
+    membership = membership.dropna(subset=[id_col])
+    is_nested = membership[source_col].isin(nested_sources)
+    all_nested = is_nested.groupby(membership[id_col]).all()
+    return set(all_nested.index[all_nested])
 
-    # Generate filenames with -gen suffix if needed
+def cascade_dissolve(merged_gdf, id_col, name_col, sources, mesh_type):
+    """
+    Dissolve a mesh from the dissolved surfaces of finer meshes.
+
+    Parameters:
+    - merged_gdf: Communes with their id_col/name_col unit
+    - sources: List of (source mesh type, source surface, source membership)
+      where the membership maps com_insee to the source unit ('source_id')
+
+    Units that are not an exact union of source units are dissolved from
+    communes.
+    """
+    remaining = set(merged_gdf[id_col].dropna())
+    pieces = []
+    for source_type, source_gdf, source_data in sources:
+        membership = merged_gdf[['com_insee', id_col]].merge(source_data, on='com_insee', how='left')
+        nested = nested_units(membership, id_col, 'source_id') & remaining
+        pairs = membership.loc[membership[id_col].isin(nested), ['source_id', id_col]].drop_duplicates()
+        parts = source_gdf.merge(pairs, on='source_id', how='inner')
+        nested &= set(parts[id_col])
+        if not nested:
+            continue
+        print(f"{len(nested)} {mesh_type} units dissolved from {source_type}")
+        pieces.append(parts[parts[id_col].isin(nested)][[id_col, 'geometry']])
+        remaining -= nested
+
+    if remaining:
+        if sources:
+            print(f"{len(remaining)} {mesh_type} units not nested in {', '.join(s[0] for s in sources)}, dissolving from communes")
+        pieces.append(merged_gdf[merged_gdf[id_col].isin(remaining)][[id_col, 'geometry']])
+
+    dissolved = gpd.GeoDataFrame(pd.concat(pieces, ignore_index=True), crs=merged_gdf.crs)
+    dissolved = dissolved.dissolve(by=id_col).reset_index()
+    names = merged_gdf.groupby(id_col)[name_col].first()
+    dissolved[name_col] = dissolved[id_col].map(names)
+    return dissolved[[id_col, name_col, 'geometry']]
+
+def membership_digest(data_df):
+    """Content hash of the membership rows used by a mesh"""
+    values = pd.util.hash_pandas_object(data_df, index=False).values
+    return hashlib.sha256(values.tobytes()).hexdigest()[:16]
+
+def mesh_applicable(mesh_type, territory):
+    """EPCI and EPT meshes only exist for France"""
+    return mesh_type not in ["epciept", "ept", "epci"] or territory in ['fra', 'frdrom']
+
+def mesh_outputs(output_dir, year, style, mesh_type, territory, is_gen):
+    """
+    Output file names of a mesh (surface, centroid, boundary and border
+    layers), all its output paths including the LOD index, and whether the
+    LOD pyramid is exported
+    """
     gen_suffix = "-gen" if is_gen else ""
-    style_prefix = "-compact" if style == "compact" else ""
-    
+    style_prefix = style_suffix(style)
+
     filenames = [
         f"{mesh_type}-{territory}{style_prefix}-{year}-surface{gen_suffix}.parquet",
         f"{mesh_type}-{territory}{style_prefix}-{year}-centroid{gen_suffix}.parquet",
         f"{mesh_type}-{territory}{style_prefix}-{year}-boundary{gen_suffix}.parquet"
     ]
+    if EXPORT_BORDERS:
+        filenames.append(f"{mesh_type}-{territory}{style_prefix}-{year}-border{gen_suffix}.parquet")
 
-    # Check if files already exist
-    if all((Path(output_dir) / f).exists() for f in filenames):
-        print(f"Files for {mesh_type}-{territory} exist, skipping")
-        return
+    outputs = [Path(output_dir) / f for f in filenames]
+    export_lod = LOD_PYRAMID and is_gen
+    if export_lod:
+        outputs.append(Path(output_dir) / "lod" / f"{mesh_type}-{territory}{style_prefix}-{year}-lod{gen_suffix}.json")
+    return filenames, outputs, export_lod
 
-    # Process data
+def mesh_params(data_df, id_col, name_col, export_lod, partition_col=None):
+    """Parameters of the outputs of a mesh, as recorded in the build manifest"""
+    params = {
+        "membership": membership_digest(data_df),
+        "id_col": id_col,
+        "name_col": name_col,
+        "engine": MESH_ENGINE,
+        "lod_levels": LOD_LEVELS if export_lod else None,
+        "compression_level": PARQUET_COMPRESSION_LEVEL,
+        "labels": [LABEL_METHOD, LABEL_TOLERANCE],
+    }
+    if partition_col is not None:
+        params["partition"] = partition_col
+    return params
+
+def mesh_units(geometries_df, data_df, id_col, name_col, mesh_type, territory, topology=None, sources=None):
+    """
+    Units of a mesh (id_col, name_col, geometry) from the communes, None when
+    geometries are invalid. Assembled from the topology when given, else
+    dissolved from the sources (finer meshes, see MESH_HIERARCHY) or the communes.
+    """
     if mesh_type == "com":
-        merged_gdf = geometries_df.copy()
+        merged_gdf = geometries_df
         if id_col not in merged_gdf.columns:
-            merged_gdf[id_col] = merged_gdf.index
+            merged_gdf = merged_gdf.assign(**{id_col: merged_gdf.index})
         if name_col not in merged_gdf.columns:
             merged_gdf = merged_gdf.merge(data_df, on=id_col, how='left')
     else:
@@ -100,17 +259,59 @@ def process_mesh(geometries_df, data_df, id_col, name_col, output_dir, year, sty
     
     if not is_valid_geometry(merged_gdf):
         print(f"Invalid geometries after merge for {mesh_type}-{territory}, skipping")
-        return
+        return None
 
     if mesh_type != "com":
-        merged_gdf = merged_gdf.dissolve(by=id_col, aggfunc='first').reset_index()
+        if topology is not None:
+            merged_gdf = dissolve_with_topology(topology, merged_gdf, id_col, name_col)
+        elif sources:
+            merged_gdf = cascade_dissolve(merged_gdf, id_col, name_col, sources, mesh_type)
+        else:
+            merged_gdf = merged_gdf.dissolve(by=id_col, aggfunc='first').reset_index()
         if not is_valid_geometry(merged_gdf):
             print(f"Invalid geometries after dissolve for {mesh_type}-{territory}, skipping")
-            return
-    
-    # Prepare output data
+            return None
+
     cols_to_keep = [col for col in [id_col, name_col, 'geometry'] if col in merged_gdf.columns]
-    dissolved_gdf = merged_gdf[cols_to_keep]
+    return merged_gdf[cols_to_keep]
+
+def with_geometry(gdf, geometry):
+    """The attributes of gdf with another geometry (centroid, boundary), without copying the whole frame"""
+    return gpd.GeoDataFrame(gdf.drop(columns=gdf.geometry.name), geometry=geometry, crs=gdf.crs)
+
+def process_mesh(geometries_df, data_df, id_col, name_col, output_dir, year, style, mesh_type, territory, is_gen, topology=None, sources=None, manifest=None, geom_path=None):
+    print(f"\nProcessing {mesh_type} mesh ({'generalized' if is_gen else 'standard'}):")
+
+    # Skip specific mesh types for certain territories
+    if not mesh_applicable(mesh_type, territory):
+        print(f"Skipping {mesh_type} mesh for territory {territory} (not applicable)")
+        return
+
+    # Check for empty or invalid data
+    if not is_valid_geometry(geometries_df) or data_df.empty:
+        print(f"Empty or invalid data for {mesh_type}-{territory}, skipping")
+        return
+
+    # Generate filenames with -gen suffix if needed
+    gen_suffix = "-gen" if is_gen else ""
+    style_prefix = style_suffix(style)
+    filenames, outputs, export_lod = mesh_outputs(output_dir, year, style, mesh_type, territory, is_gen)
+
+    # Check if files are up to date with the geometry file, membership and configuration
+    inputs = [geom_path] if geom_path else []
+    params = mesh_params(data_df, id_col, name_col, export_lod)
+    if manifest is not None and manifest.is_up_to_date(outputs, inputs=inputs, params=params):
+        print(f"Files for {mesh_type}-{territory} are up to date, skipping")
+        return
+
+    # Process data
+    dissolved_gdf = mesh_units(geometries_df, data_df, id_col, name_col, mesh_type, territory, topology=topology, sources=sources)
+    if dissolved_gdf is None:
+        return
+    add(
+        rows_in=len(geometries_df), rows_out=len(dissolved_gdf),
+        vertices_in=vertices(geometries_df.geometry.values), vertices_out=vertices(dissolved_gdf.geometry.values),
+    )
 
     # Export files
     def export(gdf, filename):
@@ -118,64 +319,791 @@ def process_mesh(geometries_df, data_df, id_col, name_col, output_dir, year, sty
             print(f"Skipping {filename} (empty or invalid geometries)")
             return
         output_path = Path(output_dir) / filename
-        gdf.to_parquet(output_path)
+        write_geoparquet(gdf, output_path, compression_level=PARQUET_COMPRESSION_LEVEL)
         print(f"Exported: {filename}")
 
     # Export surface
-    export(dissolved_gdf, filenames[0])
+    with span("kind", kind="surface"):
+        export(dissolved_gdf, filenames[0])
 
-    # Export centroid
+    # Export centroid (label points, reused from the territory layers for the layouts)
     if is_valid_geometry(dissolved_gdf):
-        point_gdf = dissolved_gdf.copy()
-        point_gdf.geometry = dissolved_gdf.geometry.centroid
-        point_gdf.loc[~point_gdf.geometry.within(dissolved_gdf.geometry), 'geometry'] = dissolved_gdf.geometry.apply(lambda geom: geom.representative_point())
-        export(point_gdf, filenames[1])
+        with span("kind", kind="centroid"):
+            reuse = compact_label_sources(layout_transforms(geometries_df, geom_path), mesh_type, year, gen_suffix) if style != "natural" else None
+            points = compute_labels(dissolved_gdf, id_col, f"{mesh_type}-{territory}{style_prefix}-{year}{gen_suffix}", reuse)
+            export(with_geometry(dissolved_gdf, points), filenames[1])
     else:
         print(f"Skipping centroid export for {mesh_type}-{territory} (invalid base geometries)")
 
     # Export boundary
     if is_valid_geometry(dissolved_gdf):
-        boundary_gdf = dissolved_gdf.copy()
-        boundary_gdf.geometry = dissolved_gdf.geometry.boundary
-        export(boundary_gdf, filenames[2])
+        with span("kind", kind="boundary"):
+            export(with_geometry(dissolved_gdf, dissolved_gdf.geometry.boundary), filenames[2])
     else:
         print(f"Skipping boundary export for {mesh_type}-{territory} (invalid base geometries)")
 
-def main():
-    # Add epciept query
-    epci_ept_query = open("O://Document/carto-engine/ngeofr/src/shared/sql/query_epci_ept.sql").read()
-    epci_ept_data = load_data_from_duckdb(DB_PATH, epci_ept_query)
-    MESHES.append({"id_col": "epci_siren", "name_col": "epci_nom", "mesh_type": "epciept", "data_df": epci_ept_data})
+    # Export shared borders, each border between two units stored once
+    if EXPORT_BORDERS and is_valid_geometry(dissolved_gdf):
+        with span("kind", kind="border"):
+            export(shared_borders(build_topology(dissolved_gdf, id_col=id_col)), filenames[3])
+
+    # Export level-of-detail pyramid for web maps
+    if export_lod and is_valid_geometry(dissolved_gdf):
+        with span("kind", kind="lod"):
+            export_pyramid(
+                dissolved_gdf, id_col, output_dir, f"{mesh_type}-{territory}{style_prefix}-{year}", gen_suffix,
+                full_files={"surface": filenames[0], "boundary": filenames[2]},
+                compression_level=PARQUET_COMPRESSION_LEVEL
+            )
+
+    if manifest is not None:
+        manifest.record(outputs, inputs=inputs, params=params)
+    return dissolved_gdf
+
+def label_cache(id_col, layer, reuse=None):
+    """
+    Label point cache of a layer (None without LABEL_CACHE), completed with
+    the points of the layers reused.
+
+    Parameters:
+    - layer: Name of the label cache file of the layer
+    - reuse: List of (surface file, centroid file, scale, translation) of
+      layers whose units are affine copies of some units of the layer
+    """
+    if not LABEL_CACHE:
+        return None
+    cache = LabelCache(cache_path(layer, LABEL_METHOD, LABEL_TOLERANCE))
+    for surface_path, centroid_path, scale, translation in reuse or []:
+        # Surfaces and points are matched by unit id (ids must be unique in both files),
+        # surfaces are read one row group at a time
+        points = gpd.read_parquet(centroid_path, columns=[id_col, 'geometry'])
+        points = points[~points[id_col].duplicated(keep=False)].set_index(id_col).geometry
+        surface_ids = pd.read_parquet(surface_path, columns=[id_col])[id_col]
+        matched = set(surface_ids[~surface_ids.duplicated(keep=False) & surface_ids.isin(points.index)])
+        for batch in pq.ParquetFile(surface_path).iter_batches(columns=[id_col, 'geometry']):
+            ids = batch.column(id_col).to_pandas()
+            keep = ids.isin(matched).to_numpy()
+            if keep.any():
+                surfaces = shapely.from_wkb(batch.column('geometry').to_numpy(zero_copy_only=False)[keep])
+                cache.add(*affine_labels(surfaces, points.loc[ids[keep]].values, scale, translation))
+    return cache
+
+def compute_labels(gdf, id_col, layer, reuse=None, shared_cache=None):
+    """
+    Label points of mesh units (LABEL_METHOD), cached by geometry hash.
+
+    Parameters:
+    - layer, reuse: Cache file and reused layers, see label_cache
+    - shared_cache: Cache of a layer processed in parts (see
+      process_chain_partitioned), whose points are staged and saved once
+    """
+    if shared_cache is not None:
+        points, computed = cached_label_points(gdf.geometry.values, LABEL_METHOD, LABEL_TOLERANCE, shared_cache, save=False)
+    else:
+        cache = label_cache(id_col, layer, reuse)
+        points, computed = cached_label_points(gdf.geometry.values, LABEL_METHOD, LABEL_TOLERANCE, cache)
+    print(f"Label points: {computed}/{len(gdf)} computed")
+    return points
+
+def layout_transforms(geometries_df, geom_path=None):
+    """
+    Affine transform of each territory of a layout: kept in the frame
+    attrs by 05-merge-frdrom.py, or read from the file written next to the
+    layout file.
+    """
+    if geometries_df is not None and "transforms" in geometries_df.attrs:
+        return geometries_df.attrs["transforms"]
+    if geom_path is None:
+        return {}
+    transforms_path = Path(geom_path).with_name(f"{Path(geom_path).stem}-transforms.json")
+    if not transforms_path.exists():
+        return {}
+    return json.loads(transforms_path.read_text())
+
+def compact_label_sources(transforms, mesh_type, year, gen_suffix):
+    """Territory layers a layout was built from, with their affine transform"""
+    sources = []
+    for territory, transform in transforms.items():
+        territory_dir = Path(OUTPUT_DIR) / territory.lower()
+        basename = f"{mesh_type}-{territory.lower()}-{year}"
+        surface_path = territory_dir / f"{basename}-surface{gen_suffix}.parquet"
+        centroid_path = territory_dir / f"{basename}-centroid{gen_suffix}.parquet"
+        if surface_path.exists() and centroid_path.exists():
+            sources.append((surface_path, centroid_path, transform["scale"], transform["translation"]))
+    return sources
+
+def mesh_chains(meshes):
+    """Group mesh types linked by MESH_HIERARCHY, keeping the MESHES order"""
+    chains = []
+    for mesh_config in meshes:
+        mesh_type = mesh_config['mesh_type']
+        linked = [chain for chain in chains if set(chain) & set(MESH_HIERARCHY.get(mesh_type, []))]
+        for chain in linked:
+            chains.remove(chain)
+        chains.append([m for chain in linked for m in chain] + [mesh_type])
+    # Restore processing order inside and across chains
+    order = [m['mesh_type'] for m in meshes]
+    chains = [sorted(chain, key=order.index) for chain in chains]
+    return sorted(chains, key=lambda chain: order.index(chain[0]))
+
+# Membership table, build manifest and run report of the current process (set by init_worker)
+_worker_membership = None
+_worker_manifest = None
+_worker_report = None
+
+def init_worker(membership, manifest=None, partitioned=None, update_from=None, engine=None):
+    """
+    Receive the membership table once per worker and load the build manifest.
+
+    Worker processes (no manifest given) also keep their own run report,
+    whose measures are sent back with each task.
+    """
+    global _worker_membership, _worker_manifest, _worker_report, PARTITIONED, UPDATE_FROM, MESH_ENGINE
+    _worker_membership = membership
+    if partitioned is not None:
+        PARTITIONED = partitioned
+    if update_from is not None:
+        UPDATE_FROM = update_from
+    if engine is not None:
+        MESH_ENGINE = engine
+    _worker_manifest = manifest or build_manifest()
+    _worker_report = None if manifest is not None else RunReport(MANIFEST_STAGE).activate()
+
+def drop_covering(geometries_df):
+    """Commune geometries without their bbox covering columns"""
+    return geometries_df[[
+        col for col in geometries_df.columns
+        if col != COVERING_COLUMN and not col.startswith("geometry_bbox")
+    ]]
+
+@lru_cache(maxsize=2)
+def load_geometries(geom_path):
+    """Load a commune geometry file without its bbox covering columns (cached per process)"""
+    return drop_covering(gpd.read_parquet(geom_path))
+
+@lru_cache(maxsize=2)
+def load_topology(geom_path):
+    """Build the shared-arc topology of a commune geometry file (cached per process)"""
+    topology = build_topology(load_geometries(geom_path), id_col="com_insee")
+    print(f"Topology built for {Path(geom_path).name}: {topology.n_arcs} arcs")
+    return topology
+
+def process_task(task):
+    """
+    Process a chain of meshes for one geometry file.
+
+    Returns the list of (filename, mesh_type, error) for failed steps, the
+    manifest records and file hashes of the outputs written and the run
+    report measures of worker processes.
+    """
+    input_dir, filename, is_gen, mesh_types = task
+    _worker_manifest.updated = {}
     
-    # Process all files
-    for input_dir, filename, is_gen in GEOMETRIES_PATHS:
-        style = "compact" if "compact" in filename else "natural"
-        territory = extract_territory_prefix(filename)
-        
-        # Create output directory
-        output_dir = create_output_directory(territory, style)
-        
+    with span("task", file=filename, meshes=",".join(mesh_types)):
+        geom_path = str(Path(input_dir) / filename)
+        if UPDATE_FROM is not None:
+            try:
+                with span("load"):
+                    geometries_df = load_geometries(geom_path)
+                errors = process_chain_update(
+                    geometries_df, filename, is_gen, mesh_types, _worker_membership, manifest=_worker_manifest, geom_path=geom_path
+                )
+            except Exception as e:
+                print(f"Error updating {filename}: {str(e)}")
+                errors = [(filename, None, f"update: {str(e)}")]
+            if errors is not None:
+                measures = _worker_report.take() if _worker_report is not None else ([], [])
+                return errors, dict(_worker_manifest.updated), dict(_worker_manifest.files), measures
+
+        if MESH_ENGINE == "duckdb":
+            errors = process_chain_duckdb(
+                geom_path, filename, is_gen, mesh_types, _worker_membership, manifest=_worker_manifest
+            )
+            measures = _worker_report.take() if _worker_report is not None else ([], [])
+            return errors, dict(_worker_manifest.updated), dict(_worker_manifest.files), measures
+
+        if is_partitioned(geom_path, is_gen):
+            errors = process_chain_partitioned(
+                geom_path, filename, is_gen, mesh_types, _worker_membership, manifest=_worker_manifest
+            )
+            measures = _worker_report.take() if _worker_report is not None else ([], [])
+            return errors, dict(_worker_manifest.updated), dict(_worker_manifest.files), measures
+
         # Load geometry file
-        geom_path = Path(input_dir) / filename
         try:
-            geometries_df = gpd.read_file(geom_path)
-            geometries_df = geometries_df[[col for col in geometries_df.columns if not col.startswith("geometry_bbox")]]
+            with span("load"):
+                geometries_df = load_geometries(geom_path)
         except Exception as e:
             print(f"Error loading {filename}: {str(e)}")
+            errors = [(filename, None, f"loading: {str(e)}")]
+        else:
+            # Build the shared-arc topology once per commune file
+            topology = None
+            if MESH_ENGINE == "topology":
+                try:
+                    with span("topology"):
+                        topology = load_topology(geom_path)
+                except Exception as e:
+                    print(f"Error building topology for {filename}, falling back to dissolve: {str(e)}")
+            
+            errors = process_chain(
+                geometries_df, filename, is_gen, mesh_types, _worker_membership,
+                topology=topology, manifest=_worker_manifest, geom_path=geom_path
+            )
+    measures = _worker_report.take() if _worker_report is not None else ([], [])
+    return errors, dict(_worker_manifest.updated), dict(_worker_manifest.files), measures
+
+def run_chain(geom_path, is_gen, mesh_types, manifest, partitioned=None, update_from=None, engine=None):
+    """
+    Process one (file, mesh chain) task of the pipeline.py scheduler with the
+    given manifest, the membership table being loaded once per process.
+    Returns the list of (filename, mesh_type, error) for failed steps.
+    """
+    global _worker_membership, _worker_manifest, PARTITIONED, UPDATE_FROM, MESH_ENGINE
+    if _worker_membership is None:
+        _worker_membership = load_membership(DB_PATH, EPCI_EPT_QUERY_PATH, MEMBERSHIP_CACHE_DIR)
+        save_snapshot(_worker_membership, MILLESIME_DIR, COG_YEAR)
+    _worker_manifest = manifest
+    if partitioned is not None:
+        PARTITIONED = partitioned
+    if update_from is not None:
+        UPDATE_FROM = update_from
+    if engine is not None:
+        MESH_ENGINE = engine
+    geom_path = Path(geom_path)
+    return process_task((str(geom_path.parent), geom_path.name, is_gen, tuple(mesh_types)))[0]
+
+def build_manifest():
+    """Build manifest of the mesh layers."""
+    return BuildManifest(MANIFEST_STAGE, code=MANIFEST_CODE)
+
+def process_chain(geometries_df, filename, is_gen, mesh_types, membership, topology=None, manifest=None, geom_path=None):
+    """
+    Process a chain of meshes for loaded commune geometries.
+
+    Meshes of a chain depend on each other through MESH_HIERARCHY and are
+    always processed together, so outputs do not depend on scheduling.
+    filename (the geometry file name, real or not) gives the territory and
+    style of the outputs. Returns the list of (filename, mesh_type, error)
+    for failed steps.
+    """
+    style = extract_layout_style(filename)
+    territory = extract_territory_prefix(filename)
+    errors = []
+    
+    # Create output directory
+    output_dir = create_output_directory(territory, style)
+    
+    # Process each mesh type, keeping surfaces to dissolve coarser meshes from
+    surfaces = {}
+    for mesh_config in MESHES:
+        if mesh_config['mesh_type'] not in mesh_types:
             continue
-        
-        # Process each mesh type
-        for mesh_config in MESHES:
-            try:
-                data_df = load_data_from_duckdb(DB_PATH, mesh_config['query']) if 'query' in mesh_config else mesh_config['data_df']
-                process_mesh(
+        try:
+            data_df = project_membership(
+                membership, mesh_config['columns'],
+                mesh_config['id_col'], mesh_config['name_col']
+            )
+            sources = [
+                (source, surfaces[source][0], surfaces[source][1])
+                for source in MESH_HIERARCHY.get(mesh_config['mesh_type'], [])
+                if surfaces.get(source) is not None
+            ]
+            with span("mesh", territory=territory, style=style, gen=is_gen, mesh=mesh_config['mesh_type']):
+                surface = process_mesh(
                     geometries_df, data_df, 
                     mesh_config['id_col'], mesh_config['name_col'], 
                     output_dir, COG_YEAR, style, 
-                    mesh_config['mesh_type'], territory, is_gen
+                    mesh_config['mesh_type'], territory, is_gen,
+                    topology=topology, sources=sources,
+                    manifest=manifest, geom_path=geom_path
                 )
+            if surface is not None and any(mesh_config['mesh_type'] in v for v in MESH_HIERARCHY.values()):
+                source_gdf = surface[[mesh_config['id_col'], 'geometry']].rename(columns={mesh_config['id_col']: 'source_id'})
+                source_data = data_df[['com_insee', mesh_config['id_col']]].rename(columns={mesh_config['id_col']: 'source_id'})
+                surfaces[mesh_config['mesh_type']] = (source_gdf, source_data)
+        except Exception as e:
+            print(f"Error processing {mesh_config['mesh_type']} for {filename}: {str(e)}")
+            errors.append((filename, mesh_config['mesh_type'], str(e)))
+    return errors
+
+def previous_outputs(output_dir, style, mesh_type, territory, is_gen):
+    """Layers of a mesh for the UPDATE_FROM millésime (surface, centroid, boundary, border), None when one is missing"""
+    filenames, _, _ = mesh_outputs(output_dir, UPDATE_FROM, style, mesh_type, territory, is_gen)
+    paths = [Path(output_dir) / filename for filename in filenames]
+    return paths if all(path.exists() for path in paths) else None
+
+@lru_cache(maxsize=1)
+def previous_membership(year):
+    """Membership table of a previous millésime (cached per process)"""
+    return load_snapshot(MILLESIME_DIR, year)
+
+def export_changes(previous_communes, geometries_df, membership, changed, output_dir, territory):
+    """Write the table of commune changes since UPDATE_FROM (see millesime.change_table)"""
+    current = geometries_df[['com_insee', 'geometry']]
+    names = membership.drop_duplicates('com_insee').set_index('com_insee')['com_nom']
+    current = current.assign(com_nom=geometries_df['com_nom'] if 'com_nom' in geometries_df.columns else current['com_insee'].map(names))
+    changes = change_table(previous_communes, current, changed)
+    path = Path(output_dir) / f"com-{territory}-{COG_YEAR}-changes.parquet"
+    changes.to_parquet(path, index=False)
+    file_written(path, rows=len(changes))
+    counts = ", ".join(f"{count} {change}" for change, count in changes['change'].value_counts(sort=False).items())
+    print(f"Exported: {path.name} ({counts or 'no change'})")
+
+def process_chain_update(geometries_df, filename, is_gen, mesh_types, membership, manifest=None, geom_path=None):
+    """
+    Update the meshes of a chain from the layers of the previous millésime
+    (UPDATE_FROM) instead of rebuilding them.
+
+    Communes added, removed or whose geometry changed since then are found
+    by code and geometry hash, against the previous commune layer; only the
+    units holding such a commune, or whose communes or name changed in the
+    membership table, are dissolved again, the rows of the other units
+    being copied from the previous layers (see millesime.py). The standard
+    territory files also get a table of the commune changes. Meshes without
+    previous layers are processed whole.
+
+    Returns the list of (filename, mesh_type, error) for failed steps, or
+    None when the previous commune layer or membership table is missing.
+    """
+    style = extract_layout_style(filename)
+    territory = extract_territory_prefix(filename)
+    gen_suffix = "-gen" if is_gen else ""
+    style_prefix = style_suffix(style)
+    output_dir = create_output_directory(territory, style)
+
+    previous = previous_membership(UPDATE_FROM)
+    previous_communes = previous_outputs(output_dir, style, "com", territory, is_gen)
+    if previous is None or previous_communes is None:
+        print(f"No {UPDATE_FROM} commune layer or membership table for {filename}, processing whole")
+        return None
+    with span("diff"):
+        previous_communes = drop_covering(gpd.read_parquet(previous_communes[0]))
+        changed = changed_communes(previous_communes, geometries_df)
+    print(f"{len(changed)} commune(s) changed in {filename} since {UPDATE_FROM}")
+
+    errors = []
+    for mesh_config in MESHES:
+        mesh_type, id_col, name_col = mesh_config['mesh_type'], mesh_config['id_col'], mesh_config['name_col']
+        if mesh_type not in mesh_types:
+            continue
+        data_df = project_membership(membership, mesh_config['columns'], id_col, name_col)
+        previous_paths = previous_outputs(output_dir, style, mesh_type, territory, is_gen)
+        if previous_paths is None:
+            # New mesh, territory or option (e.g. borders): no layer to patch
+            try:
+                with span("mesh", territory=territory, style=style, gen=is_gen, mesh=mesh_type):
+                    topology = None
+                    if MESH_ENGINE == "topology" and mesh_type != "com":
+                        topology = load_topology(geom_path) if geom_path else build_topology(geometries_df, id_col="com_insee")
+                    process_mesh(
+                        geometries_df, data_df, id_col, name_col, output_dir, COG_YEAR, style, mesh_type, territory, is_gen,
+                        topology=topology, manifest=manifest, geom_path=geom_path
+                    )
             except Exception as e:
-                print(f"Error processing {mesh_config['mesh_type']} for {filename}: {str(e)}")
+                print(f"Error processing {mesh_type} for {filename}: {str(e)}")
+                errors.append((filename, mesh_type, str(e)))
+            continue
+
+        print(f"\nUpdating {mesh_type} mesh from {UPDATE_FROM} ({'generalized' if is_gen else 'standard'}):")
+        if not mesh_applicable(mesh_type, territory):
+            print(f"Skipping {mesh_type} mesh for territory {territory} (not applicable)")
+            continue
+        if data_df.empty:
+            print(f"Empty or invalid data for {mesh_type}-{territory}, skipping")
+            continue
+        filenames, outputs, export_lod = mesh_outputs(output_dir, COG_YEAR, style, mesh_type, territory, is_gen)
+        inputs = [geom_path, *previous_paths, snapshot_path(MILLESIME_DIR, UPDATE_FROM)] if geom_path else []
+        params = {**mesh_params(data_df, id_col, name_col, export_lod), "update_from": UPDATE_FROM}
+        if manifest is not None and manifest.is_up_to_date(outputs, inputs=inputs, params=params):
+            print(f"Files for {mesh_type}-{territory} are up to date, skipping")
+            continue
+
+        try:
+            with span("mesh", territory=territory, style=style, gen=is_gen, mesh=mesh_type, update_from=UPDATE_FROM):
+                previous_layers = [drop_covering(gpd.read_parquet(path)) for path in previous_paths]
+                affected = affected_units(
+                    changed, project_membership(previous, mesh_config['columns'], id_col, name_col), data_df, id_col, name_col
+                )
+                # Units of the file only (the membership table covers every territory)
+                present = set(previous_layers[0][id_col]) | set(data_df.loc[data_df['com_insee'].isin(geometries_df['com_insee']), id_col])
+                affected &= present
+                if mesh_type == "com":
+                    affected |= changed
+                    communes = geometries_df[geometries_df['com_insee'].isin(list(affected))]
+                else:
+                    communes = geometries_df[geometries_df['com_insee'].isin(data_df.loc[data_df[id_col].isin(list(affected)), 'com_insee'])]
+
+                # Dissolve the affected units only
+                units = None
+                if not communes.empty:
+                    topology = build_topology(communes, id_col="com_insee") if MESH_ENGINE == "topology" and mesh_type != "com" else None
+                    units = mesh_units(communes, data_df, id_col, name_col, mesh_type, territory, topology=topology)
+                    if units is None:
+                        raise ValueError("empty or invalid geometries")
+                print(f"{len(affected)} unit(s) to update, {0 if units is None else len(units)} dissolved from {len(communes)} commune(s)")
+                add(rows_in=len(communes), rows_out=0 if units is None else len(units))
+
+                surfaces = patch_layer(previous_layers[0], units, id_col, affected)
+                layers = [surfaces]
+                with span("kind", kind="centroid"):
+                    points = None
+                    if units is not None:
+                        reuse = compact_label_sources(layout_transforms(geometries_df, geom_path), mesh_type, COG_YEAR, gen_suffix) if style != "natural" else None
+                        points = with_geometry(units, compute_labels(units, id_col, f"{mesh_type}-{territory}{style_prefix}-{COG_YEAR}{gen_suffix}", reuse))
+                    layers.append(patch_layer(previous_layers[1], points, id_col, affected))
+                layers.append(patch_layer(
+                    previous_layers[2], None if units is None else with_geometry(units, units.geometry.boundary), id_col, affected
+                ))
+                if EXPORT_BORDERS:
+                    with span("kind", kind="border"):
+                        layers.append(patch_borders(previous_layers[3], surfaces, id_col, affected))
+
+                for gdf, filename_out in zip(layers, filenames):
+                    if not is_valid_geometry(gdf):
+                        print(f"Skipping {filename_out} (empty or invalid geometries)")
+                        continue
+                    write_geoparquet(gdf, Path(output_dir) / filename_out, compression_level=PARQUET_COMPRESSION_LEVEL)
+                    print(f"Exported: {filename_out}")
+                if export_lod and is_valid_geometry(surfaces):
+                    with span("kind", kind="lod"):
+                        export_pyramid(
+                            surfaces, id_col, output_dir, f"{mesh_type}-{territory}{style_prefix}-{COG_YEAR}", gen_suffix,
+                            full_files={"surface": filenames[0], "boundary": filenames[2]},
+                            compression_level=PARQUET_COMPRESSION_LEVEL
+                        )
+                if mesh_type == "com" and style == "natural" and not is_gen and territory != "frdrom":
+                    export_changes(previous_communes, geometries_df, membership, changed, output_dir, territory)
+            if manifest is not None:
+                manifest.record(outputs, inputs=inputs, params=params)
+        except Exception as e:
+            print(f"Error processing {mesh_type} for {filename}: {str(e)}")
+            errors.append((filename, mesh_type, str(e)))
+    return errors
+
+def is_partitioned(geom_path, is_gen):
+    """
+    True when a commune file is processed per partition: PARTITIONED and a
+    large standard layer (LOD pyramids of generalized layers need the whole layer)
+    """
+    return PARTITIONED and not is_gen and pq.ParquetFile(geom_path).metadata.num_rows >= PARTITION_MIN_COMMUNES
+
+def partition_plan(com_ids, membership, mesh_types):
+    """
+    Partition of each commune for a chain of meshes, on the coarsest
+    PARTITION_COLUMNS of the chain. Partitions spanned by a unit of one of
+    the meshes are merged, so that every unit lies in a single partition.
+    Returns the partition label of each commune (aligned with com_ids) and the column.
+    """
+    column = max((PARTITION_COLUMNS[mesh_type] for mesh_type in mesh_types), key=PARTITION_LEVELS.index)
+    communes = membership.drop_duplicates('com_insee').set_index('com_insee', drop=False).reindex(com_ids.to_numpy())
+    keys = communes[column].fillna("").astype(str).reset_index(drop=True)
+
+    # Union-find of the partitions spanned by a same unit
+    parent = {key: key for key in keys.unique()}
+    def find(key):
+        while parent[key] != key:
+            key = parent[key]
+        return key
+    for mesh_config in MESHES:
+        if mesh_config['mesh_type'] not in mesh_types:
+            continue
+        spans = keys.groupby(communes[mesh_config['columns'][0]].to_numpy()).unique()
+        for span_keys in spans[spans.map(len) > 1]:
+            root = find(span_keys[0])
+            for key in span_keys[1:]:
+                parent[find(key)] = root
+    return keys.map(find).to_numpy(), column
+
+def process_chain_partitioned(geom_path, filename, is_gen, mesh_types, membership, manifest=None):
+    """
+    Process a chain of meshes of a large commune file partition by
+    partition (see partition_plan), so that memory is bounded by the
+    largest partition instead of the whole layer.
+
+    The communes of each partition are read from the file, dissolved, and
+    the outputs appended as row groups to the layers of every mesh
+    (GeoParquetWriter). Borders between units of different partitions are
+    joined at the end (stitch_borders). Returns the list of (filename,
+    mesh_type, error) for failed steps.
+    """
+    style = extract_layout_style(filename)
+    territory = extract_territory_prefix(filename)
+    gen_suffix = "-gen" if is_gen else ""
+    style_prefix = style_suffix(style)
+    output_dir = create_output_directory(territory, style)
+    errors = []
+
+    com_ids = pd.read_parquet(geom_path, columns=['com_insee'])['com_insee']
+    partitions, partition_col = partition_plan(com_ids, membership, mesh_types)
+
+    # Meshes to build: outputs open for writing, label cache and external borders of each partition
+    meshes = {}
+    for mesh_config in MESHES:
+        mesh_type, id_col, name_col = mesh_config['mesh_type'], mesh_config['id_col'], mesh_config['name_col']
+        if mesh_type not in mesh_types:
+            continue
+        print(f"\nProcessing {mesh_type} mesh ({'generalized' if is_gen else 'standard'}, by {partition_col}):")
+        if not mesh_applicable(mesh_type, territory):
+            print(f"Skipping {mesh_type} mesh for territory {territory} (not applicable)")
+            continue
+        data_df = project_membership(membership, mesh_config['columns'], id_col, name_col)
+        if data_df.empty:
+            print(f"Empty or invalid data for {mesh_type}-{territory}, skipping")
+            continue
+        _, outputs, _ = mesh_outputs(output_dir, COG_YEAR, style, mesh_type, territory, is_gen)
+        params = mesh_params(data_df, id_col, name_col, False, partition_col)
+        if manifest is not None and manifest.is_up_to_date(outputs, inputs=[geom_path], params=params):
+            print(f"Files for {mesh_type}-{territory} are up to date, skipping")
+            continue
+        layer = f"{mesh_type}-{territory}{style_prefix}-{COG_YEAR}{gen_suffix}"
+        reuse = compact_label_sources(layout_transforms(None, geom_path), mesh_type, COG_YEAR, gen_suffix) if style != "natural" else None
+        meshes[mesh_type] = {
+            "config": mesh_config,
+            "data": data_df,
+            "outputs": outputs,
+            "params": params,
+            "writers": [GeoParquetWriter(path, compression_level=PARQUET_COMPRESSION_LEVEL) for path in outputs],
+            "labels": label_cache(id_col, layer, reuse),
+            "layer": layer,
+            "external": [],
+        }
+
+    def discard(mesh_type):
+        """Drop a failed mesh and its partly written outputs"""
+        for writer in meshes.pop(mesh_type)["writers"]:
+            writer.close()
+            Path(writer.path).unlink(missing_ok=True)
+
+    for key in pd.unique(partitions):
+        if not meshes:
+            break
+        ids = com_ids[partitions == key]
+        with span("partition", partition=key, communes=len(ids)):
+            geometries_df = drop_covering(gpd.read_parquet(geom_path, filters=[('com_insee', 'in', ids.tolist())]))
+            topology = None
+            if MESH_ENGINE == "topology":
+                try:
+                    topology = build_topology(geometries_df, id_col="com_insee")
+                except Exception as e:
+                    print(f"Error building topology for {filename} ({key}), falling back to dissolve: {str(e)}")
+
+            for mesh_type in list(meshes):
+                mesh = meshes[mesh_type]
+                id_col, name_col = mesh["config"]['id_col'], mesh["config"]['name_col']
+                # No unit of the mesh in the partition (communes missing from the membership table)
+                data_df = mesh["data"]
+                if mesh_type != "com" and data_df.loc[data_df['com_insee'].isin(ids), id_col].isna().all():
+                    continue
+                try:
+                    with span("mesh", territory=territory, style=style, gen=is_gen, mesh=mesh_type, partition=key):
+                        units = mesh_units(geometries_df, mesh["data"], id_col, name_col, mesh_type, territory, topology=topology)
+                        # The partitions already written are dropped with the mesh: reported as a failure
+                        if units is None:
+                            raise ValueError("invalid geometries")
+                        if not is_valid_geometry(units):
+                            raise ValueError("empty or invalid geometries")
+                        add(
+                            rows_in=len(geometries_df), rows_out=len(units),
+                            vertices_in=vertices(geometries_df.geometry.values), vertices_out=vertices(units.geometry.values),
+                        )
+                        surface_writer, centroid_writer, boundary_writer = mesh["writers"][:3]
+                        with span("kind", kind="surface"):
+                            surface_writer.write(units)
+                        with span("kind", kind="centroid"):
+                            points = compute_labels(units, id_col, mesh["layer"], shared_cache=mesh["labels"])
+                            centroid_writer.write(with_geometry(units, points))
+                        with span("kind", kind="boundary"):
+                            boundary_writer.write(with_geometry(units, units.geometry.boundary))
+                        if EXPORT_BORDERS:
+                            with span("kind", kind="border"):
+                                borders = shared_borders(build_topology(units, id_col=id_col))
+                                mesh["writers"][3].write(borders[~borders["external"]])
+                                mesh["external"].append(borders[borders["external"]])
+                except Exception as e:
+                    print(f"Error processing {mesh_type} for {filename} ({key}): {str(e)}")
+                    errors.append((filename, mesh_type, str(e)))
+                    discard(mesh_type)
+
+    # Borders between partitions, then close the layers
+    for mesh_type, mesh in meshes.items():
+        try:
+            if EXPORT_BORDERS and mesh["external"]:
+                with span("kind", kind="border", mesh=mesh_type):
+                    mesh["writers"][3].write(stitch_borders(pd.concat(mesh["external"], ignore_index=True)))
+            for writer in mesh["writers"]:
+                writer.close()
+                if writer.rows:
+                    print(f"Exported: {Path(writer.path).name}")
+            if mesh["labels"] is not None:
+                mesh["labels"].save_staged()
+            if manifest is not None:
+                manifest.record(mesh["outputs"], inputs=[geom_path], params=mesh["params"])
+        except Exception as e:
+            print(f"Error processing {mesh_type} for {filename}: {str(e)}")
+            errors.append((filename, mesh_type, str(e)))
+    return errors
+
+def process_chain_duckdb(geom_path, filename, is_gen, mesh_types, membership, manifest=None):
+    """
+    Process a chain of meshes with the DuckDB spatial engine (see
+    duckdb_engine.py): the units are dissolved from the commune file and
+    the surface, centroid and boundary layers written by DuckDB. Borders,
+    the LOD pyramid and the label points DuckDB has no function for
+    (polylabel, layouts) still go through shapely and GeoPandas as in
+    process_mesh, on the units fetched through Arrow. Returns the list of
+    (filename, mesh_type, error) for failed steps.
+    """
+    style = extract_layout_style(filename)
+    territory = extract_territory_prefix(filename)
+    gen_suffix = "-gen" if is_gen else ""
+    style_prefix = style_suffix(style)
+    output_dir = create_output_directory(territory, style)
+    errors = []
+
+    for mesh_config in MESHES:
+        mesh_type, id_col, name_col = mesh_config['mesh_type'], mesh_config['id_col'], mesh_config['name_col']
+        if mesh_type not in mesh_types:
+            continue
+        print(f"\nProcessing {mesh_type} mesh ({'generalized' if is_gen else 'standard'}, duckdb):")
+        if not mesh_applicable(mesh_type, territory):
+            print(f"Skipping {mesh_type} mesh for territory {territory} (not applicable)")
+            continue
+        try:
+            data_df = project_membership(membership, mesh_config['columns'], id_col, name_col)
+            if data_df.empty:
+                print(f"Empty or invalid data for {mesh_type}-{territory}, skipping")
+                continue
+            filenames, outputs, export_lod = mesh_outputs(output_dir, COG_YEAR, style, mesh_type, territory, is_gen)
+            params = mesh_params(data_df, id_col, name_col, export_lod)
+            if manifest is not None and manifest.is_up_to_date(outputs, inputs=[geom_path], params=params):
+                print(f"Files for {mesh_type}-{territory} are up to date, skipping")
+                continue
+
+            with span("mesh", territory=territory, style=style, gen=is_gen, mesh=mesh_type):
+                con = connect(DUCKDB_THREADS)
+                units, empty = build_units(con, geom_path, data_df, id_col, name_col, mesh_type)
+                if units == 0 or empty:
+                    print(f"Invalid geometries after dissolve for {mesh_type}-{territory}, skipping")
+                    continue
+                add(rows_in=pq.ParquetFile(geom_path).metadata.num_rows, rows_out=units)
+                crs = layer_crs(geom_path)
+
+                def export(geometry, filename):
+                    export_layer(
+                        con, geometry, Path(output_dir) / filename, id_col, name_col, crs,
+                        compression_level=PARQUET_COMPRESSION_LEVEL
+                    )
+                    print(f"Exported: {filename}")
+
+                with span("kind", kind="surface"):
+                    export("geometry", filenames[0])
+                # Layouts reuse the label points of their territories, as process_mesh
+                sql_labels = LABEL_METHOD in LABEL_SQL and style == "natural"
+                surfaces = None
+                if not sql_labels or EXPORT_BORDERS or export_lod:
+                    surfaces = fetch_units(con, id_col, name_col, crs)
+
+                # Label points in SQL, or in Python for the methods DuckDB has no function for
+                with span("kind", kind="centroid"):
+                    if sql_labels:
+                        export(LABEL_SQL[LABEL_METHOD], filenames[1])
+                    else:
+                        reuse = compact_label_sources(layout_transforms(None, geom_path), mesh_type, COG_YEAR, gen_suffix) if style != "natural" else None
+                        points = compute_labels(surfaces, id_col, f"{mesh_type}-{territory}{style_prefix}-{COG_YEAR}{gen_suffix}", reuse)
+                        write_geoparquet(
+                            with_geometry(surfaces, points), Path(output_dir) / filenames[1],
+                            compression_level=PARQUET_COMPRESSION_LEVEL
+                        )
+                        print(f"Exported: {filenames[1]}")
+
+                with span("kind", kind="boundary"):
+                    export(BOUNDARY_SQL, filenames[2])
+
+                if EXPORT_BORDERS:
+                    with span("kind", kind="border"):
+                        write_geoparquet(
+                            shared_borders(build_topology(surfaces, id_col=id_col)), Path(output_dir) / filenames[3],
+                            compression_level=PARQUET_COMPRESSION_LEVEL
+                        )
+                        print(f"Exported: {filenames[3]}")
+
+                if export_lod:
+                    with span("kind", kind="lod"):
+                        export_pyramid(
+                            surfaces, id_col, output_dir, f"{mesh_type}-{territory}{style_prefix}-{COG_YEAR}", gen_suffix,
+                            full_files={"surface": filenames[0], "boundary": filenames[2]},
+                            compression_level=PARQUET_COMPRESSION_LEVEL
+                        )
+
+            if manifest is not None:
+                manifest.record(outputs, inputs=[geom_path], params=params)
+        except Exception as e:
+            print(f"Error processing {mesh_type} for {filename}: {str(e)}")
+            errors.append((filename, mesh_type, str(e)))
+    return errors
+
+def main(workers=WORKERS, report=None, partitioned=PARTITIONED, update_from=UPDATE_FROM, engine=MESH_ENGINE):
+    # Load the membership table once for all files, meshes and workers, and keep it for the next millésime
+    membership = load_membership(DB_PATH, EPCI_EPT_QUERY_PATH, MEMBERSHIP_CACHE_DIR)
+    save_snapshot(membership, MILLESIME_DIR, COG_YEAR)
+    
+    # Largest files first so that the longest tasks do not end the run
+    geometries_paths = sorted(
+        list_geometries_paths(),
+        key=lambda p: (-(Path(p[0]) / p[1]).stat().st_size, p[0], p[1])
+    )
+    tasks = [
+        (input_dir, filename, is_gen, tuple(chain))
+        for input_dir, filename, is_gen in geometries_paths
+        for chain in mesh_chains(MESHES)
+    ]
+    # Layouts reuse the label points of the territory layers: processed last
+    phases = [
+        [task for task in tasks if extract_layout_style(task[1]) == "natural"],
+        [task for task in tasks if extract_layout_style(task[1]) != "natural"],
+    ]
+    
+    # Process all (file, mesh chain) tasks
+    manifest = build_manifest()
+    errors = []
+    if workers > 1:
+        print(f"Processing {len(tasks)} tasks with {workers} workers")
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(membership, None, partitioned, update_from, engine)) as executor:
+            for phase in phases:
+                futures = {executor.submit(process_task, task): task for task in phase}
+                for future in as_completed(futures):
+                    input_dir, filename, is_gen, mesh_types = futures[future]
+                    try:
+                        task_errors, records, files, measures = future.result()
+                        errors.extend(task_errors)
+                        manifest.merge(records, files)
+                        if report is not None:
+                            report.merge(*measures)
+                    except Exception as e:
+                        errors.append((filename, ", ".join(mesh_types), f"worker: {str(e)}"))
+    else:
+        init_worker(membership, manifest, partitioned, update_from, engine)
+        for task in phases[0] + phases[1]:
+            errors.extend(process_task(task)[0])
+    manifest.save()
+    
+    # Report failed tasks
+    if errors:
+        print(f"\n{len(errors)} error(s):")
+        for filename, mesh_type, error in sorted(errors, key=lambda e: (e[0], str(e[1]))):
+            print(f"  {filename} [{mesh_type or 'all'}]: {error}")
+    else:
+        print(f"\nAll {len(tasks)} tasks completed")
+    return errors
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate mesh layers for every commune geometry file")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Number of worker processes (1 = serial)")
+    parser.add_argument("--partitioned", action="store_true", default=PARTITIONED, help="Process large standard layers per department/region partition (bounded memory)")
+    parser.add_argument("--update-from", default=UPDATE_FROM, help="Previous millésime (e.g. 2024): dissolve only the units changed since then, copying the others from its layers")
+    parser.add_argument("--engine", choices=["topology", "dissolve", "duckdb"], default=MESH_ENGINE, help="Mesh engine: shared-arc topology, GeoPandas dissolve or DuckDB spatial")
+    args = parser.parse_args()
+    with RunReport(MANIFEST_STAGE) as report:
+        errors = main(workers=args.workers, report=report, partitioned=args.partitioned, update_from=args.update_from, engine=args.engine)
+    sys.exit(1 if errors else 0)
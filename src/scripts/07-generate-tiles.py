@@ -0,0 +1,282 @@
+import geopandas as gpd
+import numpy as np
+from pathlib import Path
+import shapely
+import gzip
+import os
+import re
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import mapbox_vector_tile
+from mapbox_vector_tile.encoder import on_invalid_geometry_make_valid
+from pmtiles.writer import write as write_pmtiles
+from pmtiles.tile import zxy_to_tileid, TileType, Compression
+from topology import build_topology, rebuild_geometries
+from generalize import generalize_arcs
+from settings import COG_YEAR, PATHS
+
+# Configuration (paths and millésime: see settings.py)
+INPUT_DIR = str(PATHS["public"])
+SOURCE_SUFFIX = "-gen"  # Layers tiled ("-gen" generalized, "" standard)
+KINDS = ["surface", "boundary", "border", "centroid"]
+ATTRIBUTE_PATTERN = re.compile(r".+_(insee|siren|nom)$|^(left_id|right_id|external)$")  # Attributes kept in tiles
+
+MIN_ZOOM = 0
+MAX_ZOOM = 12
+MESH_MIN_ZOOM = {"com": 8, "epci": 5, "epciept": 5, "ept": 7}  # First zoom of dense meshes
+TILE_EXTENT = 4096  # Tile coordinate resolution
+TILE_BUFFER = 64  # Clipping buffer (tile units)
+PIXEL_TOLERANCE = 1.0  # Simplification tolerance (tile units at each zoom)
+WORKERS = os.cpu_count()  # Worker processes encoding tiles, overridden by --workers
+TILES_PER_TASK = 64
+
+WEB_MERCATOR = 3857
+HALF_WORLD = 20037508.342789244  # Half of the Web Mercator world width (metres)
+
+def list_layers(territory_dir):
+    """Return {layer name: path} for the layers of a territory/style directory"""
+    pattern = re.compile(
+        rf"^(?P<mesh>[a-z]+)-{re.escape(territory_dir.name)}-{COG_YEAR}-(?P<kind>{'|'.join(KINDS)}){re.escape(SOURCE_SUFFIX)}\.parquet$"
+    )
+    layers = {}
+    for path in sorted(territory_dir.glob("*.parquet")):
+        match = pattern.match(path.name)
+        if match:
+            layers[f"{match['mesh']}-{match['kind']}"] = path
+    return layers
+
+def tile_size(zoom):
+    """Width of a tile in Web Mercator metres"""
+    return 2 * HALF_WORLD / 2 ** zoom
+
+def tile_bounds(z, x, y):
+    """Web Mercator bounds of a tile"""
+    size = tile_size(z)
+    minx = -HALF_WORLD + x * size
+    maxy = HALF_WORLD - y * size
+    return minx, maxy - size, minx + size, maxy
+
+def load_layer(path):
+    """Load a layer in Web Mercator with the attributes kept in tiles"""
+    gdf = gpd.read_parquet(path)
+    columns = [col for col in gdf.columns if ATTRIBUTE_PATTERN.match(col)]
+    gdf = gdf[columns + ["geometry"]].to_crs(epsg=WEB_MERCATOR)
+    gdf = gdf[~(gdf.geometry.isna() | gdf.geometry.is_empty)].reset_index(drop=True)
+    for col in columns:
+        gdf[col] = gdf[col].astype(object).where(gdf[col].notna(), None)
+    return gdf
+
+def simplify_layer(gdf, kind, zooms):
+    """
+    Return {zoom: geometry array} simplified for each zoom.
+
+    Surfaces are simplified on their arc topology, from the finest zoom to
+    the coarsest, so that neighbouring units stay coincident in every tile.
+    """
+    geometries = np.asarray(gdf.geometry)
+    tolerances = {zoom: PIXEL_TOLERANCE * tile_size(zoom) / TILE_EXTENT for zoom in zooms}
+    if kind == "centroid":
+        return {zoom: geometries for zoom in zooms}
+    if kind in ("boundary", "border"):
+        return {zoom: shapely.simplify(geometries, tolerances[zoom]) for zoom in zooms}
+
+    id_col = gdf.columns[0]
+    topology = build_topology(gdf, id_col=id_col)
+    arcs = topology.arcs
+    simplified = {}
+    for zoom in sorted(zooms, reverse=True):
+        arcs = generalize_arcs(arcs, [("douglas", {})], tolerance=tolerances[zoom])
+        simplified[zoom] = rebuild_geometries(topology, arcs)
+    return simplified
+
+# Layers of the current process (set by init_worker)
+_layers = {}
+_trees = {}
+
+def init_worker(layers):
+    """Receive the simplified layers once per worker"""
+    global _layers, _trees
+    _layers = layers
+    _trees = {}
+
+def get_tree(layer, zoom):
+    """STRtree of a layer at a zoom (built once per worker)"""
+    if (layer, zoom) not in _trees:
+        _trees[(layer, zoom)] = shapely.STRtree(_layers[layer]["geometries"][zoom])
+    return _trees[(layer, zoom)]
+
+def encode_tile(z, x, y):
+    """Clip the layers to a tile and encode it as a gzipped MVT (None when empty)"""
+    bounds = tile_bounds(z, x, y)
+    buffer = TILE_BUFFER * tile_size(z) / TILE_EXTENT
+    clip_box = (bounds[0] - buffer, bounds[1] - buffer, bounds[2] + buffer, bounds[3] + buffer)
+
+    tile_layers = []
+    for name, layer in _layers.items():
+        if z < layer["minzoom"]:
+            continue
+        geometries = layer["geometries"][z]
+        idx = get_tree(name, z).query(shapely.box(*clip_box), predicate="intersects")
+        if len(idx) == 0:
+            continue
+        idx = np.sort(idx)
+        clipped = shapely.clip_by_rect(geometries[idx], *clip_box)
+        keep = ~(shapely.is_empty(clipped) | shapely.is_missing(clipped))
+        if not keep.any():
+            continue
+        records = layer["attributes"]
+        tile_layers.append({
+            "name": name,
+            "features": [
+                {"geometry": geometry, "properties": records[i]}
+                for i, geometry in zip(idx[keep], clipped[keep])
+            ],
+        })
+
+    if not tile_layers:
+        return None
+    data = mapbox_vector_tile.encode(
+        tile_layers,
+        default_options={
+            "quantize_bounds": bounds,
+            "extents": TILE_EXTENT,
+            "on_invalid_geometry": on_invalid_geometry_make_valid,
+        },
+    )
+    return gzip.compress(data, mtime=0)
+
+def encode_tiles(tiles):
+    """Encode a batch of tiles, returning (z, x, y, data) for non-empty tiles"""
+    results = []
+    for z, x, y in tiles:
+        data = encode_tile(z, x, y)
+        if data is not None:
+            results.append((z, x, y, data))
+    return results
+
+def root_tiles(bounds, zoom):
+    """Tiles of a zoom covering Web Mercator bounds"""
+    n = 2 ** zoom
+    x0 = max(0, int((bounds[0] + HALF_WORLD) / tile_size(zoom)))
+    x1 = min(n - 1, int((bounds[2] + HALF_WORLD) / tile_size(zoom)))
+    y0 = max(0, int((HALF_WORLD - bounds[3]) / tile_size(zoom)))
+    y1 = min(n - 1, int((HALF_WORLD - bounds[1]) / tile_size(zoom)))
+    return [(zoom, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+def generate_tiles(layers, workers):
+    """
+    Encode all non-empty tiles from the first layer minzoom to MAX_ZOOM.
+
+    At each zoom, only the children of the non-empty tiles of the previous
+    zoom and the tiles covering the layers starting at this zoom are visited.
+    """
+    tiles = {}
+    candidates = []
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(layers,)) if workers > 1 else None
+    if executor is None:
+        init_worker(layers)
+    try:
+        for zoom in range(min(layer["minzoom"] for layer in layers.values()), MAX_ZOOM + 1):
+            for layer in layers.values():
+                if layer["minzoom"] == zoom:
+                    candidates += root_tiles(layer["bounds"], zoom)
+            candidates = sorted(set(candidates))
+            batches = [candidates[i:i + TILES_PER_TASK] for i in range(0, len(candidates), TILES_PER_TASK)]
+            results = executor.map(encode_tiles, batches) if executor else map(encode_tiles, batches)
+            encoded = [tile for batch in results for tile in batch]
+            for z, x, y, data in encoded:
+                tiles[zxy_to_tileid(z, x, y)] = data
+            print(f"  z{zoom}: {len(encoded)} tiles")
+            candidates = [
+                (z + 1, 2 * x + dx, 2 * y + dy)
+                for z, x, y, _ in encoded
+                for dx in (0, 1) for dy in (0, 1)
+            ]
+    finally:
+        if executor:
+            executor.shutdown()
+    return tiles
+
+def write_archive(tiles, layers, bounds, output_path):
+    """Write tiles to a PMTiles archive with their vector layer metadata"""
+    lon_lat = gpd.GeoSeries(
+        [shapely.Point(bounds[0], bounds[1]), shapely.Point(bounds[2], bounds[3])], crs=WEB_MERCATOR
+    ).to_crs(epsg=4326)
+    (min_lon, max_lon), (min_lat, max_lat) = lon_lat.x.tolist(), lon_lat.y.tolist()
+
+    header = {
+        "tile_type": TileType.MVT,
+        "tile_compression": Compression.GZIP,
+        "min_lon_e7": int(min_lon * 1e7),
+        "min_lat_e7": int(min_lat * 1e7),
+        "max_lon_e7": int(max_lon * 1e7),
+        "max_lat_e7": int(max_lat * 1e7),
+        "center_zoom": MIN_ZOOM,
+        "center_lon_e7": int((min_lon + max_lon) / 2 * 1e7),
+        "center_lat_e7": int((min_lat + max_lat) / 2 * 1e7),
+    }
+    metadata = {
+        "name": output_path.stem,
+        "format": "pbf",
+        "vector_layers": [
+            {"id": name, "fields": {col: "String" for col in layer["columns"]}, "minzoom": layer["minzoom"], "maxzoom": MAX_ZOOM}
+            for name, layer in layers.items()
+        ],
+    }
+    with write_pmtiles(output_path) as writer:
+        for tile_id in sorted(tiles):
+            writer.write_tile(tile_id, tiles[tile_id])
+        writer.finalize(header, metadata)
+
+    file_size = output_path.stat().st_size / (1024 * 1024)
+    print(f"Exported: {output_path.name} ({len(tiles)} tiles, {file_size:.2f} MB)")
+
+def process_territory(territory_dir, workers):
+    """Tile all layers of a territory/style directory into one PMTiles archive"""
+    layer_paths = list_layers(territory_dir)
+    if not layer_paths:
+        print(f"No {SOURCE_SUFFIX or 'standard'} layers in {territory_dir}, skipping")
+        return
+
+    layers = {}
+    for name, path in layer_paths.items():
+        gdf = load_layer(path)
+        if gdf.empty:
+            continue
+        mesh_type, kind = name.split("-")
+        min_zoom = max(MIN_ZOOM, MESH_MIN_ZOOM.get(mesh_type, MIN_ZOOM))
+        columns = [col for col in gdf.columns if col != "geometry"]
+        layers[name] = {
+            "columns": columns,
+            "attributes": gdf[columns].to_dict(orient="records"),
+            "geometries": simplify_layer(gdf, kind, range(min_zoom, MAX_ZOOM + 1)),
+            "bounds": gdf.total_bounds,
+            "minzoom": min_zoom,
+        }
+    if not layers:
+        print(f"Only empty layers in {territory_dir}, skipping")
+        return
+
+    all_bounds = np.array([layer["bounds"] for layer in layers.values()])
+    bounds = (*all_bounds[:, :2].min(axis=0), *all_bounds[:, 2:].max(axis=0))
+
+    print(f"\nTiling {territory_dir.name}: {len(layers)} layers, z{MIN_ZOOM}-{MAX_ZOOM}")
+    tiles = generate_tiles(layers, workers)
+    output_path = territory_dir / f"{territory_dir.name}-{COG_YEAR}{SOURCE_SUFFIX}.pmtiles"
+    write_archive(tiles, layers, bounds, output_path)
+
+def main(workers=WORKERS):
+    for territory_dir in sorted(Path(INPUT_DIR).iterdir()):
+        if not territory_dir.is_dir():
+            continue
+        try:
+            process_territory(territory_dir, workers)
+        except Exception as e:
+            print(f"Error tiling {territory_dir.name}: {str(e)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate PMTiles vector tile archives from the public layers")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Number of worker processes (1 = serial)")
+    args = parser.parse_args()
+    main(workers=args.workers)
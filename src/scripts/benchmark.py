@@ -0,0 +1,514 @@
+"""
+Benchmarks of the pipeline stage functions on synthetic commune coverages.
+
+Runs offline: the commune coverage is a seeded Voronoi tessellation of
+configurable size whose borders are densified and wiggled on the shared
+arcs (so the coverage stays gap- and overlap-free), with a fake membership
+table nesting communes into arr, dep and reg and grouping them into epci
+and ept. The generalized DROM files of src/processed_data/gen can be used
+instead as a realistic fixture (--fixture).
+
+Each stage function runs REPEAT times in a fresh process on the same
+input. The report gives the median duration, the throughput (communes per
+second) and the peak memory of the stage: the resident set size
+high-water mark, reset before the stage on Linux. Results can be stored
+as a baseline (--save-baseline); later runs are compared with it and
+stages slower by more than REGRESSION_THRESHOLD make the script exit with
+status 1. A stage that raises is reported as failed (and not stored in
+the baseline), the other stages still run, and the script exits with
+status 1.
+
+With --check-engines, the mesh layers of each input are built with the
+topology and DuckDB engines of 06-generate-ngeo.py instead, and compared
+unit by unit (ids, names and geometries within ENGINE_TOLERANCE); any
+difference makes the script exit with status 1. The DuckDB engine (the
+process_mesh_duckdb stage and the check) needs the DuckDB spatial
+extension, downloaded on first use.
+
+Usage:
+    python src/scripts/benchmark.py --sizes 1000 10000 50000
+    python src/scripts/benchmark.py --fixture --stages clean_communes process_mesh
+    python src/scripts/benchmark.py --save-baseline
+    python src/scripts/benchmark.py --fixture --check-engines
+"""
+import argparse
+import json
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from generalize import arcs_to_arrays, arrays_to_arcs
+from geoparquet import write_geoparquet
+from pipeline import load_stage
+from topology import build_topology, rebuild_geometries
+
+SIZES = [1000, 10000, 50000]  # Communes of the synthetic coverages
+SEED = 0
+REPEAT = 3  # Runs of each stage, the median duration is reported
+EXTENT = (100000, 6100000, 1200000, 7100000)  # Synthetic coverage extent (Lambert 93)
+DROM_EXTENT = (500000, 1500000, 560000, 1560000)  # Synthetic DROM extent (UTM)
+DROM_SHARE = 0.01  # Communes of each synthetic DROM, relative to the coverage
+SEGMENTS_PER_SIDE = 12  # Border vertices per cell side
+WIGGLE = 0.2  # Vertex displacement, relative to the segment length
+COMMUNES_PER_DEP = 500
+DEPS_PER_REG = 8
+ARRS_PER_DEP = 3
+COMMUNES_PER_EPCI = 15
+COMMUNES_PER_EPT = 40
+FIXTURE_DIR = Path("./src/processed_data/gen")
+BENCHMARK_DIR = Path("./src/processed_data/benchmarks")
+BASELINE_PATH = BENCHMARK_DIR / "baseline.json"
+REGRESSION_THRESHOLD = 0.25  # Slowdown reported as a regression (25 %)
+TOLERANCE = 200  # Simplification tolerance (m)
+ENGINES = ["topology", "duckdb"]  # Mesh engines compared by --check-engines, the first one is the reference
+ENGINE_TOLERANCE = 0.01  # Hausdorff distance (m) under which the geometries of two engines are equal
+
+
+def wiggle_coverage(gdf, rng, segment_length):
+    """Densify and displace the shared arcs of a coverage, keeping it a coverage."""
+    topology = build_topology(gdf, id_col="com_insee")
+    coords, offsets = arcs_to_arrays(shapely.segmentize(topology.arcs, segment_length))
+    counts = np.diff(offsets)
+    position = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+    inner = (position > 0) & (position < np.repeat(counts, counts) - 1)
+    coords[inner] += rng.uniform(-1, 1, size=(int(inner.sum()), 2)) * WIGGLE * segment_length
+    return rebuild_geometries(topology, arrays_to_arcs(coords, offsets))
+
+
+def synthetic_coverage(n, seed=SEED, extent=EXTENT, crs=2154, dep_codes=None):
+    """
+    Seeded Voronoi coverage of n communes, numbered along a Hilbert curve so
+    that each department (first two characters of com_insee) is contiguous.
+    """
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = extent
+    points = shapely.points(rng.uniform([xmin, ymin], [xmax, ymax], size=(n, 2)))
+    frame = shapely.box(*extent)
+    cells = shapely.intersection(shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(points), extend_to=frame)), frame)
+    cells = gpd.GeoSeries(cells, crs=crs)
+    cells = cells.iloc[np.argsort(cells.hilbert_distance(), kind="stable")].reset_index(drop=True)
+
+    dep_codes = dep_codes or [f"{i + 1:02d}" for i in range(max(1, min(95, round(n / COMMUNES_PER_DEP))))]
+    dep = np.arange(n) * len(dep_codes) // n
+    number = np.arange(n) - np.searchsorted(dep, dep)
+    com_insee = [f"{dep_codes[d]}{k + 1:03d}" for d, k in zip(dep, number)]
+    gdf = gpd.GeoDataFrame({"com_insee": com_insee, "com_nom": [f"Commune {c}" for c in com_insee]}, geometry=cells.values, crs=crs)
+
+    side = np.sqrt((xmax - xmin) * (ymax - ymin) / n)
+    gdf.geometry = wiggle_coverage(gdf, rng, side / SEGMENTS_PER_SIDE)
+    return gdf[~gdf.geometry.isna()].reset_index(drop=True)
+
+
+def fake_membership(gdf):
+    """
+    Membership table of the communes of gdf (columns of membership.py):
+    contiguous runs along a Hilbert curve form nested arr < dep < reg and,
+    independently, epci and ept (ept in the first department only).
+    """
+    order = np.argsort(gdf.geometry.hilbert_distance().to_numpy(), kind="stable")
+    communes = gdf.iloc[order][["com_insee", "com_nom"]].reset_index(drop=True)
+    n = len(communes)
+    rank = np.arange(n)
+    n_deps = max(1, round(n / COMMUNES_PER_DEP))
+    dep = rank * n_deps // n
+    arr = dep * ARRS_PER_DEP + (rank - np.searchsorted(dep, dep)) * ARRS_PER_DEP // np.bincount(dep)[dep]
+    epci = rank // COMMUNES_PER_EPCI
+    ept = np.where(dep == 0, rank // COMMUNES_PER_EPT, -1)
+
+    codes = {
+        "dep": pd.Series(dep).map("{:02d}".format),
+        "arr": pd.Series(arr).map("{:03d}".format),
+        "reg": pd.Series(dep // DEPS_PER_REG).map("{:02d}".format),
+        "epci": pd.Series(epci).map("2{:08d}".format),
+        "ept": pd.Series(ept).map("1{:08d}".format).where(ept >= 0),
+    }
+    membership = communes.assign(
+        arr_insee=codes["arr"], dep_insee=codes["dep"], reg_insee=codes["reg"],
+        epci_siren=codes["epci"], ept_siren=codes["ept"],
+    )
+    for mesh, column in [("arr", "arr_insee"), ("dep", "dep_insee"), ("reg", "reg_insee"), ("epci", "epci_siren"), ("ept", "ept_siren")]:
+        membership[f"{mesh}_nom"] = (mesh.upper() + " " + membership[column]).where(membership[column].notna())
+    membership["epciept_siren"] = membership["ept_siren"].fillna(membership["epci_siren"])
+    membership["epciept_nom"] = membership["ept_nom"].fillna(membership["epci_nom"])
+    return membership.sort_values("com_insee").reset_index(drop=True)
+
+
+# Stage functions: called with the input of a benchmark and a scratch directory
+
+def bench_simplify_geometries(data, workdir):
+    path = Path(workdir) / data["filename"]
+    if not path.exists():
+        write_geoparquet(data["coverage"], path, compression_level=1, sort=False)
+    data["stages"]["simplify"].simplify_geometries(path, TOLERANCE)
+
+
+def bench_simplify_frame(data, workdir):
+    simplify = data["stages"]["simplify"]
+    list(simplify.simplify_frame(data["coverage"], [TOLERANCE], simplify.RECIPE))
+
+
+def bench_clean_communes(data, workdir):
+    data["stages"]["clean"].clean_communes(data["coverage"])
+
+
+def bench_transform_natural(data, workdir):
+    data["stages"]["merge"].transform_natural(data["territories"], None)
+
+
+def bench_transform_compact(data, workdir):
+    merge = data["stages"]["merge"]
+    merge.transform_compact(data["territories"], merge.LAYOUTS["compact"])
+
+
+def bench_process_mesh(data, workdir):
+    generate = data["stages"]["generate"]
+    generate.OUTPUT_DIR = str(workdir)
+    generate.LABEL_CACHE = False
+    topology = build_topology(data["coverage"], id_col="com_insee") if generate.MESH_ENGINE == "topology" else None
+    for chain in generate.mesh_chains(generate.MESHES):
+        errors = generate.process_chain(data["coverage"], data["filename"], True, tuple(chain), data["membership"], topology=topology)
+        if errors:
+            raise RuntimeError(errors)
+
+
+def bench_process_mesh_duckdb(data, workdir):
+    generate = data["stages"]["generate"]
+    generate.OUTPUT_DIR = str(workdir)
+    generate.LABEL_CACHE = False
+    # The DuckDB engine reads the commune file itself
+    path = Path(workdir) / data["filename"]
+    if not path.exists():
+        write_geoparquet(data["coverage"], path, compression_level=1, sort=False)
+    for chain in generate.mesh_chains(generate.MESHES):
+        errors = generate.process_chain_duckdb(str(path), data["filename"], True, tuple(chain), data["membership"])
+        if errors:
+            raise RuntimeError(errors)
+
+
+STAGES = {
+    "simplify_geometries": ("simplify", bench_simplify_geometries),
+    "simplify_frame": ("simplify", bench_simplify_frame),
+    "clean_communes": ("clean", bench_clean_communes),
+    "transform_natural": ("merge", bench_transform_natural),
+    "transform_compact": ("merge", bench_transform_compact),
+    "process_mesh": ("generate", bench_process_mesh),
+    "process_mesh_duckdb": ("generate", bench_process_mesh_duckdb),
+}
+OPTIONAL_STAGES = ["process_mesh_duckdb"]  # Not run by default (DuckDB spatial extension)
+
+
+def reset_peak_rss():
+    """Reset the resident set size high-water mark of the process (Linux only)."""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def _status_mb(field):
+    """Memory field of /proc/self/status (MB), None when not available."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    """Resident set size high-water mark of the process (MB)."""
+    if (peak := _status_mb("VmHWM")) is not None:
+        return peak
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_stage(stage, input_dir, repeat):
+    """Run a stage function repeat times on a prepared input (in a fresh process)."""
+    input_dir = Path(input_dir)
+    meta = json.loads((input_dir / "input.json").read_text())
+    module, function = STAGES[stage]
+    data = {
+        "filename": meta["filename"],
+        "coverage": gpd.read_parquet(input_dir / "coverage.parquet"),
+        "membership": pd.read_parquet(input_dir / "membership.parquet"),
+        "territories": {
+            territory: gpd.read_parquet(input_dir / f"{territory}.parquet")
+            for territory in meta["territories"]
+        },
+        "stages": {module: load_stage(module)},
+    }
+    workdir = tempfile.mkdtemp(prefix="ngeofr-bench-")
+    try:
+        reset = reset_peak_rss()
+        base = _status_mb("VmRSS")
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(data, workdir)
+            durations.append(time.perf_counter() - start)
+        peak = peak_rss_mb()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    seconds = statistics.median(durations)
+    return {
+        "communes": len(data["coverage"]),
+        "seconds": seconds,
+        "throughput": len(data["coverage"]) / seconds if seconds else None,
+        "peak_rss_mb": peak,
+        "base_rss_mb": base,  # Resident set size before the stage (input loaded)
+        "peak_rss_reset": reset,
+    }
+
+
+def prepare_input(directory, coverage, territories, filename):
+    """Write a benchmark input (coverage, membership and territories) read by run_stage."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    write_geoparquet(coverage, directory / "coverage.parquet", compression_level=1, sort=False)
+    fake_membership(coverage).to_parquet(directory / "membership.parquet", index=False)
+    for territory, gdf in territories.items():
+        write_geoparquet(gdf, directory / f"{territory}.parquet", compression_level=1, sort=False)
+    (directory / "input.json").write_text(json.dumps({"filename": filename, "territories": list(territories)}))
+    return directory
+
+
+def synthetic_inputs(sizes, root, seed=SEED):
+    """Synthetic benchmark inputs by name: the coverage stands for FRA, with small synthetic DROMs."""
+    merge = load_stage("merge")
+    inputs = {}
+    for n in sizes:
+        print(f"Generating synthetic coverage of {n} communes...")
+        coverage = synthetic_coverage(n, seed)
+        territories = {"FRA": coverage}
+        for i, territory in enumerate(merge.DROM_TERRITORIES):
+            territories[territory] = synthetic_coverage(
+                max(20, int(n * DROM_SHARE)), seed + i + 1, DROM_EXTENT, merge.CRS_CONFIG[territory],
+                dep_codes=[f"97{i + 1}"],
+            )
+        inputs[f"synthetic-{n}"] = prepare_input(Path(root) / f"synthetic-{n}", coverage, territories, f"com-fra-{merge.COG_YEAR}-gen.parquet")
+    return inputs
+
+
+def fixture_inputs(root, fixture_dir=FIXTURE_DIR):
+    """
+    One benchmark input per generalized DROM file. For the merge stages the
+    file stands in for FRA, placed with the other fixture files.
+    """
+    paths = sorted(Path(fixture_dir).glob("com-*-gen.parquet"))
+    territories = {path.name.split("-")[1].upper(): gpd.read_parquet(path) for path in paths}
+    inputs = {}
+    for path in paths:
+        territory = path.name.split("-")[1].upper()
+        placed = {"FRA": territories[territory], **{t: gdf for t, gdf in territories.items() if t != territory}}
+        inputs[path.stem] = prepare_input(Path(root) / path.stem, territories[territory], placed, path.name)
+    return inputs
+
+
+def run(inputs, stages, repeat=REPEAT):
+    """Results by input and stage, each stage run in a fresh process ({"error": message} for failed stages)."""
+    results = {}
+    for name, input_dir in inputs.items():
+        results[name] = {}
+        for stage in stages:
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                    result = executor.submit(run_stage, stage, str(input_dir), repeat).result()
+            except Exception as e:
+                results[name][stage] = {"error": f"{type(e).__name__}: {e}"}
+                print(f"  {name} | {stage} | failed: {results[name][stage]['error']}")
+                continue
+            results[name][stage] = result
+            print(f"  {name} | {stage} | {result['seconds']:.3f} s | {result['throughput']:,.0f} communes/s | {result['peak_rss_mb']:.0f} MB peak")
+    return results
+
+
+def failures(results):
+    """(input, stage, error) of the failed stages."""
+    return [
+        (name, stage, result["error"])
+        for name, stages in results.items() for stage, result in stages.items() if "error" in result
+    ]
+
+
+def engine_outputs(engine, input_dir, output_dir):
+    """Build the mesh layers of a prepared input with a mesh engine (in a fresh process), without LOD."""
+    input_dir = Path(input_dir)
+    meta = json.loads((input_dir / "input.json").read_text())
+    coverage = gpd.read_parquet(input_dir / "coverage.parquet")
+    membership = pd.read_parquet(input_dir / "membership.parquet")
+    generate = load_stage("generate")
+    generate.MESH_ENGINE = engine
+    generate.OUTPUT_DIR = str(output_dir)
+    generate.LABEL_CACHE = False
+    generate.LOD_PYRAMID = False
+    errors = []
+    if engine == "duckdb":
+        # The DuckDB engine reads the commune file itself
+        path = input_dir / meta["filename"]
+        if not path.exists():
+            write_geoparquet(coverage, path, compression_level=1, sort=False)
+        for chain in generate.mesh_chains(generate.MESHES):
+            errors += generate.process_chain_duckdb(str(path), meta["filename"], True, tuple(chain), membership)
+    else:
+        topology = build_topology(coverage, id_col="com_insee") if engine == "topology" else None
+        for chain in generate.mesh_chains(generate.MESHES):
+            errors += generate.process_chain(coverage, meta["filename"], True, tuple(chain), membership, topology=topology)
+    return errors
+
+
+def border_geometries(borders):
+    """Border geometries by unordered pair of unit ids."""
+    left, right = borders["left_id"].astype(str), borders["right_id"].fillna("").astype(str)
+    pair = np.where(left < right, left + "|" + right, right + "|" + left)
+    return borders.assign(pair=pair).dissolve(by="pair").geometry
+
+
+def compare_layers(reference_path, other_path, tolerance=ENGINE_TOLERANCE):
+    """Differences between two layers of the same mesh, as a list of messages."""
+    reference, other = gpd.read_parquet(reference_path), gpd.read_parquet(other_path)
+    if "-border" in reference_path.name:
+        reference, other = border_geometries(reference), border_geometries(other)
+        attributes = None
+    else:
+        id_col = reference.columns[0]
+        reference, other = reference.set_index(id_col).sort_index(), other.set_index(id_col).sort_index()
+        attributes = (reference.drop(columns=["geometry", "bbox"], errors="ignore"), other.drop(columns=["geometry", "bbox"], errors="ignore"))
+    if not reference.index.equals(other.index):
+        return [f"units differ ({len(reference)} / {len(other)})"]
+    differences = []
+    if attributes is not None and not attributes[0].astype(str).equals(attributes[1].astype(str)):
+        differences.append("attributes differ")
+    distance = shapely.hausdorff_distance(np.asarray(reference.geometry.values), np.asarray(other.geometry.values))
+    if (different := ~(distance <= tolerance)).any():
+        differences.append(f"{different.sum()} geometries differ (up to {np.nanmax(distance):.3f} m)")
+    return differences
+
+
+def check_engines(inputs, engines=ENGINES, tolerance=ENGINE_TOLERANCE):
+    """Build the mesh layers of each input with each engine and compare them with the first one. Returns the differences."""
+    differences = []
+    for name, input_dir in inputs.items():
+        outputs = {}
+        for engine in engines:
+            outputs[engine] = Path(input_dir) / f"engine-{engine}"
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                errors = executor.submit(engine_outputs, engine, str(input_dir), str(outputs[engine])).result()
+            differences += [(name, engine, f"{filename} [{mesh_type}]: {error}") for filename, mesh_type, error in errors]
+
+        reference = outputs[engines[0]]
+        layers = sorted(path.relative_to(reference) for path in reference.rglob("*.parquet"))
+        for engine in engines[1:]:
+            other = sorted(path.relative_to(outputs[engine]) for path in outputs[engine].rglob("*.parquet"))
+            differences += [(name, engine, f"{layer}: missing") for layer in sorted(set(layers) - set(other))]
+            differences += [(name, engine, f"{layer}: unexpected") for layer in sorted(set(other) - set(layers))]
+            for layer in sorted(set(layers) & set(other)):
+                differences += [
+                    (name, engine, f"{layer}: {message}")
+                    for message in compare_layers(reference / layer, outputs[engine] / layer, tolerance)
+                ]
+        print(f"  {name} | {len(layers)} layers compared")
+    return differences
+
+
+def environment():
+    """Versions the results depend on."""
+    return {
+        "python": platform.python_version(),
+        "shapely": shapely.__version__,
+        "geos": ".".join(map(str, shapely.geos_version)),
+        "geopandas": gpd.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Print the ratio to the baseline of each stage and return the regressions."""
+    regressions = []
+    print("\nComparison with the baseline (duration ratio, peak memory ratio):")
+    for name, stages in results.items():
+        for stage, result in stages.items():
+            if "error" in result:
+                continue
+            reference = baseline.get("results", {}).get(name, {}).get(stage)
+            if reference is None:
+                print(f"  {name} | {stage} | no baseline")
+                continue
+            ratio = result["seconds"] / reference["seconds"]
+            memory = result["peak_rss_mb"] / reference["peak_rss_mb"]
+            flag = "REGRESSION" if ratio > 1 + threshold else ""
+            print(f"  {name} | {stage} | x{ratio:.2f} | x{memory:.2f} {flag}")
+            if flag:
+                regressions.append((name, stage, ratio))
+    if baseline.get("environment") != environment():
+        print("Warning: the baseline was measured in a different environment")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic commune coverages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Communes of the synthetic coverages")
+    parser.add_argument("--fixture", action="store_true", help="Use the generalized DROM files of src/processed_data/gen instead")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=[stage for stage in STAGES if stage not in OPTIONAL_STAGES], help="Stage functions to time")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Runs of each stage (median reported)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="Baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--check-engines", action="store_true", help=f"Compare the mesh layers of the {' and '.join(ENGINES)} engines instead of timing the stages")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ngeofr-bench-") as root:
+        inputs = fixture_inputs(root) if args.fixture else synthetic_inputs(args.sizes, root, args.seed)
+        if args.check_engines:
+            differences = check_engines(inputs)
+            for name, engine, message in differences:
+                print(f"  {name} | {engine} | {message}")
+            print(f"\n{len(differences)} difference(s) between the {', '.join(ENGINES)} engines")
+            sys.exit(1 if differences else 0)
+        results = run(inputs, args.stages, args.repeat)
+
+    report = {"environment": environment(), "seed": args.seed, "repeat": args.repeat, "results": results}
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    (BENCHMARK_DIR / "latest.json").write_text(json.dumps(report, indent=2))
+    failed = failures(results)
+    if failed:
+        print(f"\n{len(failed)} stage(s) failed:")
+        for name, stage, error in failed:
+            print(f"  {name} | {stage} | {error}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        # Failed stages are not stored
+        report["results"] = {
+            name: {stage: result for stage, result in stages.items() if "error" not in result}
+            for name, stages in results.items()
+        }
+        if baseline_path.exists():
+            # Keep the baselines of the inputs and stages not run this time
+            previous = json.loads(baseline_path.read_text())
+            for name, stages in previous.get("results", {}).items():
+                for stage, result in stages.items():
+                    report["results"].setdefault(name, {}).setdefault(stage, result)
+        baseline_path.write_text(json.dumps(report, indent=2))
+        print(f"\nBaseline saved: {baseline_path}")
+        sys.exit(1 if failed else 0)
+    if not baseline_path.exists():
+        print(f"\nNo baseline ({baseline_path}), run with --save-baseline to store one")
+        sys.exit(1 if failed else 0)
+    regressions = compare(results, json.loads(baseline_path.read_text()))
+    sys.exit(1 if regressions or failed else 0)
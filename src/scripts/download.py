@@ -0,0 +1,293 @@
+"""
+Resumable, verified HTTP downloads for the raw IGN archives.
+
+Files are downloaded to <name>.part with a pooled requests Session. An
+interrupted download is resumed with an HTTP Range request, conditional
+on the ETag or Last-Modified of the first response (If-Range, kept in
+<name>.part.validator) so that a file changed upstream is downloaded
+again from scratch. Transient errors are retried with exponential
+backoff, and the file is only renamed to its final name once its size
+(and checksum when known) is verified, so a partial file is never
+mistaken for a complete one.
+"""
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = (10, 60)  # Connect and read timeouts (seconds)
+RETRIES = 5
+BACKOFF = 2.0  # First retry delay (seconds), doubled at each attempt
+MAX_BACKOFF = 60.0
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    """Download that failed permanently or could not be verified."""
+
+
+@dataclass
+class DownloadStats:
+    url: str
+    path: Path
+    bytes: int = 0  # Bytes transferred by this run
+    size: int = 0  # Final file size
+    seconds: float = 0.0
+    attempts: int = 0
+    resumed_from: int = 0
+
+    @property
+    def throughput(self):
+        """Mean transfer rate (bytes per second)."""
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+
+class ProgressReporter:
+    """Print the progress of concurrent downloads every `step` percent."""
+
+    def __init__(self, step=10):
+        self.step = step
+        self._lock = threading.Lock()
+        self._last = {}
+        self._start = {}
+
+    def __call__(self, name, done, total):
+        now = time.monotonic()
+        with self._lock:
+            start = self._start.setdefault(name, (now, done))
+            if not total:
+                return
+            percent = int(100 * done / total) // self.step * self.step
+            if percent <= self._last.get(name, -1):
+                return
+            self._last[name] = percent
+        elapsed = now - start[0]
+        rate = (done - start[1]) / elapsed / 1e6 if elapsed > 0 else 0.0
+        print(f"  {name}: {percent}% ({done / 1e6:.1f}/{total / 1e6:.1f} MB, {rate:.1f} MB/s)")
+
+
+def make_session(proxies=None, headers=None, pool_size=10):
+    """Session sharing pooled connections between threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if proxies:
+        session.proxies.update(proxies)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def parse_checksum(checksum):
+    """Split an "algorithm:hexdigest" checksum (sha256 by default)."""
+    if checksum is None:
+        return None
+    algorithm, _, digest = checksum.rpartition(":")
+    return (algorithm or "sha256").lower(), digest.lower()
+
+
+def file_checksum(path, algorithm="sha256"):
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify(path, size=None, checksum=None):
+    """Raise DownloadError if a file does not have the expected size or checksum."""
+    actual_size = Path(path).stat().st_size
+    if size is not None and actual_size != size:
+        raise DownloadError(f"{Path(path).name}: size {actual_size} != expected {size}")
+    expected = parse_checksum(checksum)
+    if expected:
+        algorithm, digest = expected
+        actual = file_checksum(path, algorithm)
+        if actual != digest:
+            raise DownloadError(f"{Path(path).name}: {algorithm} {actual} != expected {digest}")
+
+
+def _validator_path(part_path):
+    """File keeping the ETag or Last-Modified of the response a part file was started from."""
+    return part_path.with_name(part_path.name + ".validator")
+
+
+def _discard(part_path):
+    """Remove a part file and its validator."""
+    part_path.unlink(missing_ok=True)
+    _validator_path(part_path).unlink(missing_ok=True)
+
+
+def _response_validator(response):
+    """Strong ETag, or Last-Modified date, identifying the version of a file (None when unknown)."""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def remote_size(session, url, timeout=TIMEOUT):
+    """Size announced by the server (None when unknown)."""
+    response = session.head(url, allow_redirects=True, timeout=timeout)
+    response.raise_for_status()
+    length = response.headers.get("Content-Length")
+    return int(length) if length is not None else None
+
+
+def _total_size(response, offset):
+    """Full file size from a 200 or 206 response (None when unknown)."""
+    content_range = response.headers.get("Content-Range")
+    if response.status_code == 206 and content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total != "*" else None
+    length = response.headers.get("Content-Length")
+    if length is None:
+        return None
+    return int(length) + (offset if response.status_code == 206 else 0)
+
+
+def _transfer(session, url, part_path, stats, timeout, progress):
+    """
+    Download or resume url into part_path and return the full file size
+    and the offset the transfer was resumed from.
+
+    Resumes from the current size of part_path; restarts from scratch when
+    the server ignores the Range request or the file changed (If-Range),
+    and when a part file reported complete (416) does not have the size
+    of the remote file.
+    """
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    validator_path = _validator_path(part_path)
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        if validator_path.exists():
+            headers["If-Range"] = validator_path.read_text()
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416 and offset:
+            # Nothing left to download if the part file has the size of the remote file
+            content_range = response.headers.get("Content-Range", "")
+            total = content_range.rsplit("/", 1)[1] if "/" in content_range else "*"
+            total = int(total) if total != "*" else remote_size(session, url, timeout)
+            if total == offset:
+                return offset, offset
+            print(f"  Stale {part_path.name} ({offset} bytes, remote file {total}), restarting from scratch")
+            _discard(part_path)
+            return _transfer(session, url, part_path, stats, timeout, progress)
+        response.raise_for_status()
+        if offset and response.status_code != 206:
+            offset = 0
+        if offset and not stats.resumed_from:
+            stats.resumed_from = offset
+        if not offset:
+            validator = _response_validator(response)
+            if validator:
+                validator_path.write_text(validator)
+            else:
+                validator_path.unlink(missing_ok=True)
+        total = _total_size(response, offset)
+
+        done = offset
+        with open(part_path, "ab" if offset else "wb") as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if not chunk:
+                    continue
+                f.write(chunk)
+                done += len(chunk)
+                stats.bytes += len(chunk)
+                if progress:
+                    progress(part_path.name[:-len(".part")], done, total)
+
+    if total is not None and done < total:
+        raise requests.exceptions.ChunkedEncodingError(f"Connection closed at {done}/{total} bytes")
+    return (total if total is not None else done), offset
+
+
+def download(session, url, dest, size=None, checksum=None, retries=RETRIES, backoff=BACKOFF,
+             timeout=TIMEOUT, progress=None):
+    """
+    Download url to dest, resuming dest.part and verifying it before the rename.
+
+    Parameters:
+    - session: requests Session (see make_session)
+    - url: URL of the file
+    - dest: Final path of the file
+    - size: Expected size in bytes (server Content-Length/Content-Range otherwise)
+    - checksum: Expected "algorithm:hexdigest" (e.g. "md5:...", sha256 if no prefix)
+    - retries: Retries after a transient error (connection, timeout, 408/429/5xx).
+      A file failing its verification is only downloaded again when it was
+      resumed (stale part file), once from scratch: a whole download that
+      does not match will not match on retry
+    - backoff: First retry delay in seconds, doubled at each retry
+    - progress: Optional callable(name, bytes done, total bytes)
+
+    Raises DownloadError when the file cannot be downloaded or verified.
+    """
+    dest = Path(dest)
+    part_path = dest.with_name(dest.name + ".part")
+    stats = DownloadStats(url=url, path=dest)
+    start = time.monotonic()
+
+    for attempt in range(retries + 1):
+        stats.attempts = attempt + 1
+        try:
+            total, offset = _transfer(session, url, part_path, stats, timeout, progress)
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status not in RETRY_STATUS or attempt == retries:
+                raise DownloadError(f"{url}: HTTP {status}") from e
+            error = e
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == retries:
+                raise DownloadError(f"{url}: {e}") from e
+            error = e
+        else:
+            try:
+                verify(part_path, size if size is not None else total, checksum)
+            except DownloadError as e:
+                _discard(part_path)
+                if not offset or attempt == retries:
+                    raise DownloadError(f"{url}: {e}") from e
+                # Resumed from a stale part file: restart from scratch at once
+                print(f"  {dest.name} resumed from a stale part file, restarting from scratch ({e})")
+                continue
+            os.replace(part_path, dest)
+            _validator_path(part_path).unlink(missing_ok=True)
+            stats.size = dest.stat().st_size
+            stats.seconds = time.monotonic() - start
+            return stats
+        delay = min(backoff * 2 ** attempt, MAX_BACKOFF)
+        print(f"  Retry {attempt + 1}/{retries} for {dest.name} in {delay:.0f}s ({error})")
+        time.sleep(delay)
+
+
+def download_all(session, files, workers=3, progress=None, **kwargs):
+    """
+    Download files concurrently, at most `workers` at a time.
+
+    Parameters:
+    - files: List of (url, dest, size, checksum), size and checksum may be None
+    - kwargs: Passed to download (retries, backoff, timeout)
+
+    Returns (list of DownloadStats, list of (url, error)).
+    """
+    results, errors = [], []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(download, session, url, dest, size, checksum, progress=progress, **kwargs): url
+            for url, dest, size, checksum in files
+        }
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except DownloadError as e:
+                errors.append((futures[future], str(e)))
+    return results, errors
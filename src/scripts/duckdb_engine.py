@@ -0,0 +1,149 @@
+"""
+DuckDB spatial engine of 06-generate-ngeo.py (MESH_ENGINE = "duckdb").
+
+The units of a mesh are built inside DuckDB: the commune GeoParquet file
+is scanned directly, joined with the membership table (a pandas frame
+scanned through Arrow), unioned per unit (ST_Union_Agg), and the surface,
+label point and boundary layers are written with COPY ... TO, using
+DuckDB's multithreaded execution instead of GeoPandas. As with
+geoparquet.write_geoparquet, rows are sorted along a Hilbert curve of the
+layer extent and get a bbox covering column; the geo metadata written by
+DuckDB is then completed (CRS, covering) by
+geoparquet.complete_geo_metadata.
+
+The layers DuckDB has no function for (shared borders, LOD pyramid,
+polylabel and layout label points) are still computed with shapely and
+GeoPandas, on the units table transferred through Arrow (fetch_units)
+rather than read back from the written files.
+
+Requires the DuckDB spatial extension: downloaded on first use, or loaded
+from the extension file named by NGEOFR_DUCKDB_SPATIAL (pinned version,
+offline builds).
+"""
+import json
+import os
+from functools import lru_cache
+
+import duckdb
+import geopandas as gpd
+import pyarrow.parquet as pq
+import shapely
+
+from geoparquet import COMPRESSION, COMPRESSION_LEVEL, COVERING_COLUMN, ROW_GROUP_SIZE, complete_geo_metadata
+from instrument import file_written
+
+# Label point of each unit for labels.LABEL_METHOD (polylabel has no SQL equivalent)
+LABEL_SQL = {
+    "centroid": "CASE WHEN ST_Contains(geometry, ST_Centroid(geometry)) THEN ST_Centroid(geometry) ELSE ST_PointOnSurface(geometry) END",
+    "representative": "ST_PointOnSurface(geometry)",
+}
+BOUNDARY_SQL = "ST_Boundary(geometry)"
+SPATIAL_EXTENSION = os.environ.get("NGEOFR_DUCKDB_SPATIAL")  # Path of a spatial .duckdb_extension file (None: download it)
+
+
+@lru_cache(maxsize=1)
+def connect(threads=None):
+    """In-memory DuckDB connection with the spatial extension (one per process)."""
+    con = duckdb.connect()
+    if SPATIAL_EXTENSION:
+        con.execute(f"LOAD {quote(SPATIAL_EXTENSION)}")
+    else:
+        con.execute("INSTALL spatial")
+        con.execute("LOAD spatial")
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+    return con
+
+
+def quote(value):
+    """SQL string literal."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def layer_crs(path):
+    """CRS (PROJJSON) of the geometry column of a GeoParquet file."""
+    geo = json.loads(pq.read_schema(path).metadata[b"geo"])
+    return geo["columns"][geo.get("primary_column", "geometry")].get("crs")
+
+
+def geometry_sql(con, source, alias):
+    """Geometry of a Parquet scan: converted from GeoParquet by DuckDB, or WKB to convert."""
+    types = dict(con.execute(f"SELECT column_name, column_type FROM (DESCRIBE SELECT * FROM {source})").fetchall())
+    geometry = f"{alias}.geometry"
+    return geometry if types["geometry"].startswith("GEOMETRY") else f"ST_GeomFromWKB({geometry})"
+
+
+def build_units(con, geom_path, membership, id_col, name_col, mesh_type):
+    """
+    Create the temporary table units (id_col, name_col, geometry) of a mesh
+    from a commune file and the (com_insee, id_col, name_col) membership
+    projection, as 06-generate-ngeo.mesh_units does. Returns the number of
+    units and the number of units with an empty or missing geometry.
+    """
+    source = f"read_parquet({quote(geom_path)})"
+    geometry = geometry_sql(con, source, "c")
+    columns = {name for name, in con.execute(f"SELECT column_name FROM (DESCRIBE SELECT * FROM {source})").fetchall()}
+    con.register("membership", membership)
+    try:
+        if mesh_type == "com":
+            # Communes as they are, named from the membership table when the file has no names
+            name = f"c.{name_col}" if name_col in columns else f"m.{name_col}"
+            query = f"""
+                SELECT c.com_insee AS {id_col}, {name} AS {name_col}, {geometry} AS geometry
+                FROM {source} c
+                LEFT JOIN (SELECT DISTINCT ON (com_insee) * FROM membership) m USING (com_insee)
+            """
+        else:
+            query = f"""
+                SELECT m.{id_col}, first(m.{name_col}) AS {name_col}, ST_Union_Agg({geometry}) AS geometry
+                FROM {source} c
+                JOIN membership m USING (com_insee)
+                WHERE m.{id_col} IS NOT NULL
+                GROUP BY m.{id_col}
+            """
+        con.execute(f"CREATE OR REPLACE TEMP TABLE units AS {query}")
+    finally:
+        con.unregister("membership")
+    return con.execute(
+        "SELECT count(*), count(*) FILTER (WHERE geometry IS NULL OR ST_IsEmpty(geometry)) FROM units"
+    ).fetchone()
+
+
+def export_layer(con, geometry, path, id_col, name_col, crs, compression_level=COMPRESSION_LEVEL, row_group_size=ROW_GROUP_SIZE):
+    """
+    Write a layer of the units table with COPY ... TO, geometry being an
+    SQL expression of the unit geometry (e.g. BOUNDARY_SQL). Rows are
+    sorted along a Hilbert curve of the layer extent and get a bbox
+    covering column. Returns the number of rows.
+    """
+    query = f"""
+        WITH layer AS (
+            SELECT {id_col}, {name_col}, {geometry} AS geometry FROM units
+        ),
+        bounds AS (
+            SELECT *, ST_XMin(geometry) AS xmin, ST_YMin(geometry) AS ymin, ST_XMax(geometry) AS xmax, ST_YMax(geometry) AS ymax
+            FROM layer
+        ),
+        extent AS (
+            SELECT {{'min_x': min(xmin), 'min_y': min(ymin), 'max_x': max(xmax), 'max_y': max(ymax)}}::BOX_2D AS box FROM bounds
+        )
+        SELECT {id_col}, {name_col}, geometry,
+               {{'xmin': xmin, 'ymin': ymin, 'xmax': xmax, 'ymax': ymax}} AS {COVERING_COLUMN}
+        FROM bounds, extent
+        ORDER BY ST_Hilbert((xmin + xmax) / 2, (ymin + ymax) / 2, extent.box)
+    """
+    con.execute(
+        f"COPY ({query}) TO {quote(path)} "
+        f"(FORMAT parquet, COMPRESSION {COMPRESSION}, COMPRESSION_LEVEL {int(compression_level)}, ROW_GROUP_SIZE {int(row_group_size)})"
+    )
+    complete_geo_metadata(path, crs, compression_level=compression_level, row_group_size=row_group_size)
+    rows = pq.ParquetFile(path).metadata.num_rows
+    file_written(path, rows=rows)
+    return rows
+
+
+def fetch_units(con, id_col, name_col, crs):
+    """GeoDataFrame of the units table, transferred through Arrow as WKB."""
+    table = con.execute(f"SELECT {id_col}, {name_col}, ST_AsWKB(geometry)::BLOB AS geometry FROM units").to_arrow_table()
+    geometry = shapely.from_wkb(table.column("geometry").to_numpy(zero_copy_only=False))
+    return gpd.GeoDataFrame(table.drop_columns(["geometry"]).to_pandas(), geometry=geometry, crs=crs)
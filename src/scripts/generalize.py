@@ -0,0 +1,192 @@
+"""
+Line generalization algorithms over arc coordinate arrays.
+
+In-process equivalents of the GRASS v.generalize methods used for the
+generalized layers (douglas, reumann, sliding_averaging, chaiken). Arcs
+are handled as one flat (n, 2) coordinate array with the start offset of
+each arc, and every algorithm works on all arcs at once. Arc endpoints
+are never moved, so arcs shared by two communes stay coincident.
+
+https://grass.osgeo.org/grass-stable/manuals/v.generalize.html
+"""
+import numpy as np
+import shapely
+
+
+def arcs_to_arrays(arcs):
+    """Return the flat coordinates of the arcs and the start offset of each arc."""
+    coords, index = shapely.get_coordinates(arcs, return_index=True)
+    counts = np.bincount(index, minlength=len(arcs))
+    return coords, np.r_[0, np.cumsum(counts)]
+
+
+def arrays_to_arcs(coords, offsets):
+    """Build LineStrings from flat coordinates and arc offsets."""
+    index = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    return shapely.linestrings(coords, indices=index)
+
+
+def _arc_index(offsets):
+    """Arc of each coordinate, position in its arc and whether it is an endpoint."""
+    counts = np.diff(offsets)
+    arc = np.repeat(np.arange(len(counts)), counts)
+    position = np.arange(offsets[-1]) - offsets[arc]
+    endpoint = (position == 0) | (position == counts[arc] - 1)
+    return arc, position, endpoint
+
+
+def _compact(coords, offsets, keep):
+    """Keep the selected coordinates and recompute arc offsets."""
+    arc = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    counts = np.bincount(arc[keep], minlength=len(offsets) - 1)
+    return coords[keep], np.r_[0, np.cumsum(counts)]
+
+
+def douglas(coords, offsets, tolerance):
+    """Douglas-Peucker simplification (GEOS, vectorized over arcs)."""
+    arcs = shapely.simplify(arrays_to_arcs(coords, offsets), tolerance, preserve_topology=False)
+    return arcs_to_arrays(arcs)
+
+
+def reumann(coords, offsets, tolerance, window=64):
+    """
+    Reumann-Witkam simplification.
+
+    A strip of half-width tolerance follows the direction of the current
+    key segment; the last vertex inside the strip becomes the next key.
+    All arcs advance together, by windows of candidate vertices.
+    """
+    n_arcs = len(offsets) - 1
+    last = offsets[1:] - 1
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[offsets[:-1][np.diff(offsets) > 0]] = True
+    keep[last[np.diff(offsets) > 0]] = True
+
+    key = offsets[:-1].copy()
+    scan = key + 2
+    active = np.flatnonzero(scan <= last)
+    steps = np.arange(window)
+    while len(active):
+        k, s, e = key[active], scan[active], last[active]
+        direction = coords[k + 1] - coords[k]
+        norm = np.hypot(direction[:, 0], direction[:, 1])
+        norm[norm == 0] = 1.0
+
+        candidates = s[:, None] + steps[None, :]
+        valid = candidates <= e[:, None]
+        candidates = np.minimum(candidates, e[:, None])
+        offset = coords[candidates] - coords[k][:, None, :]
+        distance = np.abs(offset[..., 0] * direction[:, 1, None] - offset[..., 1] * direction[:, 0, None]) / norm[:, None]
+        outside = (distance > tolerance) & valid
+
+        found = outside.any(axis=1)
+        first = np.argmax(outside, axis=1)
+        new_key = candidates[np.arange(len(active)), first] - 1
+        keep[new_key[found]] = True
+
+        key[active[found]] = new_key[found]
+        scan[active[found]] = new_key[found] + 2
+        scan[active[~found]] += window
+        active = active[scan[active] <= last[active]]
+
+    return _compact(coords, offsets, keep)
+
+
+def sliding_averaging(coords, offsets, look_ahead=7, slide=0.5):
+    """
+    Sliding averaging smoothing.
+
+    Each inner vertex moves by slide towards the mean of the look_ahead
+    vertices centred on it (windows are clipped to the arc).
+    """
+    arc, position, endpoint = _arc_index(offsets)
+    half = look_ahead // 2
+    lo = np.maximum(np.arange(len(coords)) - half, offsets[arc])
+    hi = np.minimum(np.arange(len(coords)) + half, offsets[arc + 1] - 1)
+
+    cumulative = np.vstack([np.zeros((1, 2)), np.cumsum(coords, axis=0)])
+    mean = (cumulative[hi + 1] - cumulative[lo]) / (hi - lo + 1)[:, None]
+    smoothed = coords + slide * (mean - coords)
+    smoothed[endpoint] = coords[endpoint]
+    return smoothed, offsets
+
+
+def chaiken(coords, offsets, threshold=0.0, iterations=1):
+    """
+    Chaikin corner cutting.
+
+    Each segment is replaced by its points at 1/4 and 3/4, endpoints are
+    kept. Inner vertices closer than threshold to the previous vertex are
+    then dropped.
+    """
+    for _ in range(iterations):
+        counts = np.diff(offsets)
+        arc, position, endpoint = _arc_index(offsets)
+        is_last = position == counts[arc] - 1
+        starts, ends = coords[~is_last], coords[np.flatnonzero(~is_last) + 1]
+        seg_arc = arc[~is_last]
+
+        quarter = 0.75 * starts + 0.25 * ends
+        three_quarters = 0.25 * starts + 0.75 * ends
+        cut = np.empty((2 * len(starts), 2))
+        cut[0::2], cut[1::2] = quarter, three_quarters
+        cut_arc = np.repeat(seg_arc, 2)
+
+        first, final = coords[offsets[:-1][counts > 0]], coords[offsets[1:][counts > 0] - 1]
+        arcs_with_coords = np.flatnonzero(counts > 0)
+        new_coords = np.concatenate([first, cut, final])
+        new_arc = np.concatenate([arcs_with_coords, cut_arc, arcs_with_coords])
+        rank = np.concatenate([
+            np.zeros(len(first)),
+            np.arange(len(cut)) + 1.0,
+            np.full(len(final), len(cut) + 1.0),
+        ])
+        order = np.lexsort((rank, new_arc))
+        coords = new_coords[order]
+        offsets = np.r_[0, np.cumsum(np.bincount(new_arc, minlength=len(counts)))]
+
+    if threshold > 0:
+        arc, position, endpoint = _arc_index(offsets)
+        step = np.r_[np.inf, np.hypot(*np.diff(coords, axis=0).T)]
+        keep = endpoint | (step >= threshold)
+        coords, offsets = _compact(coords, offsets, keep)
+    return coords, offsets
+
+
+ALGORITHMS = {
+    "douglas": douglas,
+    "reumann": reumann,
+    "sliding_averaging": sliding_averaging,
+    "chaiken": chaiken,
+}
+
+# Algorithms whose main parameter is the simplification tolerance
+TOLERANCE_ALGORITHMS = {"douglas", "reumann"}
+
+
+def generalize_arcs(arcs, steps, tolerance=None):
+    """
+    Apply a sequence of generalization steps to arcs.
+
+    Parameters:
+    - arcs: Array of LineStrings
+    - steps: List of (algorithm name, parameters) applied in order
+    - tolerance: Default tolerance for douglas/reumann steps without one
+
+    Closed arcs (islands, enclaves) that collapse below a ring are kept
+    unchanged.
+    """
+    coords, offsets = arcs_to_arrays(arcs)
+    for name, params in steps:
+        if name not in ALGORITHMS:
+            raise ValueError(f"Unknown generalization algorithm: {name}")
+        params = dict(params)
+        if name in TOLERANCE_ALGORITHMS:
+            params.setdefault("tolerance", tolerance)
+        coords, offsets = ALGORITHMS[name](coords, offsets, **params)
+
+    generalized = arrays_to_arcs(coords, offsets)
+    closed = shapely.is_closed(arcs)
+    collapsed = closed & (shapely.get_num_coordinates(generalized) < 4)
+    generalized[collapsed] = arcs[collapsed]
+    return generalized
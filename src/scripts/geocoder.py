@@ -0,0 +1,259 @@
+"""
+Batch reverse geocoding of points to communes and their meshes.
+
+A ReverseGeocoder holds the commune surfaces of a layer, a packed STRtree
+over them with prepared geometries, and the membership codes of each
+commune (arr, dep, reg, epci, ept, epciept). Lookups are vectorized over
+NumPy coordinate arrays, processed by batches, and can be sharded over
+worker processes.
+
+The index is persisted as a NumPy archive of the polygon coordinate
+arrays (shapely ragged arrays) and codes, so loading it only rebuilds the
+tree, without decoding WKB:
+
+    python src/scripts/geocoder.py --territory frdrom
+    geocoder = ReverseGeocoder.load("./src/processed_data/geocoder/com-frdrom-2025.npz")
+    codes = geocoder.geocode(lon, lat, crs=4326)
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import CRS, Transformer
+
+from settings import COG_YEAR
+
+ID_COL = "com_insee"
+MESH_COLUMNS = ["arr_insee", "dep_insee", "reg_insee", "epci_siren", "ept_siren", "epciept_siren"]
+INDEX_DIR = Path("./src/processed_data/geocoder")
+BATCH_SIZE = 1_000_000  # Points per tree query (bounds peak memory)
+
+
+class ReverseGeocoder:
+    """Point-in-polygon lookup of communes and their mesh codes."""
+
+    def __init__(self, geometries, codes, crs):
+        """
+        Parameters:
+        - geometries: Array of commune (Multi)Polygons
+        - codes: {column: array of codes aligned on geometries}, including ID_COL
+        - crs: CRS of the geometries
+        """
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.codes = {col: np.asarray(values) for col, values in codes.items()}
+        self.crs = CRS.from_user_input(crs)
+        self._transformers = {}
+        self._build()
+
+    def _build(self):
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+    @classmethod
+    def from_frame(cls, communes, membership=None, columns=MESH_COLUMNS):
+        """
+        Build from a commune GeoDataFrame (ID_COL, geometry) and the membership table.
+
+        Mesh columns missing from the membership table are ignored.
+        """
+        communes = communes[~(communes.geometry.isna() | communes.geometry.is_empty)].reset_index(drop=True)
+        codes = {ID_COL: communes[ID_COL].astype(str).to_numpy()}
+        if membership is not None:
+            columns = [col for col in columns if col in membership.columns]
+            aligned = communes[[ID_COL]].merge(
+                membership[[ID_COL] + columns].drop_duplicates(ID_COL), on=ID_COL, how="left"
+            )
+            for col in columns:
+                codes[col] = aligned[col].fillna("").astype(str).to_numpy()
+        return cls(communes.geometry.values, codes, communes.crs)
+
+    # Persistence (also used to send the geocoder to worker processes)
+
+    def __getstate__(self):
+        geometry_type, coords, offsets = shapely.to_ragged_array(self.geometries)
+        return {
+            "geometry_type": int(geometry_type),
+            "coords": coords,
+            "offsets": list(offsets),
+            "codes": self.codes,
+            "crs": self.crs.to_wkt(),
+        }
+
+    def __setstate__(self, state):
+        self.geometries = shapely.from_ragged_array(
+            shapely.GeometryType(state["geometry_type"]), state["coords"], tuple(state["offsets"])
+        )
+        self.codes = state["codes"]
+        self.crs = CRS.from_wkt(state["crs"])
+        self._transformers = {}
+        self._build()
+
+    def save(self, path):
+        """Write the index to a .npz archive."""
+        state = self.__getstate__()
+        arrays = {
+            "geometry_type": np.array(state["geometry_type"]),
+            "coords": state["coords"],
+            "crs": np.array(state["crs"]),
+            "columns": np.array(list(state["codes"])),
+        }
+        arrays.update({f"offsets_{i}": offsets for i, offsets in enumerate(state["offsets"])})
+        arrays.update({f"code_{col}": values.astype(str) for col, values in state["codes"].items()})
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()."""
+        with np.load(path, allow_pickle=False) as archive:
+            n_offsets = sum(1 for name in archive.files if name.startswith("offsets_"))
+            state = {
+                "geometry_type": int(archive["geometry_type"]),
+                "coords": archive["coords"],
+                "offsets": [archive[f"offsets_{i}"] for i in range(n_offsets)],
+                "codes": {str(col): archive[f"code_{col}"] for col in archive["columns"]},
+                "crs": str(archive["crs"]),
+            }
+        geocoder = cls.__new__(cls)
+        geocoder.__setstate__(state)
+        return geocoder
+
+    # Lookups
+
+    def lookup(self, x, y, batch_size=BATCH_SIZE):
+        """
+        Index of the commune containing each point (-1 outside all communes).
+
+        Coordinates are in the CRS of the index. Points exactly on a border
+        are not inside any commune; a point inside several (overlapping)
+        communes is assigned to the first one in index order.
+        """
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        result = np.full(len(x), -1, dtype=np.int64)
+        for start in range(0, len(x), batch_size):
+            bx, by = x[start:start + batch_size], y[start:start + batch_size]
+            # Bounding box candidates, then point-in-polygon tests on the prepared
+            # communes, grouped by commune so each prepared geometry stays in cache
+            point_idx, commune_idx = self.tree.query(shapely.points(bx, by))
+            order = np.argsort(commune_idx, kind="stable")
+            point_idx, commune_idx = point_idx[order], commune_idx[order]
+            inside = shapely.contains_xy(self.geometries[commune_idx], bx[point_idx], by[point_idx])
+            point_idx, commune_idx = point_idx[inside], commune_idx[inside]
+            # Keep the lowest commune index per point
+            order = np.lexsort((commune_idx, point_idx))
+            point_idx, commune_idx = point_idx[order], commune_idx[order]
+            first = np.r_[True, point_idx[1:] != point_idx[:-1]]
+            result[start + point_idx[first]] = commune_idx[first]
+        return result
+
+    def lookup_sharded(self, x, y, workers=os.cpu_count(), batch_size=BATCH_SIZE):
+        """lookup() over shards of the points processed by worker processes."""
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        if workers <= 1 or len(x) <= batch_size:
+            return self.lookup(x, y, batch_size)
+        shards = np.array_split(np.arange(len(x)), workers)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,)) as executor:
+            results = executor.map(_lookup_shard, [(x[s], y[s], batch_size) for s in shards])
+            return np.concatenate(list(results))
+
+    def transform(self, x, y, crs):
+        """Project coordinates from crs to the CRS of the index."""
+        crs = CRS.from_user_input(crs)
+        if crs == self.crs:
+            return np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        key = crs.to_wkt()
+        if key not in self._transformers:
+            self._transformers[key] = Transformer.from_crs(crs, self.crs, always_xy=True)
+        return self._transformers[key].transform(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+
+    def geocode(self, x, y, crs=4326, workers=1, batch_size=BATCH_SIZE):
+        """
+        Commune and mesh codes of points.
+
+        Parameters:
+        - x, y: Coordinate arrays (longitude, latitude for EPSG:4326)
+        - crs: CRS of the coordinates
+        - workers: Worker processes (1 = in process)
+
+        Returns a DataFrame with one row per point and one column per code
+        (None outside all communes).
+        """
+        x, y = self.transform(x, y, crs)
+        index = self.lookup_sharded(x, y, workers, batch_size) if workers > 1 else self.lookup(x, y, batch_size)
+        found = index >= 0
+        result = {}
+        for col, values in self.codes.items():
+            column = np.full(len(index), None, dtype=object)
+            column[found] = values[index[found]]
+            result[col] = column
+        return pd.DataFrame(result)
+
+
+# Geocoder of the current worker process (set by _init_worker)
+_worker_geocoder = None
+
+
+def _init_worker(geocoder):
+    global _worker_geocoder
+    _worker_geocoder = geocoder
+
+
+def _lookup_shard(args):
+    x, y, batch_size = args
+    return _worker_geocoder.lookup(x, y, batch_size)
+
+
+def index_path(territory="frdrom", year=COG_YEAR, gen=False, index_dir=INDEX_DIR):
+    return Path(index_dir) / f"com-{territory}-{year}{'-gen' if gen else ''}.npz"
+
+
+def build_index(territory="frdrom", year=None, gen=False, public_dir=None, membership=None, output=None):
+    """
+    Build and save the index of the commune surfaces of a territory.
+
+    Parameters:
+    - territory: Territory of the public/ layer (frdrom covers metropolitan France and the DROM)
+    - year: COG year of the layer (newest one in public/ by default)
+    - gen: Use the generalized layer (faster, approximate near borders) instead of the standard one
+    - membership: Membership table (see membership.py), mesh codes are omitted without it
+    - output: Index file (index_path() by default)
+    """
+    import ngeofr
+
+    if year is None:
+        # Year of the layer ngeofr.load picks, for the name of the index
+        year = ngeofr.layer_path("com", territory, gen=gen, root=public_dir).name.split("-")[2]
+    communes = ngeofr.load("com", territory=territory, gen=gen, year=year, columns=[], root=public_dir)
+    geocoder = ReverseGeocoder.from_frame(communes, membership)
+    output = output or index_path(territory, year, gen)
+    geocoder.save(output)
+    print(f"Index saved: {output} ({len(geocoder.geometries)} communes, columns {list(geocoder.codes)})")
+    return geocoder
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the reverse geocoding index of a commune layer")
+    parser.add_argument("--territory", default="frdrom", help="Territory of the public/ commune layer")
+    parser.add_argument("--year", help="COG year of the layer (newest one in public/ by default)")
+    parser.add_argument("--gen", action="store_true", help="Index the generalized commune layer")
+    parser.add_argument("--db", help="ngeofr DuckDB database (membership codes)")
+    parser.add_argument("--epci-ept-query", help="query_epci_ept.sql file")
+    parser.add_argument("--cache-dir", default="./src/processed_data/cache", help="Membership cache directory")
+    parser.add_argument("--output", help="Index file")
+    args = parser.parse_args()
+
+    from membership import load_membership
+    try:
+        membership = load_membership(args.db or "", args.epci_ept_query or "", args.cache_dir)
+    except FileNotFoundError as e:
+        print(f"{e}: mesh codes omitted")
+        membership = None
+
+    start = time.perf_counter()
+    build_index(args.territory, args.year, args.gen, membership=membership, output=args.output)
+    print(f"Built in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,171 @@
+"""
+GeoParquet writer shared by the pipeline stages.
+
+Files are written as GeoParquet 1.1 with a bbox covering column (xmin,
+ymin, xmax, ymax per row), rows sorted along a Hilbert curve and small
+row groups. Neighbouring features end up in the same row groups, so the
+min/max statistics of the bbox column let pyarrow, GeoPandas
+(read_parquet(bbox=...)) or DuckDB skip most of a file for a bbox query.
+
+Layers too large to be held in memory at once can be written in chunks
+(GeoParquetWriter), each chunk being sorted and appended as row groups.
+Files written by other tools (DuckDB COPY ... TO) get the same geo
+metadata with complete_geo_metadata.
+"""
+import io
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrument import file_written
+
+COMPRESSION = "zstd"
+COMPRESSION_LEVEL = 9  # zstd level (1 fastest to 22 smallest)
+ROW_GROUP_SIZE = 1024  # Rows per row group
+HILBERT_LEVEL = 16  # Hilbert curve resolution (2^level cells per axis)
+SCHEMA_VERSION = "1.1.0"
+COVERING_COLUMN = "bbox"
+
+
+def hilbert_sort(gdf, level=HILBERT_LEVEL):
+    """Sort rows along a Hilbert curve of their bounding box centres (missing/empty geometries last)."""
+    present = ~(gdf.geometry.isna() | gdf.geometry.is_empty).to_numpy()
+    if not present.any():
+        return gdf.reset_index(drop=True)
+    distance = np.full(len(gdf), np.iinfo(np.uint64).max, dtype=np.uint64)
+    distance[present] = gdf.geometry[present].hilbert_distance(level=level).to_numpy()
+    order = np.argsort(distance, kind="stable")
+    return gdf.iloc[order].reset_index(drop=True)
+
+
+def write_geoparquet(gdf, path, compression_level=COMPRESSION_LEVEL, row_group_size=ROW_GROUP_SIZE, sort=True):
+    """
+    Write a GeoDataFrame as spatially sorted GeoParquet 1.1.
+
+    Parameters:
+    - gdf: GeoDataFrame to write (its index is not written)
+    - path: Output file
+    - compression_level: zstd compression level
+    - row_group_size: Rows per row group
+    - sort: Sort rows along a Hilbert curve before writing
+    """
+    if sort:
+        gdf = hilbert_sort(gdf)
+    gdf = gdf.drop(columns=[COVERING_COLUMN], errors="ignore")
+    gdf.to_parquet(
+        path,
+        index=False,
+        compression=COMPRESSION,
+        compression_level=compression_level,
+        schema_version=SCHEMA_VERSION,
+        write_covering_bbox=True,
+        row_group_size=row_group_size,
+    )
+    file_written(path, rows=len(gdf))
+
+
+class GeoParquetWriter:
+    """
+    GeoParquet 1.1 file written in chunks (e.g. one per partition of a
+    layer). Each chunk is sorted along its own Hilbert curve and appended
+    as row groups; the bbox and geometry types of the geo metadata cover
+    all chunks. Nothing is written when no chunk has rows.
+    """
+
+    def __init__(self, path, compression_level=COMPRESSION_LEVEL, row_group_size=ROW_GROUP_SIZE, sort=True):
+        self.path = path
+        self.compression_level = compression_level
+        self.row_group_size = row_group_size
+        self.sort = sort
+        self.rows = 0
+        self._writer = None
+        self._metadata = None
+        self._geo = None
+
+    def write(self, gdf):
+        """Append the rows of a GeoDataFrame (same columns for every chunk)."""
+        if gdf.empty:
+            return
+        if self.sort:
+            gdf = hilbert_sort(gdf)
+        gdf = gdf.drop(columns=[COVERING_COLUMN], errors="ignore")
+        # Arrow table and metadata (pandas, geo) as written by GeoPandas
+        buffer = io.BytesIO()
+        gdf.to_parquet(buffer, index=False, compression=None, schema_version=SCHEMA_VERSION, write_covering_bbox=True)
+        table = pq.read_table(pa.BufferReader(buffer.getvalue()))
+        metadata = table.schema.metadata
+        geo = json.loads(metadata[b"geo"])
+        table = table.replace_schema_metadata(None)
+
+        if self._writer is None:
+            # The metadata is written in the footer on close, once the bbox of all chunks is known
+            self._writer = pq.ParquetWriter(
+                self.path, table.schema, compression=COMPRESSION, compression_level=self.compression_level,
+                store_schema=False,
+            )
+            self._metadata = {key: value for key, value in metadata.items() if key != b"geo"}
+            self._geo = geo
+        else:
+            # Columns with no value in a chunk (all null) take the type of the first chunk
+            table = table.cast(self._writer.schema)
+            for name, column in self._geo["columns"].items():
+                chunk = geo["columns"][name]
+                if "bbox" in column and "bbox" in chunk:
+                    column["bbox"] = [
+                        *np.minimum(column["bbox"][:2], chunk["bbox"][:2]).tolist(),
+                        *np.maximum(column["bbox"][2:], chunk["bbox"][2:]).tolist(),
+                    ]
+                column["geometry_types"] = sorted(set(column["geometry_types"]) | set(chunk["geometry_types"]))
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows += len(gdf)
+
+    def close(self):
+        """Write the geo metadata and close the file."""
+        if self._writer is None:
+            return
+        self._writer.add_key_value_metadata({**self._metadata, b"geo": json.dumps(self._geo)})
+        self._writer.close()
+        self._writer = None
+        file_written(self.path, rows=self.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def complete_geo_metadata(path, crs, compression_level=COMPRESSION_LEVEL, row_group_size=ROW_GROUP_SIZE):
+    """
+    Complete the geo metadata of a GeoParquet file written by another tool
+    (e.g. DuckDB, which leaves out the CRS): schema version, CRS (PROJJSON)
+    and bbox covering. The file is rewritten row group by row group, only
+    when its metadata differs.
+    """
+    source = pq.ParquetFile(path)
+    schema = source.schema_arrow
+    metadata = dict(schema.metadata or {})
+    geo = json.loads(metadata.get(b"geo", b"{}")) or {"primary_column": "geometry", "columns": {}}
+    name = geo.get("primary_column", "geometry")
+    column = dict(geo["columns"].get(name, {"encoding": "WKB", "geometry_types": []}))
+    column["crs"] = crs
+    if COVERING_COLUMN in schema.names:
+        column["covering"] = {COVERING_COLUMN: {key: [COVERING_COLUMN, key] for key in ("xmin", "ymin", "xmax", "ymax")}}
+    if geo.get("version") == SCHEMA_VERSION and geo["columns"].get(name) == column:
+        return
+    geo["version"] = SCHEMA_VERSION
+    geo["columns"][name] = column
+    metadata[b"geo"] = json.dumps(geo).encode()
+
+    schema = schema.with_metadata(metadata)
+    temp_path = Path(path).with_suffix(f".{os.getpid()}.tmp")
+    with pq.ParquetWriter(temp_path, schema, compression=COMPRESSION, compression_level=compression_level) as writer:
+        for index in range(source.num_row_groups):
+            writer.write_table(source.read_row_group(index).replace_schema_metadata(metadata), row_group_size=row_group_size)
+    source.close()
+    os.replace(temp_path, path)
@@ -0,0 +1,238 @@
+"""
+Run report shared by the pipeline stages (00 to 06).
+
+A stage opens a RunReport for the duration of its run; nested timing
+spans are then recorded per stage step and per (territory, mesh, kind),
+each with its duration, the resident set size of the process, and the
+counters the step fills in: rows in/out, vertices before and after
+simplification or dissolve. Every file written through geoparquet.py (or
+declared with file_written) is added with its size to the innermost span.
+
+The report is saved as JSON (run summary, spans and files) and as a
+Parquet table of the spans, one pair of files per run in REPORT_DIR, so
+runs can be compared over time. Spans recorded in worker processes (or
+threads, with a report activated for the thread) are sent back to the
+main process and merged.
+
+Setting NGEOFR_PROFILE to a comma-separated list of stages (or "all")
+also runs these stages under cProfile (main process only), the statistics
+being written next to the report (<stage>-<run>.prof).
+"""
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import count
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from settings import PATHS
+
+REPORT_DIR = PATHS["processed_data"] / "reports" / "runs"
+PROFILE_STAGES = [s for s in os.environ.get("NGEOFR_PROFILE", "").split(",") if s]
+
+# Report of the current process and of the current thread (set by RunReport.activate)
+_active = None
+_local = threading.local()
+# Span numbers, shared by the reports of the process so that ids stay unique
+# when a worker process runs several tasks, each with its own report
+_span_ids = count()
+
+
+def rss_mb(peak=False):
+    """Resident set size of the process (MB), or its high-water mark."""
+    field = "VmHWM:" if peak else "VmRSS:"
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith(field):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # No /proc: peak only (kB on Linux, bytes on macOS)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def vertices(geometries):
+    """Total number of coordinates of a geometry array or GeoSeries."""
+    return int(shapely.get_num_coordinates(np.asarray(geometries, dtype=object)).sum())
+
+
+class RunReport:
+    """Timing spans, counters and written files of one run of a stage."""
+
+    def __init__(self, stage, report_dir=REPORT_DIR, profile=None):
+        self.stage = stage
+        self.report_dir = Path(report_dir)
+        self.run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{os.getpid()}"
+        self.profile = profile if profile is not None else (stage in PROFILE_STAGES or "all" in PROFILE_STAGES)
+        self.spans = []
+        self.files = []
+        self._stack = []
+        self._profiler = None
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Time a step; yields the span record, whose counters (rows_in,
+        rows_out, vertices_in, vertices_out, ...) can be filled in.
+        """
+        record = {
+            "id": f"{os.getpid()}-{next(_span_ids)}",
+            "parent": self._stack[-1]["id"] if self._stack else None,
+            "stage": self.stage,
+            "name": name,
+            **labels,
+            "pid": os.getpid(),
+            "start": time.time(),
+            "bytes_written": 0,
+        }
+        self._stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = str(e)
+            raise
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            record["rss_mb"] = rss_mb()
+            record["peak_rss_mb"] = rss_mb(peak=True)
+            self._stack.remove(record)
+            self.spans.append(record)
+
+    def add(self, **counters):
+        """Set counters of the innermost open span."""
+        if self._stack:
+            self._stack[-1].update(counters)
+
+    def file_written(self, path, **labels):
+        """Record a written file and add its size to the open spans."""
+        size = Path(path).stat().st_size
+        self.files.append({"path": str(path), "bytes": size, "span": self._stack[-1]["id"] if self._stack else None, **labels})
+        for record in self._stack:
+            record["bytes_written"] += size
+
+    def take(self):
+        """Return and clear the spans and files recorded so far (sent back by workers)."""
+        spans, files = self.spans, self.files
+        self.spans, self.files = [], []
+        return spans, files
+
+    def merge(self, spans, files):
+        """Add the spans and files of a worker, under the currently open span."""
+        parent = self._stack[-1] if self._stack else None
+        for record in spans:
+            if record["parent"] is None and parent is not None:
+                record = {**record, "parent": parent["id"]}
+            self.spans.append(record)
+        self.files.extend(files)
+        for record in self._stack:
+            record["bytes_written"] += sum(f["bytes"] for f in files)
+
+    def activate(self, thread=False):
+        """Make this report receive the spans and files of the current process (or thread only)."""
+        global _active
+        if thread:
+            _local.report = self
+        else:
+            _active = self
+        return self
+
+    def deactivate(self):
+        """Stop receiving the spans and files of the current process or thread."""
+        global _active
+        if getattr(_local, "report", None) is self:
+            _local.report = None
+        if _active is self:
+            _active = None
+
+    def __enter__(self):
+        self.activate()
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._run = self.span("run")
+        self._run.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._run.__exit__(*exc)
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.report_dir.mkdir(parents=True, exist_ok=True)
+            self._profiler.dump_stats(self.report_dir / f"{self.stage}-{self.run_id}.prof")
+        self.save()
+        self.deactivate()
+        return False
+
+    def summary(self):
+        """Totals of the run."""
+        run = next((s for s in self.spans if s["name"] == "run" and s["parent"] is None), None)
+        return {
+            "stage": self.stage,
+            "run_id": self.run_id,
+            "seconds": run["seconds"] if run else None,
+            "peak_rss_mb": max((s["peak_rss_mb"] for s in self.spans), default=None),
+            "files": len(self.files),
+            "bytes_written": sum(f["bytes"] for f in self.files),
+            "errors": sum(1 for s in self.spans if "error" in s),
+        }
+
+    def save(self):
+        """Write the report as JSON and the spans as a Parquet table."""
+        self.report_dir.mkdir(parents=True, exist_ok=True)
+        path = self.report_dir / f"{self.stage}-{self.run_id}"
+        content = {"summary": self.summary(), "spans": self.spans, "files": self.files}
+        path.with_suffix(".json").write_text(json.dumps(content, indent=2, default=str))
+        if self.spans:
+            pd.DataFrame(self.spans).to_parquet(path.with_suffix(".parquet"), index=False)
+        return path.with_suffix(".json")
+
+
+class _NoReport:
+    """Stand-in when no report is active: spans are timed but not kept."""
+
+    @contextmanager
+    def span(self, name, **labels):
+        record = {"name": name, **labels}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+
+    def add(self, **counters):
+        pass
+
+    def file_written(self, path, **labels):
+        pass
+
+
+def current():
+    """Report of the current thread or process (a no-op stand-in when none is active)."""
+    report = getattr(_local, "report", None) or _active
+    return report if report is not None else _NoReport()
+
+
+def span(name, **labels):
+    """Span of the current process' report."""
+    return current().span(name, **labels)
+
+
+def add(**counters):
+    """Set counters (rows_in, vertices_out, ...) of the innermost open span."""
+    current().add(**counters)
+
+
+def file_written(path, **labels):
+    """Record a written file in the current process' report."""
+    current().file_written(path, **labels)
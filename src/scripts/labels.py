@@ -0,0 +1,143 @@
+"""
+Label points of polygon layers (centroid layers of 06-generate-ngeo.py).
+
+Points are computed for all geometries of a layer at once with vectorized
+shapely operations, using one of three methods:
+- "centroid": centroid, replaced by a point on the surface when outside
+- "representative": point on the surface (fast, always inside)
+- "polylabel": pole of inaccessibility, centre of the maximum inscribed
+  circle found to a tolerance (best label placement, slowest)
+
+Results are cached on disk by geometry hash (WKB of the normalized
+geometry), one file per layer, so a layer rebuilt with unchanged
+geometries (e.g. after a membership change) does not recompute them.
+Geometries that are affine copies of another layer's geometries (compact
+layout of 05-merge-frdrom.py) reuse its points through the same transform.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from settings import PATHS
+
+LABEL_METHODS = ["centroid", "representative", "polylabel"]
+LABEL_METHOD = "centroid"
+LABEL_TOLERANCE = None  # polylabel tolerance in layer units (None: 1/1000 of each geometry extent)
+LABEL_CACHE_DIR = PATHS["processed_data"] / "cache" / "labels"
+
+
+def geometry_hashes(geometries):
+    """64-bit hash of each geometry, independent of ring start and part order."""
+    wkb = shapely.to_wkb(shapely.normalize(np.asarray(geometries, dtype=object)))
+    return pd.util.hash_pandas_object(pd.Series(wkb), index=False).to_numpy()
+
+
+def label_points(geometries, method=LABEL_METHOD, tolerance=LABEL_TOLERANCE):
+    """Label point of each (Multi)Polygon as an array of Points."""
+    geometries = np.asarray(geometries, dtype=object)
+    if method == "centroid":
+        points = shapely.centroid(geometries)
+        outside = ~shapely.contains(geometries, points)
+        points[outside] = shapely.point_on_surface(geometries[outside])
+        return points
+    if method == "representative":
+        return shapely.point_on_surface(geometries)
+    if method == "polylabel":
+        circles = shapely.maximum_inscribed_circle(geometries, tolerance)
+        return shapely.get_point(circles, 0)
+    raise ValueError(f"Unknown label method {method!r}, expected one of {LABEL_METHODS}")
+
+
+def affine(geometries, scale, translation):
+    """
+    Scale from the origin then translate, like the compact layout of 05-merge-frdrom.py.
+
+    Coordinates are computed in the same order (x * scale + translation),
+    so transformed geometries are identical to the compact layout's.
+    """
+    return shapely.transform(geometries, lambda coords: coords * scale + np.asarray(translation))
+
+
+def affine_labels(geometries, points, scale, translation):
+    """Hashes of the transformed geometries and their transformed label points."""
+    return geometry_hashes(affine(geometries, scale, translation)), affine(points, scale, translation)
+
+
+class LabelCache:
+    """Label points of one layer by geometry hash, stored as a Parquet file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.points = pd.DataFrame({"x": [], "y": []}, index=pd.Index([], dtype=np.uint64))
+        if self.path.exists():
+            table = pq.read_table(self.path).to_pandas()
+            self.points = table.drop_duplicates("hash").set_index("hash")[["x", "y"]]
+        self._staged = []
+
+    def add(self, hashes, points):
+        """Make points available to lookup() (e.g. reused from another layer)."""
+        extra = pd.DataFrame({"x": shapely.get_x(points), "y": shapely.get_y(points)}, index=hashes)
+        self.points = pd.concat([self.points, extra])
+        self.points = self.points[~self.points.index.duplicated(keep="last")]
+
+    def lookup(self, hashes):
+        """Return (found mask, points) for the given hashes (points are None where not found)."""
+        coords = self.points.reindex(hashes).to_numpy()
+        found = ~np.isnan(coords[:, 0])
+        points = np.full(len(hashes), None, dtype=object)
+        points[found] = shapely.points(coords[found])
+        return found, points
+
+    def save(self, hashes, points):
+        """Replace the file with the points of the current geometries."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        table = pa.table({
+            "hash": pa.array(hashes, type=pa.uint64()),
+            "x": shapely.get_x(points),
+            "y": shapely.get_y(points),
+        })
+        pq.write_table(table, self.path)
+
+    def stage(self, hashes, points):
+        """Keep the points of one part of a layer, saved with the other parts by save_staged()."""
+        self._staged.append((hashes, points))
+
+    def save_staged(self):
+        """Replace the file with the points of all the staged parts."""
+        if self._staged:
+            hashes, points = (np.concatenate(arrays) for arrays in zip(*self._staged))
+            self.save(hashes, points)
+            self._staged = []
+
+
+def cache_path(layer, method=LABEL_METHOD, tolerance=LABEL_TOLERANCE, cache_dir=LABEL_CACHE_DIR):
+    """Cache file of a layer for a method and tolerance."""
+    variant = method if method != "polylabel" or tolerance is None else f"{method}-{tolerance:g}"
+    return Path(cache_dir) / variant / f"{layer}.parquet"
+
+
+def cached_label_points(geometries, method=LABEL_METHOD, tolerance=LABEL_TOLERANCE, cache=None, save=True):
+    """
+    label_points() computed only for the geometries missing from the cache.
+
+    The cache is rewritten with the points of the current geometries, or
+    only staged when the layer is processed in parts (save=False).
+    Returns the points and the number of geometries computed.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    if cache is None:
+        return label_points(geometries, method, tolerance), len(geometries)
+    hashes = geometry_hashes(geometries)
+    found, points = cache.lookup(hashes)
+    missing = ~found
+    if missing.any():
+        points[missing] = label_points(geometries[missing], method, tolerance)
+    if save:
+        cache.save(hashes, points)
+    else:
+        cache.stage(hashes, points)
+    return points, int(missing.sum())
@@ -0,0 +1,138 @@
+"""
+Level-of-detail pyramid of a mesh layer for web maps.
+
+Each level targets a zoom range: borders are simplified to a fraction of
+a screen pixel at the level's finest zoom and parts smaller than a pixel
+are dropped. Levels are derived from one another, from fine to coarse, on
+the arc topology of the mesh so neighbouring units stay coincident. A
+JSON manifest maps zoom ranges to the level files.
+"""
+import json
+import math
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from generalize import generalize_arcs
+from geoparquet import write_geoparquet, COMPRESSION_LEVEL
+from topology import build_topology, rebuild_geometries
+
+# Zoom ranges of the levels, finest first (finer zooms use the full layer)
+LOD_LEVELS = [(11, 12), (9, 10), (7, 8), (5, 6), (0, 4)]
+LOD_MAX_ZOOM = 22
+LOD_PIXEL_TOLERANCE = 0.5  # Simplification tolerance (pixels at the level's finest zoom)
+LOD_MIN_PART_PIXELS = 1.0  # Parts smaller than this area (square pixels) are dropped
+
+# Web Mercator resolution at zoom 0 for 256 px tiles (metres per pixel at the equator)
+EQUATOR_RESOLUTION = 2 * math.pi * 6378137 / 256
+MERCATOR_EPSG = {3395, 3857}
+
+
+def ground_resolution(zoom, latitude=0.0):
+    """Size of a screen pixel on the ground at a zoom level and latitude (metres)."""
+    return EQUATOR_RESOLUTION * math.cos(math.radians(latitude)) / 2 ** zoom
+
+
+def layer_latitude(gdf):
+    """Latitude used to convert pixels to layer units (0 for Mercator layers)."""
+    if gdf.crs is None or gdf.crs.to_epsg() in MERCATOR_EPSG:
+        return 0.0
+    minx, miny, maxx, maxy = gdf.total_bounds
+    center = gpd.GeoSeries([shapely.Point((minx + maxx) / 2, (miny + maxy) / 2)], crs=gdf.crs)
+    return float(center.to_crs(epsg=4326).y.iloc[0])
+
+
+def drop_small_parts(geometries, min_area):
+    """Drop polygon parts below min_area, always keeping the largest part of each feature."""
+    parts, owner = shapely.get_parts(geometries, return_index=True)
+    # Repaired geometries can be collections of multipolygons and lines
+    parts, part_idx = shapely.get_parts(parts, return_index=True)
+    owner = owner[part_idx]
+    polygons = shapely.get_type_id(parts) == shapely.GeometryType.POLYGON
+    parts, owner = parts[polygons], owner[polygons]
+    area = shapely.area(parts)
+    order = np.lexsort((-area, owner))
+    largest = np.zeros(len(parts), dtype=bool)
+    largest[order[np.r_[True, owner[order][1:] != owner[order][:-1]]]] = True
+    keep = largest | (area >= min_area)
+
+    counts = np.bincount(owner[keep], minlength=len(geometries))
+    result = np.asarray(geometries, dtype=object).copy()
+    owners = np.flatnonzero(counts)
+    result[owners] = shapely.multipolygons(parts[keep], indices=np.searchsorted(owners, owner[keep]))
+    single = counts == 1
+    result[single] = parts[keep][np.searchsorted(owner[keep], np.flatnonzero(single))]
+    return result
+
+
+def build_pyramid(gdf, id_col, levels=LOD_LEVELS):
+    """
+    Yield (min zoom, max zoom, tolerance, GeoDataFrame) for each level, finest first.
+
+    Each level is simplified from the arcs of the previous one.
+    """
+    topology = build_topology(gdf, id_col=id_col)
+    latitude = layer_latitude(gdf)
+    arcs = topology.arcs
+    for min_zoom, max_zoom in levels:
+        resolution = ground_resolution(max_zoom, latitude)
+        tolerance = LOD_PIXEL_TOLERANCE * resolution
+        arcs = generalize_arcs(arcs, [("douglas", {})], tolerance=tolerance)
+        geometries = rebuild_geometries(topology, arcs)
+        present = ~shapely.is_missing(geometries)
+        geometries[present] = drop_small_parts(geometries[present], LOD_MIN_PART_PIXELS * resolution ** 2)
+
+        level_gdf = gdf.copy()
+        level_gdf.geometry = geometries
+        yield min_zoom, max_zoom, tolerance, level_gdf[present].reset_index(drop=True)
+
+
+def export_pyramid(gdf, id_col, output_dir, basename, suffix="", levels=LOD_LEVELS, full_files=None,
+                   compression_level=COMPRESSION_LEVEL):
+    """
+    Export the surface and boundary levels of a layer and their manifest.
+
+    Files are written to output_dir/lod as <basename>-<kind><suffix>-z<min>-<max>.parquet,
+    the manifest as <basename>-lod<suffix>.json. full_files maps each kind
+    to the full layer file in output_dir, listed for zooms above the levels.
+    Level files are spatially sorted GeoParquet (see geoparquet.py).
+    """
+    lod_dir = Path(output_dir) / "lod"
+    lod_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = {"layer": basename, "crs": gdf.crs.to_string() if gdf.crs else None, "levels": []}
+    if full_files:
+        manifest["levels"].append({
+            "minzoom": levels[0][1] + 1,
+            "maxzoom": LOD_MAX_ZOOM,
+            "tolerance": 0,
+            "features": len(gdf),
+            **{
+                kind: {"file": f"../{filename}", "bytes": (Path(output_dir) / filename).stat().st_size}
+                for kind, filename in full_files.items()
+                if (Path(output_dir) / filename).exists()
+            },
+        })
+    for min_zoom, max_zoom, tolerance, level_gdf in build_pyramid(gdf, id_col, levels):
+        files = {}
+        for kind in ("surface", "boundary"):
+            kind_gdf = level_gdf.copy()
+            if kind == "boundary":
+                kind_gdf.geometry = level_gdf.geometry.boundary
+            filename = f"{basename}-{kind}{suffix}-z{min_zoom}-{max_zoom}.parquet"
+            write_geoparquet(kind_gdf, lod_dir / filename, compression_level=compression_level)
+            files[kind] = {"file": filename, "bytes": (lod_dir / filename).stat().st_size}
+        manifest["levels"].append({
+            "minzoom": min_zoom,
+            "maxzoom": max_zoom,
+            "tolerance": round(tolerance, 3),
+            "features": len(level_gdf),
+            **files,
+        })
+
+    manifest_path = lod_dir / f"{basename}-lod{suffix}.json"
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+    print(f"Exported LOD pyramid: {manifest_path.name} ({len(manifest['levels'])} levels)")
+    return manifest
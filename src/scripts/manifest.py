@@ -0,0 +1,131 @@
+"""
+Build manifest shared by the pipeline stages (00 to 06).
+
+Each stage records, for every output it writes, the content hash of its
+inputs, its parameters and the version (source hash) of the code that
+produced it. An output is rebuilt only when one of these changed, when it
+is missing or when its own content no longer matches the manifest (e.g. a
+partial download).
+
+File hashes are cached in the manifest by size and modification time, so
+unchanged files are not read again.
+"""
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+from settings import PATHS
+
+MANIFEST_DIR = PATHS["processed_data"] / "manifests"
+CHUNK_SIZE = 1024 * 1024
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_version(*paths):
+    """Hash of the source files producing an output."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(Path(path).name.encode())
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def normalize(params):
+    """JSON-compatible copy of the parameters, for comparison and storage."""
+    return json.loads(json.dumps(params or {}, sort_keys=True, default=str))
+
+
+class BuildManifest:
+    """Inputs, parameters and code version of every output of a stage."""
+
+    def __init__(self, stage, code=(), manifest_dir=MANIFEST_DIR):
+        self.stage = stage
+        self.code = code_version(*code) if code else None
+        self.path = Path(manifest_dir) / f"{stage}.json"
+        self.outputs = {}
+        self.files = {}
+        self.updated = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            content = json.loads(self.path.read_text())
+            self.outputs = content.get("outputs", {})
+            self.files = content.get("files", {})
+
+    def file_hash(self, path):
+        """Content hash of a file or directory (None if missing)."""
+        path = Path(path)
+        if not path.exists():
+            return None
+        if path.is_dir():
+            digest = hashlib.sha256()
+            for child in sorted(p for p in path.rglob("*") if p.is_file()):
+                digest.update(str(child.relative_to(path)).encode())
+                digest.update(self.file_hash(child).encode())
+            return digest.hexdigest()
+
+        stat = path.stat()
+        key = str(path)
+        with self._lock:
+            cached = self.files.get(key)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+        sha256 = _sha256(path)
+        with self._lock:
+            self.files[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        return sha256
+
+    def entry(self, inputs=(), params=None):
+        """Description of how an output is produced."""
+        return {
+            "inputs": {str(path): self.file_hash(path) for path in inputs},
+            "params": normalize(params),
+            "code": self.code,
+        }
+
+    def is_up_to_date(self, outputs, inputs=(), params=None):
+        """True when all outputs exist, are unchanged and were built from the same inputs, parameters and code."""
+        entry = self.entry(inputs, params)
+        for output in outputs:
+            with self._lock:
+                record = self.outputs.get(str(output))
+            if record is None or record["entry"] != entry:
+                return False
+            if self.file_hash(output) != record["hash"]:
+                return False
+        return True
+
+    def record(self, outputs, inputs=(), params=None):
+        """
+        Record outputs just written from inputs and parameters. Declared
+        outputs that were not written (optional layers) are recorded as
+        absent, and stay up to date as long as they are.
+        """
+        entry = self.entry(inputs, params)
+        for output in outputs:
+            record = {"entry": entry, "hash": self.file_hash(output)}
+            with self._lock:
+                self.outputs[str(output)] = record
+                self.updated[str(output)] = record
+
+    def merge(self, records, files=None):
+        """Add records produced by another process (e.g. a worker)."""
+        with self._lock:
+            self.outputs.update(records)
+            self.files.update(files or {})
+
+    def save(self):
+        """Write the manifest to disk."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            content = {"stage": self.stage, "outputs": self.outputs, "files": self.files}
+        tmp_path = self.path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(content, indent=1, sort_keys=True))
+        tmp_path.replace(self.path)
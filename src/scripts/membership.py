@@ -0,0 +1,127 @@
+"""
+Commune membership table (commune -> arr, dep, reg, epci, ept, epciept).
+
+The table is read from the ngeofr DuckDB database in a single pass and
+cached on disk as Parquet, keyed by the database file's size and
+modification time and by the epciept query. Once the cache exists, the
+generator can run without the database.
+
+A copy of the table used for each millésime is also kept (save_snapshot),
+so that the next year's outputs can be derived from this year's ones
+(see millesime.py).
+"""
+import hashlib
+import os
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+MEMBERSHIP_QUERY = """
+SELECT com_insee, com_nom,
+       arr_insee, arr_nom,
+       dep_insee, dep_nom,
+       reg_insee, reg_nom,
+       epci_siren, epci_nom,
+       ept_siren, ept_nom
+FROM ngeofr
+"""
+
+CACHE_PREFIX = "ngeofr-membership-"
+SNAPSHOT_PREFIX = "membership-"
+
+
+def cache_key(db_path, epci_ept_query):
+    """Key identifying a database file state and the queries run against it."""
+    stat = Path(db_path).stat()
+    digest = hashlib.sha256()
+    digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    digest.update(MEMBERSHIP_QUERY.encode())
+    digest.update(epci_ept_query.encode())
+    return digest.hexdigest()[:16]
+
+
+def query_membership(db_path, epci_ept_query):
+    """Read the full membership table with a single connection."""
+    conn = duckdb.connect(str(db_path), read_only=True)
+    try:
+        membership = conn.execute(MEMBERSHIP_QUERY).df()
+        epci_ept = conn.execute(epci_ept_query).df()
+    finally:
+        conn.close()
+
+    epci_ept = epci_ept[['com_insee', 'epci_siren', 'epci_nom']].rename(
+        columns={'epci_siren': 'epciept_siren', 'epci_nom': 'epciept_nom'}
+    )
+    return (
+        membership.merge(epci_ept, on='com_insee', how='left')
+                  .sort_values('com_insee')
+                  .reset_index(drop=True)
+    )
+
+
+def load_membership(db_path, epci_ept_query_path, cache_dir):
+    """
+    Load the membership table, from the cache when it is up to date.
+
+    Parameters:
+    - db_path: Path to the ngeofr DuckDB database
+    - epci_ept_query_path: Path to the query_epci_ept.sql file
+    - cache_dir: Directory holding the Parquet cache
+
+    Falls back to the most recent cache when the database or the query
+    file is not available.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    if not (Path(db_path).exists() and Path(epci_ept_query_path).exists()):
+        caches = sorted(cache_dir.glob(f"{CACHE_PREFIX}*.parquet"), key=lambda f: f.stat().st_mtime)
+        if not caches:
+            raise FileNotFoundError(f"Database {db_path} not found and no membership cache in {cache_dir}")
+        print(f"Database {db_path} not found, using membership cache {caches[-1].name}")
+        return pd.read_parquet(caches[-1])
+
+    epci_ept_query = Path(epci_ept_query_path).read_text()
+    cache_path = cache_dir / f"{CACHE_PREFIX}{cache_key(db_path, epci_ept_query)}.parquet"
+    if cache_path.exists():
+        print(f"Membership table loaded from cache: {cache_path.name}")
+        return pd.read_parquet(cache_path)
+
+    membership = query_membership(db_path, epci_ept_query)
+    membership.to_parquet(cache_path, compression="gzip", index=False)
+    for stale in cache_dir.glob(f"{CACHE_PREFIX}*.parquet"):
+        if stale != cache_path:
+            stale.unlink()
+    print(f"Membership table cached: {cache_path.name} ({len(membership)} communes)")
+    return membership
+
+
+def project_membership(membership, columns, id_col, name_col):
+    """Project the (com_insee, id, name) columns of one mesh, renamed to id_col/name_col."""
+    source_id, source_name = columns
+    selected = ['com_insee'] + [col for col in (source_id, source_name) if col != 'com_insee']
+    return membership[selected].rename(columns={source_id: id_col, source_name: name_col})
+
+
+def snapshot_path(snapshot_dir, year):
+    """Path of the membership table of a millésime."""
+    return Path(snapshot_dir) / f"{SNAPSHOT_PREFIX}{year}.parquet"
+
+
+def save_snapshot(membership, snapshot_dir, year):
+    """Keep the membership table of a millésime, replacing the file atomically (several workers may save it)."""
+    path = snapshot_path(snapshot_dir, year)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists() and pd.read_parquet(path).equals(membership):
+        return path
+    temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    membership.to_parquet(temp_path, compression="gzip", index=False)
+    os.replace(temp_path, path)
+    return path
+
+
+def load_snapshot(snapshot_dir, year):
+    """Membership table of a millésime, None when it was not kept."""
+    path = snapshot_path(snapshot_dir, year)
+    return pd.read_parquet(path) if path.exists() else None
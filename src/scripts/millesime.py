@@ -0,0 +1,164 @@
+"""
+Yearly update of the mesh layers from the previous millésime.
+
+Between two years of the COG only a few hundred of the ~35,000 communes
+merge, split, change code, name or boundaries. Instead of dissolving every
+mesh again, the communes of the new layer are compared with the commune
+layer of the previous year by INSEE code and geometry hash
+(changed_communes), and the two membership tables commune by commune
+(affected_units). Only the units holding a changed commune, before or
+after the change, are dissolved again; the rows of the other units are
+copied from the previous year's layers (patch_layer, patch_borders).
+
+The commune changes are also summarised as a table (change_table), the
+communes of both years being linked by area overlap.
+"""
+import numpy as np
+import pandas as pd
+import shapely
+
+from labels import geometry_hashes
+from topology import build_topology, shared_borders
+
+MIN_OVERLAP = 0.01  # Share of the smaller commune two communes of both years must overlap to be linked
+CHANGE_COLUMNS = ["change", "com_insee_old", "com_nom_old", "com_insee_new", "com_nom_new"]
+CHANGES = ["merge", "split", "recode", "rename", "boundary", "create", "delete"]
+
+
+def commune_hashes(communes, id_col="com_insee"):
+    """Geometry hash of each commune code (set of hashes for a commune in several rows)."""
+    hashes = pd.Series(geometry_hashes(communes.geometry.values), index=communes[id_col].to_numpy())
+    if not hashes.index.is_unique:
+        hashes = hashes.groupby(level=0).agg(frozenset)
+    return hashes
+
+
+def changed_communes(previous, current, id_col="com_insee"):
+    """Codes of the communes added, removed or whose geometry changed between two commune layers."""
+    before, after = commune_hashes(previous, id_col), commune_hashes(current, id_col)
+    both = before.index.intersection(after.index)
+    moved = both[before.reindex(both).to_numpy() != after.reindex(both).to_numpy()]
+    return set(before.index.symmetric_difference(after.index)) | set(moved)
+
+
+def affected_units(changed, previous, current, id_col, name_col):
+    """
+    Units of a mesh to dissolve again: the units (before and after) of the
+    changed communes and of the communes moved to another unit, and the
+    renamed units. previous and current are the (com_insee, id_col,
+    name_col) membership projections of both years.
+    """
+    def units(membership):
+        membership = membership.drop_duplicates("com_insee")
+        return pd.DataFrame(
+            {"unit": membership[id_col].to_numpy(), "name": membership[name_col].to_numpy()},
+            index=membership["com_insee"].to_numpy(),
+        )
+
+    joined = units(previous).join(units(current), how="outer", lsuffix="_old", rsuffix="_new")
+    moved = (
+        joined.index.isin(list(changed))
+        | (joined["unit_old"].fillna("") != joined["unit_new"].fillna("")).to_numpy()
+        | (joined["name_old"].fillna("") != joined["name_new"].fillna("")).to_numpy()
+    )
+    return set(joined["unit_old"][moved].dropna()) | set(joined["unit_new"][moved].dropna())
+
+
+def patch_layer(previous, updated, id_col, affected):
+    """Rows of the previous layer whose unit is not affected, then the updated units (if any)."""
+    kept = previous[~previous[id_col].isin(list(affected))]
+    if updated is None or updated.empty:
+        return kept.reset_index(drop=True)
+    return pd.concat([kept, updated.reindex(columns=kept.columns)], ignore_index=True)
+
+
+def patch_borders(previous, surfaces, id_col, affected):
+    """
+    Border layer (see topology.shared_borders) of patched surfaces: the
+    previous borders between unaffected units, and the borders of the
+    affected units, computed on these units and their neighbours only.
+    """
+    affected = list(affected)
+    is_affected = surfaces[id_col].isin(affected).to_numpy()
+    around = np.zeros(len(surfaces), dtype=bool)
+    around[surfaces.sindex.query(surfaces.geometry.values[is_affected], predicate="intersects")[1]] = True
+    around |= is_affected
+
+    kept = previous[~previous["left_id"].isin(affected) & ~previous["right_id"].isin(affected)]
+    if not around.any():
+        return kept.reset_index(drop=True)
+    borders = shared_borders(build_topology(surfaces[around], id_col=id_col))
+    borders = borders[borders["left_id"].isin(affected) | borders["right_id"].isin(affected)]
+    return pd.concat([kept, borders.reindex(columns=kept.columns)], ignore_index=True)
+
+
+def change_table(previous, current, changed, min_overlap=MIN_OVERLAP):
+    """
+    Commune changes between two commune layers (com_insee, com_nom,
+    geometry), one row per link between a commune of each year:
+
+    - merge: several communes, of which one at least disappears, make up a new one
+    - split: a commune is divided into several, of which one at least is new
+    - recode: a commune takes another code
+    - rename: a commune keeps its code and changes name
+    - boundary: a commune keeps its code and changes boundaries
+    - create / delete: a commune appears or disappears without overlap with another
+
+    Changed communes (see changed_communes) of both years are linked when
+    they overlap on at least min_overlap of the smaller one.
+    """
+    before = previous[previous["com_insee"].isin(list(changed))].reset_index(drop=True)
+    after = current[current["com_insee"].isin(list(changed))].reset_index(drop=True)
+    old_codes, new_codes = set(previous["com_insee"]), set(current["com_insee"])
+
+    i, j = after.sindex.query(before.geometry.values, predicate="intersects")
+    a, b = before.geometry.values[i], after.geometry.values[j]
+    overlap = shapely.area(shapely.intersection(a, b))
+    linked = overlap >= min_overlap * np.minimum(shapely.area(a), shapely.area(b))
+    links = pd.DataFrame({
+        "com_insee_old": before["com_insee"].to_numpy()[i[linked]],
+        "com_nom_old": before["com_nom"].to_numpy()[i[linked]],
+        "com_insee_new": after["com_insee"].to_numpy()[j[linked]],
+        "com_nom_new": after["com_nom"].to_numpy()[j[linked]],
+    }).drop_duplicates(["com_insee_old", "com_insee_new"])
+
+    # Groups of links sharing a new commune (merge) or an old one (split)
+    removed = ~links["com_insee_old"].isin(new_codes)
+    added = ~links["com_insee_new"].isin(old_codes)
+    merged = removed.groupby(links["com_insee_new"]).transform("any") & (links.groupby("com_insee_new")["com_insee_old"].transform("size") > 1)
+    split = added.groupby(links["com_insee_old"]).transform("any") & (links.groupby("com_insee_old")["com_insee_new"].transform("size") > 1)
+    same = links["com_insee_old"] == links["com_insee_new"]
+    links["change"] = np.select(
+        [merged, split, ~same & (removed | added), same],
+        ["merge", "split", "recode", "boundary"],
+        default=None,
+    )
+    # Links between two communes existing both years are boundary slivers
+    links = links[links["change"].notna()]
+
+    # Renames, creations and deletions
+    names_before = previous.drop_duplicates("com_insee").set_index("com_insee")["com_nom"]
+    names_after = current.drop_duplicates("com_insee").set_index("com_insee")["com_nom"]
+    common = names_before.index.intersection(names_after.index)
+    renamed = common[names_before.reindex(common).to_numpy() != names_after.reindex(common).to_numpy()]
+    created = sorted(new_codes - old_codes - set(links["com_insee_new"]))
+    deleted = sorted(old_codes - new_codes - set(links["com_insee_old"]))
+    rows = [
+        links,
+        pd.DataFrame({
+            "change": "rename",
+            "com_insee_old": renamed, "com_nom_old": names_before.reindex(renamed).to_numpy(),
+            "com_insee_new": renamed, "com_nom_new": names_after.reindex(renamed).to_numpy(),
+        }),
+        pd.DataFrame({"change": "create", "com_insee_new": created, "com_nom_new": names_after.reindex(created).to_numpy()}),
+        pd.DataFrame({"change": "delete", "com_insee_old": deleted, "com_nom_old": names_before.reindex(deleted).to_numpy()}),
+    ]
+    rows = [frame for frame in rows if not frame.empty]
+    changes = pd.concat(rows, ignore_index=True).reindex(columns=CHANGE_COLUMNS) if rows else pd.DataFrame(columns=CHANGE_COLUMNS)
+    order = changes["change"].map(CHANGES.index)
+    return (
+        changes.assign(order=order)
+               .sort_values(["order", "com_insee_new", "com_insee_old"], na_position="first")
+               .drop(columns="order")
+               .reset_index(drop=True)
+    )
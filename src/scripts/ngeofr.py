@@ -0,0 +1,272 @@
+"""
+Query API over the mesh layers of public/.
+
+    import ngeofr
+    epci = ngeofr.load("epci", territory="fra", ids=["200054781"], columns=["epci_nom"])
+    deps = ngeofr.load("dep", territory="frdrom", style="compact", bbox=(600000, 6800000, 700000, 6900000))
+
+Layer paths follow the naming scheme of 06-generate-ngeo.py:
+public/<territory>[-<layout>]/<mesh>-<territory>[-<layout>]-<year>-<kind>[-gen].parquet
+
+Small files are decoded once and kept in a size-bounded LRU cache, later
+requests being filtered in memory. Larger files are scanned with pyarrow,
+the id and bbox filters being pushed down to row group statistics (bbox
+covering column of GeoParquet 1.1 files, see geoparquet.py), and only the
+filtered result is cached.
+"""
+import functools
+import json
+import operator
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import shapely
+from pyproj import CRS, Transformer
+
+from settings import COG_YEAR
+
+PUBLIC_DIR = Path(os.getenv("NGEOFR_PUBLIC_DIR", Path(__file__).resolve().parents[2] / "public"))
+MESHES = ["com", "arr", "dep", "reg", "epci", "ept", "epciept"]
+KINDS = ["surface", "centroid", "boundary", "border"]
+STYLE_PATTERN = re.compile(r"[a-z][a-z0-9_]*")  # "natural" or a layout of 05-merge-frdrom.py ("compact", ...)
+
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # Memory budget of the cache
+CACHE_FILE_LIMIT = 64 * 1024 * 1024  # Files up to this size are cached whole
+
+ID_PATTERN = re.compile(r".+_(insee|siren)$")
+BORDER_ID_COLUMNS = ["left_id", "right_id"]  # Unit codes on each side of a border (border layers)
+COVERING_COLUMN = "bbox"
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by the total size of its values (bytes)."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value, size):
+        """Store a value, evicting the least recently used ones (values larger than the budget are not stored)."""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self.current_bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_cache = LRUCache()
+
+
+def cache_info():
+    """Entries, size and hit counts of the layer cache."""
+    return _cache.info()
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def set_cache_size(max_bytes):
+    """Change the memory budget of the layer cache (empties it)."""
+    global _cache
+    _cache = LRUCache(max_bytes)
+
+
+def layer_path(mesh, territory="fra", style="natural", kind="surface", gen=True, year=None, root=None):
+    """
+    Path of a layer in public/ (see 06-generate-ngeo.py). Without a year,
+    the newest year of the layer found in public/ (the millésime of
+    settings.py when there is none).
+    """
+    if mesh not in MESHES:
+        raise ValueError(f"Unknown mesh {mesh!r}, expected one of {MESHES}")
+    if kind not in KINDS:
+        raise ValueError(f"Unknown kind {kind!r}, expected one of {KINDS}")
+    if not STYLE_PATTERN.fullmatch(style):
+        raise ValueError(f"Invalid style {style!r}, expected \"natural\" or a layout name")
+    style_prefix = "" if style == "natural" else f"-{style}"
+    gen_suffix = "-gen" if gen else ""
+    directory = Path(root or PUBLIC_DIR) / f"{territory}{style_prefix}"
+    if year is None:
+        pattern = re.compile(rf"{re.escape(f'{mesh}-{territory}{style_prefix}')}-(\d{{4}})-{kind}{gen_suffix}\.parquet")
+        years = [match[1] for path in directory.glob(f"{mesh}-*.parquet") if (match := pattern.fullmatch(path.name))]
+        year = max(years, default=COG_YEAR)
+    return directory / f"{mesh}-{territory}{style_prefix}-{year}-{kind}{gen_suffix}.parquet"
+
+
+def available_layers(root=None):
+    """List the layers of public/ as dicts of load() arguments."""
+    pattern = re.compile(
+        rf"^(?P<mesh>{'|'.join(MESHES)})-(?P<territory>[a-z]+)(?:-(?P<style>{STYLE_PATTERN.pattern}))?-(?P<year>\d{{4}})"
+        rf"-(?P<kind>{'|'.join(KINDS)})(?P<gen>-gen)?\.parquet$"
+    )
+    layers = []
+    for path in sorted(Path(root or PUBLIC_DIR).glob("*/*.parquet")):
+        match = pattern.match(path.name)
+        if match:
+            layers.append({
+                "mesh": match["mesh"],
+                "territory": match["territory"],
+                "style": match["style"] or "natural",
+                "kind": match["kind"],
+                "gen": bool(match["gen"]),
+                "year": match["year"],
+            })
+    return layers
+
+
+def _schema_info(path):
+    """Id column, attribute columns, bbox covering presence and CRS of a layer file."""
+    schema = pq.read_schema(path)
+    names = [name for name in schema.names if name not in ("geometry", COVERING_COLUMN)]
+    id_col = next((name for name in names if ID_PATTERN.match(name)), names[0] if names else None)
+    geo = json.loads(schema.metadata[b"geo"])["columns"]["geometry"]
+    crs = CRS.from_user_input(geo["crs"]) if geo.get("crs") is not None else None
+    return id_col, names, COVERING_COLUMN in schema.names, crs
+
+
+def _bbox_expression(bbox):
+    xmin, ymin, xmax, ymax = bbox
+    field = lambda name: pc.field(COVERING_COLUMN, name)
+    return (field("xmin") <= xmax) & (field("xmax") >= xmin) & (field("ymin") <= ymax) & (field("ymax") >= ymin)
+
+
+def _id_columns(id_col, names):
+    """Columns matched by ids: both sides of a border layer, the id column otherwise."""
+    return BORDER_ID_COLUMNS if set(BORDER_ID_COLUMNS) <= set(names) else [id_col]
+
+
+def _filter(gdf, id_cols, ids, bbox, bounds=None):
+    """Filter a decoded layer by ids (on any of id_cols) and bbox (exact intersection)."""
+    mask = np.ones(len(gdf), dtype=bool)
+    if ids is not None:
+        mask &= np.logical_or.reduce([gdf[col].isin(ids).to_numpy() for col in id_cols])
+    if bbox is not None:
+        if bounds is None:
+            bounds = shapely.bounds(gdf.geometry.values)
+        xmin, ymin, xmax, ymax = bbox
+        mask &= (bounds[:, 0] <= xmax) & (bounds[:, 2] >= xmin) & (bounds[:, 1] <= ymax) & (bounds[:, 3] >= ymin)
+        candidates = np.flatnonzero(mask)
+        mask[candidates] = shapely.intersects(gdf.geometry.values[candidates], shapely.box(*bbox))
+    return gdf[mask].reset_index(drop=True)
+
+
+def _estimated_size(gdf):
+    """Approximate memory size of a GeoDataFrame (bytes)."""
+    attributes = gdf.drop(columns=gdf.geometry.name).memory_usage(deep=True, index=False).sum()
+    coordinates = shapely.get_num_coordinates(gdf.geometry.values).sum()
+    return int(attributes + 16 * coordinates + 64 * len(gdf))
+
+
+def _transform_bbox(bbox, bbox_crs, layer_crs):
+    if bbox_crs is None or layer_crs is None:
+        return bbox
+    transformer = Transformer.from_crs(bbox_crs, layer_crs, always_xy=True)
+    return transformer.transform_bounds(*bbox, densify_pts=21)
+
+
+def load(mesh, territory="fra", style="natural", kind="surface", gen=True, bbox=None, ids=None,
+         columns=None, year=None, bbox_crs=None, root=None):
+    """
+    Load a mesh layer of public/, optionally filtered.
+
+    Parameters:
+    - mesh: Mesh type (com, arr, dep, reg, epci, ept, epciept)
+    - territory: Territory directory (fra, glp, mtq, guf, reu, myt, frdrom)
+    - style: "natural", or a layout of frdrom ("compact" or another layout of 05-merge-frdrom.py)
+    - kind: "surface", "centroid", "boundary" or "border" (shared borders stored once)
+    - gen: Generalized layer (-gen) or standard layer
+    - bbox: (xmin, ymin, xmax, ymax), features intersecting it are returned
+    - ids: Codes of the units to return (values of the *_insee/*_siren column,
+      borders on either side of the units for border layers)
+    - columns: Attribute columns to return (all by default), id and geometry are always included
+    - year: COG year of the layer (newest one in public/ by default)
+    - bbox_crs: CRS of bbox when it is not the layer's CRS (e.g. 4326)
+    - root: public/ directory (PUBLIC_DIR by default)
+
+    Returns a GeoDataFrame; it is a copy and may be modified freely.
+    """
+    path = layer_path(mesh, territory, style, kind, gen, year, root)
+    if not path.exists():
+        raise FileNotFoundError(f"Layer not found: {path}")
+
+    stat = path.stat()
+    id_col, names, has_covering, crs = _schema_info(path)
+    id_cols = _id_columns(id_col, names)
+    selected = names if columns is None else id_cols + [col for col in columns if col not in id_cols]
+    if missing := set(selected) - set(names):
+        raise ValueError(f"Unknown columns for {path.name}: {sorted(missing)}")
+    ids = None if ids is None else list(ids)
+    if bbox is not None:
+        bbox = tuple(_transform_bbox(bbox, bbox_crs, crs))
+    file_key = (str(path), stat.st_size, stat.st_mtime_ns, tuple(selected))
+
+    # Small files: decoded once, filtered in memory
+    if stat.st_size <= CACHE_FILE_LIMIT:
+        cached = _cache.get(file_key)
+        if cached is None:
+            gdf = gpd.read_parquet(path, columns=selected + ["geometry"])
+            cached = (gdf, shapely.bounds(gdf.geometry.values))
+            _cache.put(file_key, cached, _estimated_size(gdf))
+        gdf, bounds = cached
+        if ids is None and bbox is None:
+            return gdf.copy()
+        return _filter(gdf, id_cols, ids, bbox, bounds)
+
+    # Large files: filters pushed down to the Parquet scan, filtered result cached
+    query_key = file_key + (tuple(sorted(ids)) if ids is not None else None, bbox)
+    cached = _cache.get(query_key)
+    if cached is not None:
+        return cached.copy()
+
+    expression = None
+    if ids is not None:
+        expression = functools.reduce(operator.or_, [pc.field(col).isin(ids) for col in id_cols])
+    if bbox is not None and has_covering:
+        bbox_filter = _bbox_expression(bbox)
+        expression = bbox_filter if expression is None else expression & bbox_filter
+    gdf = gpd.read_parquet(path, columns=selected + ["geometry"], filters=expression)
+    if bbox is not None:
+        gdf = _filter(gdf, id_cols, None, bbox)
+    _cache.put(query_key, gdf, _estimated_size(gdf))
+    return gdf.copy()
@@ -0,0 +1,327 @@
+"""
+Single entry point of the build, from the IGN archives to public/.
+
+By default the build is a task graph (see scheduler.py): for each territory
+download (00) -> extract (01) -> convert (02) -> simplify (03) -> clean
+(04), then 05 for the standard and generalized layers once all territories
+are converted or cleaned, and 06 for each commune file and mesh chain as
+soon as the file exists. Territories move through the graph independently,
+so the DROM chains do not wait for the France archive, and the tasks run
+on a pool of worker processes (CPU) and a pool of threads (downloads). The
+stages write the same files as the numbered scripts and use their build
+manifests: outputs already up to date are skipped.
+
+Paths, millésime and pool sizes come from the configuration file (see
+settings.py and ngeofr.example.toml).
+
+With --in-memory, 02 -> 03 -> 04 -> 05 -> 06 run in a single process
+instead: every stage hands its GeoDataFrames to the next one by reference,
+the IGN shapefiles are read once, the geometry arrays are shared between
+stages instead of being serialized and parsed again, and only the final
+layers of 06-generate-ngeo.py are written. Intermediate layers can still be
+written for debugging (--persist DIR, same layout and file names as
+src/processed_data). The stage build manifests are not used: every output
+of the run is rebuilt.
+
+Usage:
+    python src/scripts/pipeline.py [--config ngeofr.toml] [--territories FRA GLP ...]
+                                   [--start convert] [--cpu-workers N] [--io-workers N] [--partitioned]
+                                   [--update-from 2024] [--engine duckdb]
+    python src/scripts/pipeline.py --in-memory [--territories FRA GLP ...] [--persist DIR]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+from pathlib import Path
+
+if __name__ == "__main__":
+    # The configuration file must be known before settings.py is imported (by the
+    # modules below and by the worker processes, through the environment)
+    _config = argparse.ArgumentParser(add_help=False)
+    _config.add_argument("--config")
+    if _config_path := _config.parse_known_args()[0].config:
+        os.environ["NGEOFR_CONFIG"] = _config_path
+
+import settings
+from geoparquet import write_geoparquet
+from instrument import RunReport, span
+from scheduler import Scheduler, Task, load_script
+
+SCRIPTS_DIR = Path(__file__).parent
+STAGES = {
+    "convert": "02-convert-ign.py",
+    "simplify": "03-simplify-ign.py",
+    "clean": "04-clean-territory.py",
+    "merge": "05-merge-frdrom.py",
+    "generate": "06-generate-ngeo.py",
+}
+EXTRACT_SCRIPTS = {"download": "00-extract-ign.py", "extract": "01-unzip-ign.py"}
+START_STEPS = ["download", "extract", "convert"]  # First step of the task graph (--start)
+GEN_TOLERANCE = 200  # Simplification tolerance (m) of the generalized layers (temp/ files)
+PERSIST_COMPRESSION_LEVEL = 1  # zstd level of the debug intermediates
+
+
+def load_stage(name):
+    """Import a numbered script of the pipeline as a module."""
+    path = SCRIPTS_DIR / STAGES[name]
+    spec = importlib.util.spec_from_file_location(path.stem.replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Pipeline:
+    """Stage modules and in-memory layers of one build."""
+
+    def __init__(self, persist_dir=None):
+        self.stages = {name: load_stage(name) for name in STAGES}
+        self.year = self.stages["merge"].COG_YEAR
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self.timings = {}
+
+    def persist(self, gdf, subdir, filename):
+        """Write an intermediate layer when --persist is set."""
+        if self.persist_dir is None:
+            return
+        directory = self.persist_dir / subdir
+        directory.mkdir(parents=True, exist_ok=True)
+        write_geoparquet(gdf, directory / filename, compression_level=PERSIST_COMPRESSION_LEVEL, sort=False)
+        print(f"Persisted: {subdir}/{filename}")
+
+    def timed(self, stage, function, *args, **kwargs):
+        with span("step", step=stage) as record:
+            result = function(*args, **kwargs)
+        self.timings[stage] = self.timings.get(stage, 0.0) + record["seconds"]
+        return result
+
+    def convert(self, territories):
+        """02: communes of each territory, read from the IGN shapefiles."""
+        convert = self.stages["convert"]
+        standard = {}
+        for territory in territories:
+            try:
+                standard[territory] = self.timed("convert", convert.process_territory, territory)
+            except FileNotFoundError as e:
+                print(f"Skipping {territory}: {e}")
+                continue
+            self.persist(standard[territory], "standard", f"com-{territory.lower()}-{self.year}.parquet")
+        return standard
+
+    def generalize(self, standard, tolerance=GEN_TOLERANCE):
+        """03 and 04: coverage simplification then cleaning of each territory."""
+        simplify, clean = self.stages["simplify"], self.stages["clean"]
+        clean.REPORT_DIR.mkdir(parents=True, exist_ok=True)
+        generalized = {}
+        for territory, gdf in standard.items():
+            name = f"com-{territory.lower()}-{self.year}"
+            [(_, simplified)] = self.timed(
+                "simplify", lambda: list(simplify.simplify_frame(gdf, [tolerance], simplify.RECIPE, name=name))
+            )
+            self.persist(simplified, "temp", f"{name}-temp.parquet")
+
+            threshold = clean.territory_threshold(Path(f"{name}-temp.parquet"))
+            cleaned, diagnostics = self.timed("clean", clean.clean_communes, simplified, threshold)
+            report_path = clean.REPORT_DIR / f"{name}-gen-diagnostics.csv"
+            diagnostics.to_csv(report_path, index=False)
+            print(f"{name}-gen: {clean.summarize(diagnostics)}")
+            if failures := clean.check_quality(diagnostics):
+                raise ValueError(f"Quality check failed for {name} ({'; '.join(failures)}), see {report_path}")
+            generalized[territory] = cleaned
+            self.persist(cleaned, "gen", f"{name}-gen.parquet")
+        return generalized
+
+    def merge(self, territories, gen_suffix="", layouts=None):
+        """05: France and DROM in natural position and in each layout, by file name."""
+        merge = self.stages["merge"]
+        layouts = merge.LAYOUTS if layouts is None else layouts
+        merge.check_layouts(layouts)
+        subdir = "gen" if gen_suffix else "standard"
+        merged = {}
+        natural = self.timed("merge", merge.transform_natural, territories, None, gen_suffix)
+        merged[merge.get_output_filename("natural", "", gen_suffix).name] = natural
+        if "FRA" in territories:
+            for style, layout in layouts.items():
+                merged[merge.get_output_filename(style, "", gen_suffix).name] = self.timed(
+                    "merge", merge.transform_compact, territories, layout
+                )
+        for filename, gdf in merged.items():
+            self.persist(gdf, subdir, filename)
+            if "transforms" in gdf.attrs and self.persist_dir is not None:
+                transforms_path = self.persist_dir / subdir / f"{Path(filename).stem}-transforms.json"
+                transforms_path.write_text(json.dumps(gdf.attrs["transforms"], indent=2))
+        return merged
+
+    def generate(self, layers):
+        """
+        06: mesh layers of every commune layer, given as
+        {filename: (GeoDataFrame, is_gen)} with the file names 06 would read.
+        """
+        generate = self.stages["generate"]
+        membership = generate.load_membership(generate.DB_PATH, generate.EPCI_EPT_QUERY_PATH, generate.MEMBERSHIP_CACHE_DIR)
+        chains = generate.mesh_chains(generate.MESHES)
+        # Layouts reuse the label points of the territory layers: processed last
+        order = sorted(layers, key=lambda filename: (generate.extract_layout_style(filename) != "natural", -len(layers[filename][0]), filename))
+        errors = []
+        for filename in order:
+            gdf, is_gen = layers[filename]
+            topology = None
+            if generate.MESH_ENGINE == "topology":
+                try:
+                    topology = self.timed("generate", generate.build_topology, gdf, id_col="com_insee")
+                except Exception as e:
+                    print(f"Error building topology for {filename}, falling back to dissolve: {str(e)}")
+            for chain in chains:
+                errors.extend(self.timed(
+                    "generate", generate.process_chain, gdf, filename, is_gen, tuple(chain), membership, topology=topology
+                ))
+        return errors
+
+    def run(self, territories, tolerance=GEN_TOLERANCE, layouts=None):
+        """Build every layer of the territories. Returns the errors of 06."""
+        standard = self.convert(territories)
+        generalized = self.generalize(standard, tolerance)
+
+        layers = {}
+        for gen_suffix, frames in [("", standard), ("-gen", generalized)]:
+            for territory, gdf in frames.items():
+                layers[f"com-{territory.lower()}-{self.year}{gen_suffix}.parquet"] = (gdf, bool(gen_suffix))
+            for filename, gdf in self.merge(frames, gen_suffix, layouts).items():
+                layers[filename] = (gdf, bool(gen_suffix))
+
+        errors = self.generate(layers)
+        print("\nDurations (s): " + " | ".join(f"{stage} {seconds:.1f}" for stage, seconds in self.timings.items()))
+        if errors:
+            print(f"\n{len(errors)} error(s):")
+            for filename, mesh_type, error in sorted(errors, key=lambda e: (e[0], str(e[1]))):
+                print(f"  {filename} [{mesh_type or 'all'}]: {error}")
+        return errors
+
+
+def build_tasks(territories, start="download", tolerance=GEN_TOLERANCE, layouts=None, partitioned=False, update_from=None, engine=None):
+    """
+    Task graph of a build: one chain of tasks per territory, 05 for the
+    standard and generalized layers and 06 per commune file and mesh chain.
+    Steps before start are left out (their outputs must already exist).
+    With partitioned, 06 processes the large standard layers per partition;
+    with update_from, it patches the layers of that millésime; engine
+    overrides its mesh engine (see 06-generate-ngeo.py).
+    """
+    merge, generate = load_script(STAGES["merge"]), load_script(STAGES["generate"])
+    layouts = merge.LAYOUTS if layouts is None else layouts
+    merge.check_layouts(layouts)
+    data_dir = settings.PATHS["processed_data"]
+    steps = START_STEPS[START_STEPS.index(start):]
+    links = load_script(EXTRACT_SCRIPTS["download"]).territory_links(territories) if "extract" in steps else {}
+
+    tasks = [Task(
+        "membership", STAGES["generate"], "load_membership",
+        (generate.DB_PATH, generate.EPCI_EPT_QUERY_PATH, generate.MEMBERSHIP_CACHE_DIR), pool="io", manifest=False,
+    )]
+    layers = {}  # Commune files read by 06: {path: (is_gen, tasks writing it)}
+    for territory in territories:
+        name = f"com-{territory.lower()}-{settings.COG_YEAR}"
+        deps = ()
+        if "download" in steps:
+            tasks.append(Task(f"download:{territory}", EXTRACT_SCRIPTS["download"], "download_archive", (links[territory],), pool="io"))
+            deps = (f"download:{territory}",)
+        if "extract" in steps:
+            archive = settings.PATHS["raw_data"] / Path(links[territory]).name
+            tasks.append(Task(f"extract:{territory}", EXTRACT_SCRIPTS["extract"], "unzip_archive", (archive,), deps=deps))
+            deps = (f"extract:{territory}",)
+        standard_path = data_dir / "standard" / f"{name}.parquet"
+        temp_path = data_dir / "temp" / f"{name}-temp.parquet"
+        tasks += [
+            Task(f"convert:{territory}", STAGES["convert"], "convert", (territory,), deps=deps),
+            Task(
+                f"simplify:{territory}", STAGES["simplify"], "simplify_coverage", (standard_path, [tolerance]),
+                {"outputs": {tolerance: temp_path}}, deps=(f"convert:{territory}",),
+            ),
+            Task(f"clean:{territory}", STAGES["clean"], "clean_file", (temp_path,), deps=(f"simplify:{territory}",)),
+        ]
+        layers[standard_path] = (False, (f"convert:{territory}",))
+        layers[data_dir / "gen" / f"{name}-gen.parquet"] = (True, (f"clean:{territory}",))
+
+    # France and DROM: natural position and layouts, once every territory is ready
+    if "FRA" in territories:
+        for kind, step, input_dir, is_gen in [("standard", "convert", data_dir / "standard", False), ("gen", "clean", data_dir, True)]:
+            tasks.append(Task(
+                f"merge:{kind}", STAGES["merge"], "main", (),
+                {"input_dir": input_dir, "output_dir": data_dir, "is_generalized": is_gen, "layouts": layouts},
+                deps=tuple(f"{step}:{territory}" for territory in territories),
+            ))
+            for style in ["natural", *layouts]:
+                path = merge.get_output_filename(style, data_dir / kind, "-gen" if is_gen else "")
+                layers[path] = (is_gen, (f"merge:{kind}",))
+
+    # Layouts reuse the label points of the territory layers: they wait for them
+    chains = generate.mesh_chains(generate.MESHES)
+    options = {"partitioned": True} if partitioned else {}
+    if update_from:
+        options["update_from"] = update_from
+    if engine:
+        options["engine"] = engine
+    for path, (is_gen, deps) in sorted(layers.items(), key=lambda layer: generate.extract_layout_style(layer[0].name) != "natural"):
+        for chain in chains:
+            chain_name = "+".join(chain)
+            chain_deps = deps + ("membership",)
+            if generate.extract_layout_style(path.name) != "natural":
+                chain_deps += tuple(
+                    f"generate:{other.name}:{chain_name}" for other, (other_gen, _) in layers.items()
+                    if other_gen == is_gen and "frdrom" not in other.name
+                )
+            tasks.append(Task(
+                f"generate:{path.name}:{chain_name}", STAGES["generate"], "run_chain", (path, is_gen, chain),
+                options, deps=chain_deps,
+            ))
+    return tasks
+
+
+def run_graph(territories, start="download", tolerance=GEN_TOLERANCE, layouts=None, cpu_workers=1, io_workers=1, partitioned=False, update_from=None, engine=None):
+    """Build every layer of the territories with the task graph. Returns the failures."""
+    (settings.PATHS["processed_data"] / "temp").mkdir(parents=True, exist_ok=True)
+    tasks = build_tasks(territories, start, tolerance, layouts, partitioned, update_from, engine)
+    print(f"{len(tasks)} tasks, {cpu_workers} worker process(es), {io_workers} IO thread(s)")
+    with RunReport("pipeline") as report:
+        scheduler = Scheduler(tasks, cpu_workers, io_workers, report=report)
+        results = scheduler.run()
+
+    errors = [(name, error) for name, error in scheduler.failed.items()]
+    errors += [
+        (name, f"[{mesh_type or 'all'}] {error}")
+        for name, result in results.items() if name.startswith("generate:")
+        for _, mesh_type, error in result
+    ]
+    print(f"\n{len(results)}/{len(tasks)} tasks done, {len(scheduler.failed)} failed, {len(scheduler.skipped)} skipped")
+    if errors:
+        print(f"\n{len(errors)} error(s):")
+        for name, error in sorted(errors):
+            print(f"  {name}: {error}")
+    return errors + [(name, "skipped") for name in scheduler.skipped]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build all layers, from the IGN archives to public/")
+    parser.add_argument("--config", help="Configuration file of the paths, millésime and pools (see ngeofr.example.toml)")
+    parser.add_argument("--territories", nargs="+", help="Territories to build (all by default)")
+    parser.add_argument("--start", choices=START_STEPS, default="download", help="First step, the previous outputs must exist")
+    parser.add_argument("--cpu-workers", type=int, default=settings.WORKERS["cpu"], help="Worker processes of the processing tasks")
+    parser.add_argument("--io-workers", type=int, default=settings.WORKERS["io"], help="Threads of the downloads")
+    parser.add_argument("--tolerance", type=float, default=GEN_TOLERANCE, help="Simplification tolerance of the generalized layers (m)")
+    parser.add_argument("--layouts", help="JSON file of the DROM layouts (see 05-merge-frdrom.py)")
+    parser.add_argument("--partitioned", action="store_true", help="Process the large standard layers of 06 per department/region partition (bounded memory)")
+    parser.add_argument("--update-from", help="Previous millésime (e.g. 2024) whose layers 06 patches, rebuilding only the units changed since then")
+    parser.add_argument("--engine", choices=["topology", "dissolve", "duckdb"], help="Mesh engine of 06 (default: MESH_ENGINE of 06-generate-ngeo.py)")
+    parser.add_argument("--in-memory", action="store_true", help="Run 02 to 06 in a single process, without intermediate files")
+    parser.add_argument("--persist", help="With --in-memory, also write the intermediate layers to this directory, for debugging")
+    args = parser.parse_args()
+    territories = [t.upper() for t in args.territories or settings.CRS_CONFIG]
+    layouts = json.loads(Path(args.layouts).read_text()) if args.layouts else None
+    if args.in_memory:
+        pipeline = Pipeline(persist_dir=args.persist)
+        with RunReport("pipeline"):
+            errors = pipeline.run(territories, args.tolerance, layouts)
+    else:
+        errors = run_graph(territories, args.start, args.tolerance, layouts, args.cpu_workers, args.io_workers, args.partitioned, args.update_from, args.engine)
+    sys.exit(1 if errors else 0)
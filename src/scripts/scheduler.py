@@ -0,0 +1,163 @@
+"""
+Task graph scheduler of pipeline.py.
+
+A build is a graph of tasks, one per stage and territory (or per file and
+mesh chain for 06), each depending on the tasks whose outputs it reads. A
+task is submitted as soon as all its dependencies are done, to the pool of
+its kind: "cpu" tasks run in worker processes, "io" tasks (downloads,
+database queries) in threads of the main process. So the DROM chains move
+on while the France archive is still downloading, and 05 and 06 start as
+soon as their inputs exist. Tasks depending on a failed task are skipped.
+
+Each task calls a function of a numbered script with a fresh build manifest
+of its stage, so up-to-date outputs are skipped as when running the script.
+The manifest records and run report measures of the task are sent back
+with its result, merged into one manifest per stage (saved at the end of
+the run) and into the report of the run.
+"""
+import importlib.util
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+from pathlib import Path
+
+from instrument import RunReport
+
+SCRIPTS_DIR = Path(__file__).parent
+POOLS = ("cpu", "io")
+
+# Numbered scripts loaded in the current process, by file name
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+def load_script(script):
+    """Import a numbered script as a module (once per process)."""
+    with _modules_lock:
+        if script not in _modules:
+            path = SCRIPTS_DIR / script
+            spec = importlib.util.spec_from_file_location(path.stem.replace("-", "_"), path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _modules[script] = module
+        return _modules[script]
+
+
+@dataclass
+class Task:
+    """A function of a numbered script, run once the tasks it depends on are done."""
+
+    name: str
+    script: str
+    function: str
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    pool: str = "cpu"
+    deps: tuple = ()
+    manifest: bool = True  # Pass a build manifest of the script (manifest=...)
+
+
+def run_task(name, script, function, args, kwargs, manifest=True):
+    """
+    Run a task in a worker process or thread. Returns its result, the
+    manifest records and file hashes it produced and its report measures.
+    """
+    module = load_script(script)
+    report = RunReport(Path(script).stem).activate(thread=True)
+    stage_manifest = module.build_manifest() if manifest else None
+    try:
+        with report.span("step", step=name):
+            if stage_manifest is not None:
+                kwargs = {**kwargs, "manifest": stage_manifest}
+            result = getattr(module, function)(*args, **kwargs)
+    finally:
+        report.deactivate()
+    if stage_manifest is None:
+        return result, {}, {}, report.take()
+    return result, dict(stage_manifest.updated), dict(stage_manifest.files), report.take()
+
+
+class Scheduler:
+    """Run a task graph on a process pool and a thread pool."""
+
+    def __init__(self, tasks, cpu_workers=1, io_workers=1, report=None):
+        self.tasks = {task.name: task for task in tasks}
+        for task in tasks:
+            if task.pool not in POOLS:
+                raise ValueError(f"Unknown pool {task.pool!r} for task {task.name}")
+            missing = [dep for dep in task.deps if dep not in self.tasks]
+            if missing:
+                raise ValueError(f"Task {task.name} depends on unknown tasks: {', '.join(missing)}")
+        self.cpu_workers = max(1, cpu_workers)
+        self.io_workers = max(1, io_workers)
+        self.report = report
+        self.results = {}
+        self.failed = {}
+        self.skipped = []
+        self.manifests = {}
+
+    def manifest(self, script):
+        """Build manifest of a script in the main process, where task records are merged."""
+        if script not in self.manifests:
+            self.manifests[script] = load_script(script).build_manifest()
+        return self.manifests[script]
+
+    def ready(self, pending):
+        """Tasks of pending whose dependencies are done; dependents of failed tasks are skipped."""
+        ready = []
+        for name in list(pending):
+            deps = pending[name].deps
+            if any(dep in self.failed or dep in self.skipped for dep in deps):
+                print(f"[skipped] {name}")
+                self.skipped.append(name)
+                del pending[name]
+            elif all(dep in self.results for dep in deps):
+                ready.append(pending.pop(name))
+        return ready
+
+    def finish(self, task, future, seconds):
+        """Collect the result, manifest records and measures of a task."""
+        try:
+            result, records, files, measures = future.result()
+        except Exception as e:
+            print(f"[failed] {task.name} ({seconds:.1f}s): {e}")
+            self.failed[task.name] = str(e)
+            return
+        if task.manifest:
+            self.manifest(task.script).merge(records, files)
+        if self.report is not None:
+            self.report.merge(*measures)
+        self.results[task.name] = result
+        print(f"[done] {task.name} ({seconds:.1f}s)")
+
+    def run(self):
+        """Run every task, returning the results of the tasks done by name."""
+        pending = dict(self.tasks)
+        running = {}
+        pools = {
+            "cpu": ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=get_context("spawn")),
+            "io": ThreadPoolExecutor(max_workers=self.io_workers),
+        }
+        try:
+            while pending or running:
+                # Loop until no task can be started or skipped anymore
+                while ready := self.ready(pending):
+                    for task in ready:
+                        future = pools[task.pool].submit(
+                            run_task, task.name, task.script, task.function, task.args, task.kwargs, task.manifest
+                        )
+                        running[future] = (task, time.perf_counter())
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task, start = running.pop(future)
+                    self.finish(task, future, time.perf_counter() - start)
+        finally:
+            for pool in pools.values():
+                pool.shutdown(cancel_futures=True)
+            for manifest in self.manifests.values():
+                manifest.save()
+        return self.results
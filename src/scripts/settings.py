@@ -0,0 +1,71 @@
+"""
+Millésime, projections and paths shared by the pipeline scripts.
+
+The defaults below can be overridden by a TOML (or JSON) file: the one
+named by the NGEOFR_CONFIG environment variable, or else ./ngeofr.toml
+when it exists (see ngeofr.example.toml). Only the keys present in the
+file are overridden; relative paths are relative to the working
+directory, the project root.
+"""
+import copy
+import json
+import os
+from pathlib import Path
+
+CONFIG_ENV = "NGEOFR_CONFIG"
+CONFIG_PATH = Path("./ngeofr.toml")
+
+DEFAULTS = {
+    "year": "2025",
+    "crs": {
+        "FRA": 2154,  # France métropolitaine
+        "GLP": 5490,  # Guadeloupe
+        "MTQ": 5490,  # Martinique
+        "GUF": 2972,  # Guyane française
+        "REU": 2975,  # Réunion
+        "MYT": 4471,  # Mayotte
+    },
+    "paths": {
+        "raw_data": "./src/raw_data/ign",
+        "processed_data": "./src/processed_data",
+        "public": "./public",
+        "membership_db": "../ngeofr/public/ngeo2025.duckdb",
+        "epci_ept_query": "../ngeofr/src/shared/sql/query_epci_ept.sql",
+    },
+    "workers": {
+        "cpu": os.cpu_count() or 1,  # Processes for the processing tasks
+        "io": 3,  # Threads for the downloads
+    },
+}
+
+
+def merge(base, override):
+    """Copy of base with the keys of override replaced, nested tables merged."""
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load(path=None):
+    """Settings from the defaults and the configuration file, if any."""
+    path = Path(path or os.environ.get(CONFIG_ENV) or CONFIG_PATH)
+    if not path.exists():
+        if path != CONFIG_PATH:
+            raise FileNotFoundError(f"Configuration file {path} not found")
+        return copy.deepcopy(DEFAULTS)
+    if path.suffix == ".json":
+        return merge(DEFAULTS, json.loads(path.read_text()))
+    import tomllib  # Python 3.11+
+    with open(path, "rb") as f:
+        return merge(DEFAULTS, tomllib.load(f))
+
+
+SETTINGS = load()
+COG_YEAR = str(SETTINGS["year"])
+CRS_CONFIG = SETTINGS["crs"]
+PATHS = {name: Path(path) for name, path in SETTINGS["paths"].items()}
+WORKERS = SETTINGS["workers"]
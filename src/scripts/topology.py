@@ -0,0 +1,403 @@
+"""
+Shared-arc topology of a commune coverage.
+
+The commune layer is decomposed once into arcs: maximal runs of border
+shared by the same two communes (or by one commune and the outside).
+Each arc is stored once with the commune on its left and on its right,
+and each commune ring keeps the ordered list of arcs it is made of.
+
+Higher meshes (dep, reg, epci, ...) are then assembled by dropping the
+arcs whose two sides fall in the same unit and polygonizing the rest,
+which is much cheaper than a polygon union per unit and gives exactly
+coincident borders between neighbouring units.
+"""
+from dataclasses import dataclass
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+# Index used for the outside of the coverage (sea, foreign country, gaps)
+EXTERIOR = -1
+# Relative area difference above which an assembled unit is dissolved instead
+AREA_TOLERANCE = 1e-9
+
+
+@dataclass
+class Topology:
+    """Arcs of a polygon coverage and the rings they compose."""
+    ids: np.ndarray          # Identifier of each feature (e.g. com_insee)
+    geometries: np.ndarray   # Original feature geometries
+    arcs: np.ndarray         # LineString per arc
+    left: np.ndarray         # Feature index on the left of each arc
+    right: np.ndarray        # Feature index on the right of each arc (EXTERIOR if none)
+    ring_arcs: np.ndarray    # Signed arc references, ring after ring (~arc = reversed)
+    ring_offsets: np.ndarray # Start of each ring in ring_arcs (len = n_rings + 1)
+    ring_part: np.ndarray    # Polygon part of each ring
+    ring_exterior: np.ndarray  # True for shells, False for holes
+    part_owner: np.ndarray   # Feature index of each polygon part
+    crs: object = None
+
+    @property
+    def n_arcs(self):
+        return len(self.arcs)
+
+    def arcs_frame(self):
+        """Return arcs as a GeoDataFrame with left/right feature identifiers."""
+        ids = np.append(self.ids, None)
+        return gpd.GeoDataFrame(
+            {
+                "left_id": ids[self.left],
+                "right_id": ids[self.right],
+                "geometry": self.arcs,
+            },
+            crs=self.crs,
+        )
+
+
+def build_topology(gdf: gpd.GeoDataFrame, id_col: str = "com_insee") -> Topology:
+    """
+    Build the shared-arc topology of a polygon coverage.
+
+    Borders are matched on exact vertex coordinates, as produced by IGN
+    ADMIN-EXPRESS and by topological generalization. Borders that do not
+    match exactly (e.g. a vertex on one side only) are kept on both sides
+    as exterior arcs, which overlap: assemble_mesh dissolves the units they
+    bound instead.
+    """
+    geometries = np.asarray(gdf.geometry)
+    ids = gdf[id_col].to_numpy()
+
+    # Polygon parts oriented so that the polygon interior is on the left
+    parts, part_owner = shapely.get_parts(geometries, return_index=True)
+    parts = shapely.orient_polygons(parts, exterior_cw=False)
+
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    ring_exterior = np.ones(len(rings), dtype=bool)
+    ring_exterior[1:] = ring_part[1:] != ring_part[:-1]
+
+    coords, coord_ring = shapely.get_coordinates(rings, return_index=True)
+
+    # Segments between consecutive vertices of the same ring
+    seg_mask = coord_ring[:-1] == coord_ring[1:]
+    start = coords[:-1][seg_mask]
+    end = coords[1:][seg_mask]
+    seg_ring = coord_ring[:-1][seg_mask]
+    non_degenerate = np.any(start != end, axis=1)
+    start, end, seg_ring = start[non_degenerate], end[non_degenerate], seg_ring[non_degenerate]
+    seg_owner = part_owner[ring_part[seg_ring]]
+    n_segs = len(seg_ring)
+
+    # Canonical direction: lexicographically increasing
+    forward = (start[:, 0] < end[:, 0]) | ((start[:, 0] == end[:, 0]) & (start[:, 1] < end[:, 1]))
+    key_a = np.where(forward[:, None], start, end)
+    key_b = np.where(forward[:, None], end, start)
+
+    # Identify identical segments shared by neighbouring features
+    order = np.lexsort((key_b[:, 1], key_b[:, 0], key_a[:, 1], key_a[:, 0]))
+    sorted_keys = np.column_stack([key_a, key_b])[order]
+    new_group = np.ones(n_segs, dtype=bool)
+    new_group[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+    useg = np.empty(n_segs, dtype=np.int64)
+    useg[order] = np.cumsum(new_group) - 1
+    n_useg = int(useg.max()) + 1 if n_segs else 0
+
+    # Feature traversing each unique segment forward (left) and backward (right)
+    sentinel = np.iinfo(np.int64).max
+    fwd_owner = np.full(n_useg, sentinel, dtype=np.int64)
+    bwd_owner = np.full(n_useg, sentinel, dtype=np.int64)
+    np.minimum.at(fwd_owner, useg[forward], seg_owner[forward])
+    np.minimum.at(bwd_owner, useg[~forward], seg_owner[~forward])
+    fwd_owner[fwd_owner == sentinel] = EXTERIOR
+    bwd_owner[bwd_owner == sentinel] = EXTERIOR
+    seg_other = np.where(forward, bwd_owner[useg], fwd_owner[useg])
+    # A border between two parts of the same feature is not a border
+    seg_other[seg_other == seg_owner] = EXTERIOR
+
+    # Runs of consecutive segments along a ring with the same neighbour
+    run_start = np.ones(n_segs, dtype=bool)
+    run_start[1:] = (seg_ring[1:] != seg_ring[:-1]) | (seg_other[1:] != seg_other[:-1])
+    run = np.cumsum(run_start) - 1
+
+    # Position of each segment along its ring
+    ring_first_seg = np.flatnonzero(np.r_[True, seg_ring[1:] != seg_ring[:-1]])
+    ring_len = np.diff(np.r_[ring_first_seg, n_segs])
+    seg_ring_rank = np.repeat(np.arange(len(ring_first_seg)), ring_len)
+    position = np.arange(n_segs) - np.repeat(ring_first_seg, ring_len)
+
+    # A run crossing the ring's starting vertex is split in two: merge it
+    ring_last_seg = ring_first_seg + ring_len - 1
+    first_run = run[ring_first_seg]
+    last_run = run[ring_last_seg]
+    wraps = (first_run != last_run) & (seg_other[ring_first_seg] == seg_other[ring_last_seg])
+    wrapped = wraps[seg_ring_rank] & (run == last_run[seg_ring_rank])
+    position = np.where(wrapped, position - ring_len[seg_ring_rank], position)
+    run = np.where(wrapped, first_run[seg_ring_rank], run)
+
+    # Runs sharing the same segments (one per side) form a single arc
+    order = np.lexsort((position, run))
+    run_sorted = run[order]
+    run_head = np.ones(n_segs, dtype=bool)
+    run_head[1:] = run_sorted[1:] != run_sorted[:-1]
+    run_ids = run_sorted[run_head]
+    run_bounds = np.r_[np.flatnonzero(run_head), n_segs]
+    run_key = np.minimum.reduceat(useg[order], run_bounds[:-1]) if n_segs else np.array([], dtype=np.int64)
+    run_owner = seg_owner[order][run_head]
+    run_other = seg_other[order][run_head]
+    run_ring = seg_ring[order][run_head]
+    run_pos = position[order][run_head]
+
+    arc_key, run_arc = np.unique(run_key, return_inverse=True)
+    n_arcs = len(arc_key)
+
+    # The arc follows its left feature: the run with the lowest owner index
+    primary_order = np.lexsort((run_owner, run_arc))
+    is_primary = np.ones(len(run_ids), dtype=bool)
+    is_primary[primary_order[1:]] = run_arc[primary_order[1:]] != run_arc[primary_order[:-1]]
+
+    left = np.empty(n_arcs, dtype=np.int64)
+    right = np.empty(n_arcs, dtype=np.int64)
+    left[run_arc[is_primary]] = run_owner[is_primary]
+    right[run_arc[is_primary]] = run_other[is_primary]
+
+    # Arc coordinates: segment starts of the primary run plus its last end
+    seg_primary = np.repeat(is_primary, np.diff(run_bounds))
+    seg_arc = np.repeat(run_arc, np.diff(run_bounds))
+    primary_segs = order[seg_primary]
+    primary_arc = seg_arc[seg_primary]
+    last_of_run = np.r_[primary_arc[1:] != primary_arc[:-1], True]
+    arc_coords = np.concatenate([start[primary_segs], end[primary_segs[last_of_run]]])
+    arc_index = np.concatenate([primary_arc, primary_arc[last_of_run]])
+    coord_order = np.argsort(
+        np.r_[np.arange(len(primary_segs)), np.flatnonzero(last_of_run) + 0.5],
+        kind="stable",
+    )
+    coord_order = coord_order[np.argsort(arc_index[coord_order], kind="stable")]
+    arcs = shapely.linestrings(arc_coords[coord_order], indices=arc_index[coord_order])
+
+    # Rings as ordered sequences of signed arc references
+    ring_order = np.lexsort((run_pos, run_ring))
+    ring_arcs = np.where(is_primary, run_arc, ~run_arc)[ring_order]
+    ring_counts = np.bincount(run_ring, minlength=len(rings))
+    ring_offsets = np.r_[0, np.cumsum(ring_counts)]
+
+    return Topology(
+        ids=ids,
+        geometries=geometries,
+        arcs=arcs,
+        left=left,
+        right=right,
+        ring_arcs=ring_arcs,
+        ring_offsets=ring_offsets,
+        ring_part=ring_part,
+        ring_exterior=ring_exterior,
+        part_owner=part_owner,
+        crs=gdf.crs,
+    )
+
+
+def assemble_mesh(topology: Topology, units: pd.Series) -> gpd.GeoDataFrame:
+    """
+    Assemble the polygons of a higher mesh from the topology.
+
+    Parameters:
+    - topology: Topology built from the commune layer
+    - units: Unit code of each feature, aligned on topology.ids
+      (missing values are left out of the mesh)
+
+    Returns a GeoDataFrame with one row per unit ('unit' and 'geometry'),
+    sorted by unit code. Units whose area differs from the sum of their
+    features' areas (faces lost on borders that do not match exactly) are
+    dissolved from their features instead; their codes are listed in
+    attrs["dissolved"].
+    """
+    codes, uniques = pd.factorize(pd.Series(units).reset_index(drop=True), sort=True)
+    feature_codes = codes
+    codes = np.append(codes, EXTERIOR)
+
+    # Keep only the arcs separating two different units
+    kept = codes[topology.left] != codes[topology.right]
+    faces = shapely.get_parts(shapely.polygonize(topology.arcs[kept]))
+
+    # Each face belongs to the unit of the features holding one of its interior points
+    # (which may lie on a dropped arc, between features of the same unit)
+    tree = shapely.STRtree(topology.geometries)
+    face_idx, feature_idx = tree.query(shapely.point_on_surface(faces), predicate="intersects")
+    face_unit = np.full(len(faces), EXTERIOR)
+    face_unit[face_idx[::-1]] = codes[feature_idx[::-1]]
+    inside = face_unit != EXTERIOR
+    faces, face_unit = faces[inside], face_unit[inside]
+
+    order = np.argsort(face_unit, kind="stable")
+    faces, face_unit = faces[order], face_unit[order]
+    unit_codes, counts = np.unique(face_unit, return_counts=True)
+
+    geometries = np.full(len(uniques), None, dtype=object)
+    if len(faces):
+        geometries[unit_codes] = shapely.multipolygons(faces, indices=np.searchsorted(unit_codes, face_unit))
+        single = unit_codes[counts == 1]
+        geometries[single] = faces[np.searchsorted(face_unit, single)]
+
+    # Faces of one unit only touch when its borders were not coincident
+    for i in unit_codes[~shapely.is_valid(geometries[unit_codes])]:
+        geometries[i] = shapely.union_all(faces[face_unit == i])
+
+    # Units losing area (or without any face) are dissolved from their features
+    in_mesh = feature_codes != EXTERIOR
+    expected = np.bincount(
+        feature_codes[in_mesh], weights=shapely.area(topology.geometries[in_mesh]), minlength=len(uniques)
+    )
+    assembled = np.nan_to_num(shapely.area(geometries))
+    mismatch = np.abs(assembled - expected) > AREA_TOLERANCE * expected
+    for i in np.flatnonzero(mismatch):
+        geometries[i] = shapely.union_all(topology.geometries[feature_codes == i])
+
+    present = np.flatnonzero(np.bincount(feature_codes[in_mesh], minlength=len(uniques)) > 0)
+    mesh = gpd.GeoDataFrame(
+        {"unit": uniques[present], "geometry": geometries[present]},
+        crs=topology.crs,
+    )
+    mesh.attrs["dissolved"] = list(uniques[np.flatnonzero(mismatch)])
+    return mesh
+
+
+def rebuild_geometries(topology: Topology, arcs: np.ndarray) -> np.ndarray:
+    """
+    Rebuild feature polygons from (possibly generalized) arcs.
+
+    Every ring is the concatenation of its arcs, so borders shared by two
+    features remain coincident. Rings collapsing below 4 coordinates are
+    dropped, as are parts losing their shell. Features keep a Polygon when
+    they have a single part.
+    """
+    coords, coord_arc = shapely.get_coordinates(arcs, return_index=True)
+    arc_len = np.bincount(coord_arc, minlength=len(arcs))
+    arc_off = np.r_[0, np.cumsum(arc_len)]
+
+    # Coordinate indices of each ring, skipping the junction repeated between arcs
+    n_rings = len(topology.ring_offsets) - 1
+    entry_ring = np.repeat(np.arange(n_rings), np.diff(topology.ring_offsets))
+    reversed_ = topology.ring_arcs < 0
+    entry_arc = np.where(reversed_, ~topology.ring_arcs, topology.ring_arcs)
+    first_entry = np.r_[True, entry_ring[1:] != entry_ring[:-1]] if len(entry_ring) else np.array([], dtype=bool)
+    skip = (~first_entry).astype(np.int64)
+    entry_len = arc_len[entry_arc] - skip
+
+    entry_start = np.r_[0, np.cumsum(entry_len)[:-1]]
+    local = np.arange(entry_len.sum()) - np.repeat(entry_start, entry_len) + np.repeat(skip, entry_len)
+    arc_start = np.repeat(arc_off[entry_arc], entry_len)
+    arc_last = arc_start + np.repeat(arc_len[entry_arc], entry_len) - 1
+    index = np.where(np.repeat(reversed_, entry_len), arc_last - local, arc_start + local)
+    ring_coords = coords[index]
+    coord_ring = np.repeat(entry_ring, entry_len)
+
+    # Rings, dropping the collapsed ones
+    ring_len = np.bincount(coord_ring, minlength=n_rings)
+    valid_ring = ring_len >= 4
+    keep = valid_ring[coord_ring]
+    ring_ids = np.flatnonzero(valid_ring)
+    rings = shapely.linearrings(ring_coords[keep], indices=np.searchsorted(ring_ids, coord_ring[keep]))
+
+    # Parts: only those whose shell survived, with their surviving holes
+    ring_part = topology.ring_part[ring_ids]
+    shell_ok = np.zeros(len(topology.part_owner), dtype=bool)
+    shell_ok[topology.ring_part[topology.ring_exterior & valid_ring]] = True
+    kept_rings = shell_ok[ring_part]
+    part_ids = np.flatnonzero(shell_ok)
+    parts = shapely.polygons(rings[kept_rings], indices=np.searchsorted(part_ids, ring_part[kept_rings]))
+
+    # Features
+    owner = topology.part_owner[part_ids]
+    n_features = len(topology.ids)
+    geometries = np.full(n_features, None, dtype=object)
+    if len(parts):
+        owners = np.unique(owner)
+        geometries[owners] = shapely.multipolygons(parts, indices=np.searchsorted(owners, owner))
+        part_count = np.bincount(owner, minlength=n_features)
+        single = np.flatnonzero(part_count == 1)
+        geometries[single] = parts[np.searchsorted(owner, single)]
+
+    invalid = ~shapely.is_valid(geometries) & ~shapely.is_missing(geometries)
+    geometries[invalid] = shapely.make_valid(geometries[invalid])
+    return geometries
+
+
+def shared_borders(topology: Topology) -> gpd.GeoDataFrame:
+    """
+    Borders of the coverage, each stored once.
+
+    Arcs are grouped by pair of neighbouring features and merged into one
+    (Multi)LineString per pair. Returns a GeoDataFrame with 'left_id',
+    'right_id' (None outside the coverage), 'external' (True for borders
+    with the outside: coast, foreign country, other territory) and
+    'geometry', sorted by left and right feature.
+    """
+    pairs, pair_idx = np.unique(np.column_stack([topology.left, topology.right]), axis=0, return_inverse=True)
+    pair_idx = pair_idx.ravel()
+    order = np.argsort(pair_idx, kind="stable")
+    lines = shapely.multilinestrings(topology.arcs[order], indices=pair_idx[order])
+    ids = np.append(topology.ids, None)
+    return gpd.GeoDataFrame(
+        {
+            "left_id": ids[pairs[:, 0]],
+            "right_id": ids[pairs[:, 1]],
+            "external": pairs[:, 1] == EXTERIOR,
+            "geometry": shapely.line_merge(lines),
+        },
+        crs=topology.crs,
+    )
+
+
+def stitch_borders(borders: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Join the external borders of adjacent coverages processed separately
+    (e.g. partitions of a layer).
+
+    Stretches found in the external borders of two features, traversed in
+    opposite directions, become a border between them, stored once and
+    following the feature with the lowest identifier; the rest stays
+    external. Takes and returns borders as given by shared_borders.
+    """
+    lines, line_row = shapely.get_parts(np.asarray(borders.geometry), return_index=True)
+    coords, coord_line = shapely.get_coordinates(lines, return_index=True)
+    seg_mask = coord_line[:-1] == coord_line[1:]
+    start, end = coords[:-1][seg_mask], coords[1:][seg_mask]
+    owner = borders["left_id"].to_numpy()[line_row[coord_line[:-1][seg_mask]]]
+    n_segs = len(start)
+
+    # Identical segments, as in build_topology
+    forward = (start[:, 0] < end[:, 0]) | ((start[:, 0] == end[:, 0]) & (start[:, 1] < end[:, 1]))
+    key_a = np.where(forward[:, None], start, end)
+    key_b = np.where(forward[:, None], end, start)
+    order = np.lexsort((owner.astype(str), key_b[:, 1], key_b[:, 0], key_a[:, 1], key_a[:, 0]))
+    sorted_keys = np.column_stack([key_a, key_b])[order]
+    new_group = np.ones(n_segs, dtype=bool)
+    new_group[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+    group = np.cumsum(new_group) - 1
+    group_size = np.bincount(group)[group]
+
+    # Segments shared by two features: kept once, from the lowest identifier's side
+    first = order[new_group]
+    other = np.full(n_segs, None, dtype=object)
+    paired = group_size[np.flatnonzero(new_group)] == 2
+    other[first[paired]] = owner[order[np.flatnonzero(new_group)[paired] + 1]]
+    keep = np.ones(n_segs, dtype=bool)
+    keep[order[(group_size == 2) & ~new_group]] = False
+
+    start, end, left, right = start[keep], end[keep], owner[keep], other[keep]
+    pairs = pd.DataFrame({"left_id": left, "right_id": right})
+    pair_idx = pairs.groupby(["left_id", "right_id"], dropna=False, sort=True).ngroup().to_numpy()
+    segments = shapely.linestrings(np.stack([start, end], axis=1))
+    order = np.argsort(pair_idx, kind="stable")
+    merged = shapely.line_merge(shapely.multilinestrings(segments[order], indices=pair_idx[order]), directed=True)
+    first_of_pair = order[np.r_[True, pair_idx[order][1:] != pair_idx[order][:-1]]]
+    return gpd.GeoDataFrame(
+        {
+            "left_id": left[first_of_pair],
+            "right_id": right[first_of_pair],
+            "external": pd.isna(right[first_of_pair]),
+            "geometry": merged,
+        },
+        crs=borders.crs,
+    )
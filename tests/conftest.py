@@ -0,0 +1,6 @@
+"""The pipeline modules live in src/scripts and import each other by name."""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src" / "scripts"))
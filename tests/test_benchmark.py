@@ -0,0 +1,16 @@
+import benchmark
+
+
+def test_failed_stage_does_not_abort_the_run(tmp_path):
+    coverage = benchmark.synthetic_coverage(30, seed=1)
+    inputs = {
+        name: benchmark.prepare_input(tmp_path / name, coverage, {}, "com-fra-2025-gen.parquet")
+        for name in ["ok", "broken"]
+    }
+    (inputs["broken"] / "coverage.parquet").unlink()
+
+    results = benchmark.run(inputs, ["clean_communes"], repeat=1)
+
+    assert results["ok"]["clean_communes"]["communes"] == 30
+    assert "error" in results["broken"]["clean_communes"]
+    assert [(name, stage) for name, stage, _ in benchmark.failures(results)] == [("broken", "clean_communes")]
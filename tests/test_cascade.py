@@ -0,0 +1,33 @@
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+
+from scheduler import load_script
+
+
+@pytest.fixture
+def generate():
+    return load_script("06-generate-ngeo.py")
+
+
+def test_nested_units_source_partly_without_target(generate):
+    membership = pd.DataFrame({
+        "com_insee": ["c1", "c2", "c3", "c4"],
+        "target": ["X", None, "Y", "Y"],
+        "source_id": ["A", "A", "B", "B"],
+    })
+    assert generate.nested_units(membership, "target", "source_id") == {"Y"}
+
+
+def test_cascade_dissolve_keeps_communes_without_target_out(generate):
+    communes = gpd.GeoDataFrame({
+        "com_insee": ["c1", "c2", "c3"],
+        "target": ["X", None, "X"],
+        "target_nom": ["Unit X", None, "Unit X"],
+    }, geometry=[shapely.box(i, 0, i + 1, 1) for i in range(3)])
+    # Source unit A holds c1 and c2, c3 is alone in B
+    source_gdf = gpd.GeoDataFrame({"source_id": ["A", "B"]}, geometry=[shapely.box(0, 0, 2, 1), shapely.box(2, 0, 3, 1)])
+    source_data = pd.DataFrame({"com_insee": ["c1", "c2", "c3"], "source_id": ["A", "A", "B"]})
+    dissolved = generate.cascade_dissolve(communes, "target", "target_nom", [("src", source_gdf, source_data)], "test")
+    assert dissolved.set_index("target").area.to_dict() == pytest.approx({"X": 2.0})
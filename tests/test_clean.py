@@ -0,0 +1,56 @@
+import geopandas as gpd
+import pytest
+import shapely
+
+from manifest import BuildManifest
+from scheduler import load_script
+
+
+@pytest.fixture
+def clean():
+    return load_script("04-clean-territory.py")
+
+
+def communes(extra=()):
+    """Four 1 km squares; a has an islet of 100 m² and a large detached part, b is split over two rows."""
+    rows = [
+        ("a", shapely.MultiPolygon([shapely.box(0, 0, 1000, 1000), shapely.box(5000, 0, 5010, 10), shapely.box(0, 2000, 1000, 3000)])),
+        ("b", shapely.box(1000, 0, 1500, 1000)),
+        ("b", shapely.box(1500, 0, 2000, 1000)),
+        ("c", shapely.box(2000, 0, 3000, 1000)),
+        ("d", shapely.box(7000, 0, 7005, 5)),
+        *extra,
+    ]
+    return gpd.GeoDataFrame({"com_insee": [code for code, _ in rows], "com_nom": [f"Commune {code}" for code, _ in rows]},
+                            geometry=[geometry for _, geometry in rows], crs=2154)
+
+
+def test_clean_communes(clean):
+    cleaned, diagnostics = clean.clean_communes(communes(), threshold=1000)
+    geometries = cleaned.set_index("com_insee").geometry
+    assert list(cleaned["com_insee"]) == ["a", "b", "c", "d"]
+    # Small islet dropped, large part kept
+    assert geometries["a"].area == pytest.approx(2e6)
+    assert diagnostics.set_index("com_insee").loc["a", ["parts", "parts_dropped", "area_dropped"]].tolist() == [3, 1, 100]
+    # The rows of b are merged into one polygon, a small commune keeps its only part
+    assert geometries["b"].geom_type == "Polygon" and geometries["b"].equals(shapely.box(1000, 0, 2000, 1000))
+    assert geometries["d"].area == pytest.approx(25)
+    assert clean.check_quality(diagnostics) == []
+
+
+def test_quality_gate_blocks_export(clean, tmp_path, monkeypatch):
+    monkeypatch.setattr(clean, "OUTPUT_DIR", tmp_path / "gen")
+    monkeypatch.setattr(clean, "REPORT_DIR", tmp_path / "reports")
+    (tmp_path / "gen").mkdir()
+    overlapping = communes([("e", shapely.box(2500, 500, 3500, 1500))])
+    source = tmp_path / "com-mtq-2025-temp.parquet"
+    overlapping.to_parquet(source)
+
+    _, diagnostics = clean.clean_communes(overlapping)
+    assert diagnostics.set_index("com_insee").loc[["c", "e"], "overlaps"].tolist() == [1, 1]
+    assert len(clean.check_quality(diagnostics)) == 1
+
+    with pytest.raises(ValueError):
+        clean.clean_file(source, BuildManifest("04-clean-territory", manifest_dir=tmp_path))
+    assert not (tmp_path / "gen" / "com-mtq-2025-gen.parquet").exists()
+    assert (tmp_path / "reports" / "com-mtq-2025-gen-diagnostics.csv").exists()
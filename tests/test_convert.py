@@ -0,0 +1,33 @@
+import geopandas as gpd
+import pytest
+import shapely
+
+from scheduler import load_script
+
+
+@pytest.fixture
+def convert():
+    return load_script("02-convert-ign.py")
+
+
+def test_process_territory_reads_only_the_needed_columns(convert, tmp_path, monkeypatch):
+    directory = tmp_path / "ADMIN-EXPRESS_3-2__SHP_RGAF09UTM20_MTQ_2025-01-01" / "ADMIN-EXPRESS"
+    directory.mkdir(parents=True)
+    bowtie = shapely.Polygon([(-61.10, 14.60), (-61.00, 14.70), (-61.00, 14.60), (-61.10, 14.70)])
+    gdf = gpd.GeoDataFrame({
+        "INSEE_COM": ["97209", "97201"],
+        "NOM": ["Fort-de-France", "L'Ajoupa-Bouillon"],
+        "POPULATION": [76000, 1700],
+        "SIREN_EPCI": ["249720061", "200041788"],
+    }, geometry=[bowtie, shapely.box(-61.2, 14.8, -61.1, 14.9)], crs=4326)
+    gdf.to_file(directory / "COMMUNE.shp")
+    monkeypatch.setattr(convert, "BASE_PATHS", [tmp_path])
+
+    timings = {}
+    result = convert.process_territory("MTQ", timings)
+    assert list(result.columns) == ["com_insee", "com_nom", "geometry"]
+    assert result["com_insee"].tolist() == ["97201", "97209"]
+    assert result.crs.to_epsg() == convert.CRS_CONFIG["MTQ"]
+    # The self-intersecting commune is repaired
+    assert result.is_valid.all() and not result.is_empty.any()
+    assert set(timings) == {"read", "repair", "reproject"}
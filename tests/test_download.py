@@ -0,0 +1,138 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from download import CHUNK_SIZE, DownloadError, download, make_session
+
+PAYLOAD = bytes(range(256)) * (CHUNK_SIZE * 7 // 2 // 256)  # 3.5 chunks
+CHECKSUM = "sha256:" + hashlib.sha256(PAYLOAD).hexdigest()
+ETAG = '"v2"'
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serve PAYLOAD, honouring "bytes=N-" Range requests and If-Range."""
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.requests.append((self.headers.get("Range"), self.headers.get("If-Range")))
+        start = 0
+        if self.headers.get("Range") and self.headers.get("If-Range", ETAG) == ETAG:
+            start = int(self.headers["Range"].removeprefix("bytes=").split("-")[0])
+            if start >= len(PAYLOAD):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(PAYLOAD)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(PAYLOAD) - start))
+        self.end_headers()
+        self.wfile.write(PAYLOAD[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def session():
+    session = make_session()
+    session.trust_env = False  # No proxy for the local server
+    return session
+
+
+def url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/archive.7z"
+
+
+def ranges(server):
+    return [range_header for range_header, _ in server.requests]
+
+
+def test_download_leaves_no_part_file(server, session, tmp_path):
+    dest = tmp_path / "archive.7z"
+    stats = download(session, url(server), dest, checksum=CHECKSUM)
+    assert dest.read_bytes() == PAYLOAD
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["archive.7z"]
+    assert stats.attempts == 1 and stats.resumed_from == 0
+
+
+def test_resume_from_partial_file(server, session, tmp_path):
+    dest = tmp_path / "archive.7z"
+    partial = CHUNK_SIZE * 3 // 2
+    (tmp_path / "archive.7z.part").write_bytes(PAYLOAD[:partial])
+    (tmp_path / "archive.7z.part.validator").write_text(ETAG)
+
+    stats = download(session, url(server), dest, checksum=CHECKSUM)
+
+    assert dest.read_bytes() == PAYLOAD
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["archive.7z"]
+    assert server.requests == [(f"bytes={partial}-", ETAG)]
+    assert stats.resumed_from == partial
+    assert stats.bytes == len(PAYLOAD) - partial
+
+
+def test_file_changed_upstream_is_downloaded_again(server, session, tmp_path):
+    dest = tmp_path / "archive.7z"
+    partial = CHUNK_SIZE + 1
+    (tmp_path / "archive.7z.part").write_bytes(b"\1" * partial)
+    (tmp_path / "archive.7z.part.validator").write_text('"v1"')
+
+    stats = download(session, url(server), dest)
+
+    assert dest.read_bytes() == PAYLOAD
+    assert server.requests == [(f"bytes={partial}-", '"v1"')]
+    assert stats.resumed_from == 0 and stats.attempts == 1
+
+
+@pytest.mark.parametrize("extra", [0, 1000])
+def test_part_file_reported_complete(server, session, tmp_path, extra):
+    dest = tmp_path / "archive.7z"
+    # Complete part file, or a stale one larger than the remote file
+    (tmp_path / "archive.7z.part").write_bytes(PAYLOAD + b"\0" * extra)
+
+    download(session, url(server), dest)
+
+    assert dest.read_bytes() == PAYLOAD
+    assert ranges(server) == [f"bytes={len(PAYLOAD) + extra}-"] + ([None] if extra else [])
+
+
+def test_corrupted_partial_file_is_downloaded_again(server, session, tmp_path):
+    dest = tmp_path / "archive.7z"
+    (tmp_path / "archive.7z.part").write_bytes(b"\0" * (CHUNK_SIZE + 1))
+
+    stats = download(session, url(server), dest, checksum=CHECKSUM, retries=1, backoff=0)
+
+    assert dest.read_bytes() == PAYLOAD
+    assert ranges(server) == [f"bytes={CHUNK_SIZE + 1}-", None]
+    assert stats.attempts == 2
+
+
+def test_checksum_mismatch_fails_without_retry(server, session, tmp_path):
+    dest = tmp_path / "archive.7z"
+
+    with pytest.raises(DownloadError, match="sha256"):
+        download(session, url(server), dest, checksum="sha256:" + "0" * 64, retries=3, backoff=0)
+
+    assert list(tmp_path.iterdir()) == []
+    assert ranges(server) == [None]
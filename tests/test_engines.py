@@ -0,0 +1,51 @@
+import os
+
+import geopandas as gpd
+import pytest
+
+from benchmark import compare_layers, engine_outputs, prepare_input
+from settings import COG_YEAR, PATHS
+
+TERRITORIES = ["mtq", "reu"]
+
+
+def filename(territory):
+    return f"com-{territory}-{COG_YEAR}-gen.parquet"
+
+
+@pytest.fixture(scope="module", params=TERRITORIES)
+def reference(request, tmp_path_factory):
+    """Input of a committed generalized commune file with a fake membership table, and its topology layers"""
+    root = tmp_path_factory.mktemp(request.param)
+    coverage = gpd.read_parquet(PATHS["processed_data"] / "gen" / filename(request.param))
+    input_dir = prepare_input(root / "input", coverage, {}, filename(request.param))
+    assert engine_outputs("topology", input_dir, root / "topology") == []
+    return input_dir, root / "topology"
+
+
+def assert_same_layers(reference_dir, output_dir):
+    layers = sorted(path.relative_to(reference_dir) for path in reference_dir.rglob("*.parquet"))
+    assert layers
+    assert layers == sorted(path.relative_to(output_dir) for path in output_dir.rglob("*.parquet"))
+    differences = {layer: compare_layers(reference_dir / layer, output_dir / layer) for layer in layers}
+    assert {layer: messages for layer, messages in differences.items() if messages} == {}
+
+
+def test_dissolve_engine_matches_topology(reference, tmp_path):
+    input_dir, reference_dir = reference
+    assert engine_outputs("dissolve", input_dir, tmp_path) == []
+    assert_same_layers(reference_dir, tmp_path)
+
+
+def test_duckdb_engine_matches_topology(reference, tmp_path):
+    duckdb_engine = pytest.importorskip("duckdb_engine")
+    try:
+        duckdb_engine.connect()
+    except Exception as e:
+        # Set NGEOFR_REQUIRE_DUCKDB=1 (with NGEOFR_DUCKDB_SPATIAL for offline runs) so that this check is never skipped
+        if os.environ.get("NGEOFR_REQUIRE_DUCKDB") == "1":
+            pytest.fail(f"DuckDB spatial extension unavailable: {e}")
+        pytest.skip(f"DuckDB spatial extension unavailable: {e}")
+    input_dir, reference_dir = reference
+    assert engine_outputs("duckdb", input_dir, tmp_path) == []
+    assert_same_layers(reference_dir, tmp_path)
@@ -0,0 +1,54 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import EXTENT, fake_membership, synthetic_coverage
+from geocoder import ID_COL, ReverseGeocoder
+
+
+@pytest.fixture(scope="module")
+def communes():
+    return synthetic_coverage(200)
+
+
+@pytest.fixture(scope="module")
+def points():
+    rng = np.random.default_rng(1)
+    xmin, ymin, xmax, ymax = EXTENT
+    # A margin around the coverage so that some points fall outside all communes
+    return rng.uniform([xmin - 50000, ymin - 50000], [xmax + 50000, ymax + 50000], size=(5000, 2)).T
+
+
+def test_lookup_matches_sjoin(communes, points):
+    geocoder = ReverseGeocoder.from_frame(communes)
+    index = geocoder.lookup(*points, batch_size=700)
+
+    frame = gpd.GeoDataFrame(geometry=gpd.points_from_xy(*points), crs=communes.crs)
+    joined = gpd.sjoin(frame, communes[[ID_COL, "geometry"]], how="left", predicate="within")
+    expected = joined.groupby(level=0)[ID_COL].first().sort_index().fillna("")
+
+    assert (index == -1).any() and (index >= 0).any()
+    assert np.where(index >= 0, geocoder.codes[ID_COL][index], "").tolist() == expected.tolist()
+
+
+def test_save_load_round_trip(communes, points, tmp_path):
+    membership = fake_membership(communes)
+    geocoder = ReverseGeocoder.from_frame(communes, membership)
+    path = tmp_path / "com.npz"
+    geocoder.save(path)
+    loaded = ReverseGeocoder.load(path)
+
+    assert loaded.crs == geocoder.crs
+    assert list(loaded.codes) == list(geocoder.codes)
+    assert all(loaded.geometries[i].equals_exact(geocoder.geometries[i], 0) for i in range(len(geocoder.geometries)))
+    pd.testing.assert_frame_equal(loaded.geocode(*points, crs=communes.crs), geocoder.geocode(*points, crs=communes.crs))
+
+
+def test_geocode_transforms_coordinates(communes):
+    geocoder = ReverseGeocoder.from_frame(communes, fake_membership(communes))
+    centers = communes.geometry.representative_point().iloc[:20]
+    lonlat = centers.to_crs(4326)
+    result = geocoder.geocode(lonlat.x.to_numpy(), lonlat.y.to_numpy(), crs=4326)
+    assert result[ID_COL].tolist() == communes[ID_COL].iloc[:20].tolist()
+    assert result["dep_insee"].notna().all()
@@ -0,0 +1,37 @@
+import json
+
+import geopandas as gpd
+import numpy as np
+import pyarrow.parquet as pq
+import shapely
+
+from benchmark import synthetic_coverage
+from geoparquet import COVERING_COLUMN, SCHEMA_VERSION, write_geoparquet
+
+
+def test_sorted_geoparquet_with_covering(tmp_path):
+    gdf = synthetic_coverage(300)
+    shuffled = gdf.sample(frac=1, random_state=0)
+    path = tmp_path / "com.parquet"
+    write_geoparquet(shuffled, path, row_group_size=50)
+
+    metadata = pq.ParquetFile(path).metadata
+    assert metadata.num_row_groups == 6
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+    geo = json.loads(metadata.metadata[b"geo"])
+    assert geo["version"] == SCHEMA_VERSION
+    assert COVERING_COLUMN in geo["columns"]["geometry"]["covering"]
+
+    written = gpd.read_parquet(path)
+    # Same rows, along the Hilbert curve
+    assert sorted(written["com_insee"]) == sorted(gdf["com_insee"])
+    assert (np.diff(written.geometry.hilbert_distance().to_numpy().astype(np.int64)) >= 0).all()
+    assert written.crs == gdf.crs
+
+    # bbox queries skip row groups and return the features intersecting the bbox
+    xmin, ymin, xmax, ymax = gdf.total_bounds
+    bbox = (xmin, ymin, (xmin + xmax) / 2, (ymin + ymax) / 2)
+    queried = gpd.read_parquet(path, bbox=bbox)
+    expected = written[written.intersects(shapely.box(*bbox))]
+    assert set(expected["com_insee"]) <= set(queried["com_insee"])
+    assert len(queried) < len(written)
@@ -0,0 +1,74 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pytest
+
+import instrument
+from instrument import RunReport
+
+
+def _worker_task(path):
+    """Task of a worker process: its own report, measures sent back with take()."""
+    report = RunReport("worker").activate()
+    with instrument.span("task", territory="mtq"):
+        with instrument.span("write"):
+            path.write_bytes(b"x" * 100)
+            instrument.file_written(path)
+        instrument.add(rows_out=3)
+    return report.take()
+
+
+def test_span_nesting(tmp_path):
+    report = RunReport("test", report_dir=tmp_path, profile=False)
+    with report:
+        with instrument.span("outer", mesh="dep") as outer:
+            with instrument.span("inner") as inner:
+                (tmp_path / "a.bin").write_bytes(b"x" * 10)
+                instrument.file_written(tmp_path / "a.bin")
+                instrument.add(rows_in=5)
+            instrument.add(rows_out=2)
+        with pytest.raises(ValueError):
+            with instrument.span("failing"):
+                raise ValueError("boom")
+
+    spans = {record["name"]: record for record in report.spans}
+    assert spans["run"]["parent"] is None
+    assert spans["outer"]["parent"] == spans["run"]["id"]
+    assert spans["inner"]["parent"] == outer["id"]
+    assert (inner["rows_in"], outer["rows_out"], outer["mesh"]) == (5, 2, "dep")
+    assert [spans[name]["bytes_written"] for name in ("run", "outer", "inner")] == [10, 10, 10]
+    assert report.files[0]["span"] == inner["id"]
+    assert spans["failing"]["error"] == "boom"
+    assert spans["run"]["seconds"] >= spans["outer"]["seconds"] >= spans["inner"]["seconds"]
+
+    # Saved, and no longer receiving spans once closed
+    saved = json.loads((tmp_path / f"test-{report.run_id}.json").read_text())
+    assert saved["summary"]["errors"] == 1 and saved["summary"]["bytes_written"] == 10
+    assert len(pd.read_parquet(tmp_path / f"test-{report.run_id}.parquet")) == len(report.spans)
+    with instrument.span("after"):
+        pass
+    assert "after" not in {record["name"] for record in report.spans}
+
+
+def test_worker_spans_merged_under_open_span(tmp_path):
+    report = RunReport("test", report_dir=tmp_path, profile=False)
+    with report:
+        with instrument.span("territories") as parent:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                # One process: its reports must not reuse span ids
+                results = list(executor.map(_worker_task, [tmp_path / "w1.bin", tmp_path / "w2.bin"]))
+            for measures in results:
+                report.merge(*measures)
+
+    tasks = [record for record in report.spans if record["name"] == "task"]
+    writes = [record for record in report.spans if record["name"] == "write"]
+    assert len(tasks) == len(writes) == 2
+    assert len({record["id"] for record in report.spans}) == len(report.spans)
+    # Worker roots are attached to the open span, inner spans keep their worker parent
+    assert all(record["parent"] == parent["id"] for record in tasks)
+    assert sorted(record["parent"] for record in writes) == sorted(record["id"] for record in tasks)
+    assert all(record["rows_out"] == 3 and record["territory"] == "mtq" for record in tasks)
+    assert len(report.files) == 2
+    assert parent["bytes_written"] == 200
+    assert report.summary()["bytes_written"] == 200
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+import shapely
+
+from benchmark import DROM_EXTENT, synthetic_coverage
+from labels import (LABEL_METHODS, LabelCache, affine_labels, cache_path, cached_label_points, geometry_hashes,
+                    label_points)
+
+
+@pytest.fixture(scope="module")
+def geometries():
+    return synthetic_coverage(50, extent=DROM_EXTENT, crs=5490).geometry.values
+
+
+@pytest.mark.parametrize("method", LABEL_METHODS)
+def test_label_points_inside(geometries, method):
+    # A C-shaped polygon, whose centroid is outside
+    shapes = np.append(np.asarray(geometries, dtype=object), shapely.Polygon([(0, 0), (3, 0), (3, 1), (1, 1), (1, 2), (3, 2), (3, 3), (0, 3)]))
+    assert shapely.contains(shapes, label_points(shapes, method)).all()
+
+
+def test_hash_independent_of_ring_start():
+    square = shapely.Polygon([(0, 0), (1, 0), (1, 1), (0, 1)])
+    rotated = shapely.Polygon([(1, 1), (0, 1), (0, 0), (1, 0)])
+    moved = shapely.Polygon([(0, 0), (1, 0), (1, 1), (0, 2)])
+    hashes = geometry_hashes([square, rotated, moved])
+    assert hashes[0] == hashes[1] != hashes[2]
+
+
+def test_cache_reuse(geometries, tmp_path):
+    path = cache_path("dep-test", "polylabel", 10, cache_dir=tmp_path)
+    points, computed = cached_label_points(geometries, "polylabel", 10, LabelCache(path))
+    assert computed == len(geometries) and path.exists()
+
+    # Unchanged layer: nothing recomputed, same points
+    again, computed = cached_label_points(geometries, "polylabel", 10, LabelCache(path))
+    assert computed == 0
+    assert shapely.equals_exact(again, points, 0).all()
+
+    # One geometry changed: only that one recomputed, and the file keeps the current geometries only
+    changed = geometries.copy()
+    changed[3] = shapely.buffer(changed[3], -50)
+    _, computed = cached_label_points(changed, "polylabel", 10, LabelCache(path))
+    assert computed == 1
+    assert len(LabelCache(path).points) == len(geometries)
+
+
+def test_staged_parts_saved_together(geometries, tmp_path):
+    cache = LabelCache(tmp_path / "dep.parquet")
+    for part in np.array_split(np.asarray(geometries, dtype=object), 3):
+        cached_label_points(part, cache=cache, save=False)
+    assert not cache.path.exists()
+    cache.save_staged()
+    _, computed = cached_label_points(geometries, cache=LabelCache(cache.path))
+    assert computed == 0
+
+
+def test_affine_reuse(geometries, tmp_path):
+    points = label_points(geometries, "representative")
+    scale, translation = 0.5, (1000.0, -2000.0)
+    hashes, moved_points = affine_labels(geometries, points, scale, translation)
+
+    # Geometries transformed like the compact layout are found in the cache with the moved points
+    compact = shapely.transform(geometries, lambda coords: coords * scale + np.asarray(translation))
+    cache = LabelCache(tmp_path / "dep-compact.parquet")
+    cache.add(hashes, moved_points)
+    reused, computed = cached_label_points(compact, "representative", cache=cache)
+    assert computed == 0
+    assert shapely.equals_exact(reused, moved_points, 0).all()
+    assert shapely.contains(compact, reused).all()
@@ -0,0 +1,69 @@
+import pytest
+
+from benchmark import DROM_EXTENT, fake_membership, synthetic_coverage
+from scheduler import load_script
+
+
+@pytest.fixture
+def merge():
+    return load_script("05-merge-frdrom.py")
+
+
+@pytest.fixture
+def generate(tmp_path):
+    generate = load_script("06-generate-ngeo.py")
+    generate.OUTPUT_DIR = str(tmp_path / "public")
+    generate.LABEL_CACHE = False
+    generate.LOD_PYRAMID = False
+    return generate
+
+
+@pytest.fixture
+def territories(merge):
+    territories = {"FRA": synthetic_coverage(40, seed=1)}
+    for i, territory in enumerate(merge.DROM_TERRITORIES):
+        territories[territory] = synthetic_coverage(
+            12, seed=i + 2, extent=DROM_EXTENT, crs=merge.CRS_CONFIG[territory], dep_codes=[f"97{i + 1}"]
+        )
+    return territories
+
+
+def test_layout_style(generate):
+    assert generate.extract_layout_style("com-frdrom-2025-gen.parquet") == "natural"
+    assert generate.extract_layout_style("com-glp-2025.parquet") == "natural"
+    assert generate.extract_layout_style("com-frdrom-compact-2025-gen.parquet") == "compact"
+    assert generate.extract_layout_style("com-frdrom-grid_2-2025.parquet") == "grid_2"
+
+
+@pytest.mark.parametrize("name", ["natural", "Grid", "my-layout", "2025"])
+def test_invalid_layout_names(merge, name):
+    with pytest.raises(ValueError):
+        merge.check_layouts({name: {}})
+
+
+def test_layouts_have_separate_output_trees(merge, generate, territories, tmp_path):
+    grid = {
+        territory: {"side_max_box": 50000, "coord_dest": [1300000, 6000000 + i * 60000]}
+        for i, territory in enumerate(merge.DROM_TERRITORIES)
+    }
+    layouts = {"compact": merge.LAYOUTS["compact"], "grid": grid}
+    frames = {"natural": merge.transform_natural(territories, tmp_path)}
+    frames.update({style: merge.transform_compact(territories, layout) for style, layout in layouts.items()})
+
+    for style, gdf in frames.items():
+        merge.export_geometries(gdf, merge.COG_YEAR, style, tmp_path, "-gen")
+        path = merge.get_output_filename(style, tmp_path, "-gen")
+        errors = generate.process_chain(gdf, path.name, True, ("com", "dep"), fake_membership(gdf), geom_path=path)
+        assert errors == []
+
+    public = tmp_path / "public"
+    assert sorted(path.name for path in public.iterdir()) == ["frdrom", "frdrom-compact", "frdrom-grid"]
+    surfaces = {}
+    for style, directory in [("natural", "frdrom"), ("compact", "frdrom-compact"), ("grid", "frdrom-grid")]:
+        suffix = "" if style == "natural" else f"-{style}"
+        names = {path.name for path in (public / directory).glob("*.parquet")}
+        assert f"com-frdrom{suffix}-{merge.COG_YEAR}-surface-gen.parquet" in names
+        assert f"dep-frdrom{suffix}-{merge.COG_YEAR}-surface-gen.parquet" in names
+        assert all(name.startswith(("com-frdrom" + suffix + "-", "dep-frdrom" + suffix + "-")) for name in names)
+        surfaces[style] = (public / directory / f"com-frdrom{suffix}-{merge.COG_YEAR}-surface-gen.parquet").read_bytes()
+    assert surfaces["compact"] != surfaces["grid"]
@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pytest
+import shapely
+
+from benchmark import synthetic_coverage
+from instrument import vertices
+from lod import LOD_LEVELS, build_pyramid, drop_small_parts, export_pyramid
+
+
+@pytest.fixture(scope="module")
+def coverage():
+    return synthetic_coverage(300)
+
+
+def test_drop_small_parts_keeps_largest():
+    big, small = shapely.box(0, 0, 10, 10), shapely.box(20, 20, 20.5, 20.5)
+    tiny_only = shapely.MultiPolygon([shapely.box(0, 0, 0.1, 0.1), shapely.box(1, 1, 1.2, 1.2)])
+    result = drop_small_parts(np.array([shapely.MultiPolygon([big, small]), tiny_only], dtype=object), 1.0)
+    assert result[0].equals(big)
+    assert result[1].equals(shapely.box(1, 1, 1.2, 1.2))
+
+
+def test_levels_coarser_and_coincident(coverage):
+    levels = list(build_pyramid(coverage, "com_insee"))
+    assert [(low, high) for low, high, _, _ in levels] == LOD_LEVELS
+    tolerances = [tolerance for _, _, tolerance, _ in levels]
+    assert tolerances == sorted(tolerances)
+    counts = [vertices(level.geometry) for _, _, _, level in levels]
+    assert vertices(coverage.geometry) >= counts[0] and counts == sorted(counts, reverse=True)
+    for _, _, _, level in levels:
+        assert shapely.is_valid(level.geometry.values).all()
+        # Neighbours stay coincident: no overlaps, and (almost) no gaps between them
+        union = shapely.union_all(level.geometry.values)
+        assert level.area.sum() == pytest.approx(union.area, rel=1e-6)
+        assert union.area == pytest.approx(coverage.area.sum(), rel=0.01)
+
+
+def test_export_manifest(coverage, tmp_path):
+    coverage.to_parquet(tmp_path / "com-test-surface-gen.parquet")
+    levels = LOD_LEVELS[:2]
+    manifest = export_pyramid(coverage, "com_insee", tmp_path, "com-test", "-gen", levels=levels,
+                              full_files={"surface": "com-test-surface-gen.parquet"})
+    assert manifest == json.loads((tmp_path / "lod" / "com-test-lod-gen.json").read_text())
+    zooms = [(level["minzoom"], level["maxzoom"]) for level in manifest["levels"]]
+    assert zooms[1:] == levels and zooms[0][0] == levels[0][1] + 1
+    assert manifest["levels"][0]["surface"]["file"] == "../com-test-surface-gen.parquet"
+    for level in manifest["levels"][1:]:
+        assert (tmp_path / "lod" / level["surface"]["file"]).exists()
+        assert (tmp_path / "lod" / level["boundary"]["file"]).exists()
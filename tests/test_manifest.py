@@ -0,0 +1,30 @@
+from manifest import BuildManifest
+
+
+def test_outputs_rebuilt_only_when_changed(tmp_path):
+    source, output = tmp_path / "in.txt", tmp_path / "out.txt"
+    source.write_text("a")
+    output.write_text("b")
+    manifest = BuildManifest("test", manifest_dir=tmp_path)
+    manifest.record([output], inputs=[source], params={"level": 1})
+
+    assert manifest.is_up_to_date([output], inputs=[source], params={"level": 1})
+    assert not manifest.is_up_to_date([output], inputs=[source], params={"level": 2})
+    source.write_text("changed")
+    assert not manifest.is_up_to_date([output], inputs=[source], params={"level": 1})
+
+
+def test_absent_optional_output_stays_up_to_date(tmp_path):
+    written, optional = tmp_path / "surface.parquet", tmp_path / "lod.json"
+    written.write_text("surface")
+    manifest = BuildManifest("test", manifest_dir=tmp_path)
+    manifest.record([written, optional])
+    manifest.save()
+
+    reloaded = BuildManifest("test", manifest_dir=tmp_path)
+    assert reloaded.is_up_to_date([written, optional])
+    optional.write_text("unexpected")
+    assert not reloaded.is_up_to_date([written, optional])
+    optional.unlink()
+    written.unlink()
+    assert not reloaded.is_up_to_date([written, optional])
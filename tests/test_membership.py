@@ -0,0 +1,70 @@
+import duckdb
+import pytest
+
+import membership
+from membership import CACHE_PREFIX, load_membership
+
+EPCI_EPT_QUERY = "SELECT com_insee, coalesce(ept_siren, epci_siren) AS epci_siren, coalesce(ept_nom, epci_nom) AS epci_nom FROM ngeofr"
+
+
+def write_database(path, communes):
+    path.unlink(missing_ok=True)
+    con = duckdb.connect(str(path))
+    con.execute("""
+        CREATE TABLE ngeofr (
+            com_insee VARCHAR, com_nom VARCHAR, arr_insee VARCHAR, arr_nom VARCHAR,
+            dep_insee VARCHAR, dep_nom VARCHAR, reg_insee VARCHAR, reg_nom VARCHAR,
+            epci_siren VARCHAR, epci_nom VARCHAR, ept_siren VARCHAR, ept_nom VARCHAR
+        )
+    """)
+    con.executemany("INSERT INTO ngeofr VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", communes)
+    con.close()
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "ngeo.duckdb"
+    write_database(path, [
+        ("75101", "Paris 1er", "751", "Paris", "75", "Paris", "11", "IDF", "200054781", "Métropole du Grand Paris", "200057866", "Paris"),
+        ("97209", "Fort-de-France", "972", "FdF", "972", "Martinique", "02", "Martinique", "249720061", "CACEM", None, None),
+    ])
+    query = tmp_path / "query_epci_ept.sql"
+    query.write_text(EPCI_EPT_QUERY)
+    return path, query
+
+
+def test_cached_after_a_single_query(database, tmp_path, monkeypatch):
+    db_path, query = database
+    cache_dir = tmp_path / "cache"
+    table = load_membership(db_path, query, cache_dir)
+    assert table["com_insee"].tolist() == ["75101", "97209"]
+    assert table["epciept_siren"].tolist() == ["200057866", "249720061"]
+    assert len(list(cache_dir.glob(f"{CACHE_PREFIX}*.parquet"))) == 1
+
+    def fail(*args):
+        raise AssertionError("database queried again")
+
+    monkeypatch.setattr(membership, "query_membership", fail)
+    assert load_membership(db_path, query, cache_dir).equals(table)
+
+
+def test_database_change_replaces_the_cache(database, tmp_path):
+    db_path, query = database
+    cache_dir = tmp_path / "cache"
+    load_membership(db_path, query, cache_dir)
+    first = list(cache_dir.glob(f"{CACHE_PREFIX}*.parquet"))
+
+    write_database(db_path, [("97101", "Les Abymes", "971", "PaP", "971", "Guadeloupe", "01", "Guadeloupe", "200018653", "Cap Excellence", None, None)])
+    table = load_membership(db_path, query, cache_dir)
+    caches = list(cache_dir.glob(f"{CACHE_PREFIX}*.parquet"))
+    assert table["com_insee"].tolist() == ["97101"]
+    assert len(caches) == 1 and caches != first
+
+
+def test_cache_used_without_database(database, tmp_path):
+    db_path, query = database
+    cache_dir = tmp_path / "cache"
+    with pytest.raises(FileNotFoundError):
+        load_membership(db_path.with_name("missing.duckdb"), query, cache_dir)
+    table = load_membership(db_path, query, cache_dir)
+    assert load_membership(db_path.with_name("missing.duckdb"), query, cache_dir).equals(table)
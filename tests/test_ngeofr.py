@@ -0,0 +1,70 @@
+import shutil
+
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+
+import ngeofr
+from settings import COG_YEAR, PATHS
+
+
+def test_year_defaults_to_newest_layer(tmp_path):
+    (tmp_path / "mtq").mkdir()
+    source = PATHS["public"] / "mtq" / f"dep-mtq-{COG_YEAR}-surface-gen.parquet"
+    for year in ["2024", "2026"]:
+        shutil.copy(source, tmp_path / "mtq" / f"dep-mtq-{year}-surface-gen.parquet")
+    # Other kinds and layers do not count
+    shutil.copy(source, tmp_path / "mtq" / "dep-mtq-2027-boundary-gen.parquet")
+    shutil.copy(source, tmp_path / "mtq" / "dep-mtq-2028-surface.parquet")
+
+    assert ngeofr.layer_path("dep", "mtq", root=tmp_path).name == "dep-mtq-2026-surface-gen.parquet"
+    assert ngeofr.layer_path("dep", "mtq", year="2024", root=tmp_path).name == "dep-mtq-2024-surface-gen.parquet"
+    assert ngeofr.layer_path("reg", "mtq", root=tmp_path).name == f"reg-mtq-{COG_YEAR}-surface-gen.parquet"
+    assert len(ngeofr.load("dep", "mtq", root=tmp_path)) == 1
+
+
+@pytest.fixture(params=["cached", "pushdown"])
+def engine(request, monkeypatch):
+    """Run load() on the small-file cache or on the Parquet pushdown path."""
+    if request.param == "pushdown":
+        monkeypatch.setattr(ngeofr, "CACHE_FILE_LIMIT", 0)
+    ngeofr.clear_cache()
+    yield request.param
+    ngeofr.clear_cache()
+
+
+def test_filters_match_plain_read(engine):
+    path = ngeofr.layer_path("epci", "fra")
+    full = gpd.read_parquet(path)
+    bbox = (600000, 6500000, 700000, 6600000)
+    in_bbox = full.intersects(shapely.box(*bbox))
+    # Every other unit of the bbox and a sample of the others
+    ids = full["epci_siren"][in_bbox].iloc[::2].tolist() + full["epci_siren"][~in_bbox].iloc[::50].tolist()
+
+    def expected(mask):
+        return full[mask].reset_index(drop=True)[["epci_siren", "epci_nom", "geometry"]]
+
+    pd.testing.assert_frame_equal(ngeofr.load("epci", "fra", ids=ids), expected(full["epci_siren"].isin(ids)))
+    pd.testing.assert_frame_equal(ngeofr.load("epci", "fra", bbox=bbox), expected(in_bbox))
+    both = ngeofr.load("epci", "fra", ids=ids, bbox=bbox)
+    pd.testing.assert_frame_equal(both, expected(in_bbox & full["epci_siren"].isin(ids)))
+    assert 0 < len(both) < in_bbox.sum()
+
+    # Same query twice: served from the cache, as a copy
+    first = ngeofr.load("epci", "fra", bbox=bbox, columns=[])
+    first["epci_siren"] = "changed"
+    second = ngeofr.load("epci", "fra", bbox=bbox, columns=[])
+    assert list(second.columns) == ["epci_siren", "geometry"]
+    pd.testing.assert_series_equal(second["epci_siren"], expected(in_bbox)["epci_siren"])
+    assert ngeofr.cache_info()["hits"] >= 1
+
+
+def test_bbox_in_another_crs(engine):
+    bbox = (1.5, 46.0, 2.5, 46.8)
+    lonlat = ngeofr.load("dep", "fra", bbox=bbox, bbox_crs=4326)
+    full = gpd.read_parquet(ngeofr.layer_path("dep", "fra"))
+    projected = full[full.intersects(gpd.GeoSeries([shapely.box(*bbox)], crs=4326).to_crs(full.crs).iloc[0])]
+    # The projected bbox of load() encloses the projected box: a superset of the exact selection
+    assert set(projected["dep_insee"]) <= set(lonlat["dep_insee"])
+    assert len(lonlat) < len(full)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+import shapely
+
+from benchmark import fake_membership, synthetic_coverage
+from geoparquet import write_geoparquet
+from scheduler import load_script
+
+
+@pytest.fixture
+def generate(tmp_path):
+    generate = load_script("06-generate-ngeo.py")
+    generate.OUTPUT_DIR = str(tmp_path / "public")
+    generate.LABEL_CACHE = False
+    return generate
+
+
+def partitioned_input(tmp_path, empty=None):
+    """Commune file in two departments (partitions), optionally with an empty commune geometry"""
+    coverage = synthetic_coverage(60, seed=3)
+    membership = fake_membership(coverage)
+    if empty is not None:
+        coverage.loc[empty, "geometry"] = shapely.Polygon()
+    membership["dep_insee"] = np.where(membership.index < 30, "01", "02")
+    path = tmp_path / "com-fra-2025.parquet"
+    write_geoparquet(coverage, path, compression_level=1, sort=False)
+    return path, membership
+
+
+def test_partitions_write_every_commune(generate, tmp_path):
+    path, membership = partitioned_input(tmp_path)
+    assert generate.process_chain_partitioned(path, path.name, False, ("com",), membership) == []
+    surfaces = tmp_path / "public" / "fra" / "com-fra-2025-surface.parquet"
+    assert len(generate.gpd.read_parquet(surfaces)) == 60
+
+
+def test_invalid_partition_is_reported(generate, tmp_path):
+    path, membership = partitioned_input(tmp_path, empty=45)
+    errors = generate.process_chain_partitioned(path, path.name, False, ("com",), membership)
+    assert errors == [(path.name, "com", "invalid geometries")]
+    assert not (tmp_path / "public" / "fra" / "com-fra-2025-surface.parquet").exists()
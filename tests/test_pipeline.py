@@ -0,0 +1,37 @@
+import geopandas as gpd
+import pytest
+import shapely
+
+from benchmark import DROM_EXTENT, synthetic_coverage
+from manifest import BuildManifest
+from pipeline import Pipeline
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    pipeline = Pipeline(persist_dir=tmp_path / "persist")
+    pipeline.stages["clean"].REPORT_DIR = tmp_path / "reports"
+    return pipeline
+
+
+def test_in_memory_generalization_matches_the_file_stages(pipeline, tmp_path):
+    standard = synthetic_coverage(150, extent=DROM_EXTENT, crs=5490)
+    generalized = pipeline.generalize({"MTQ": standard}, tolerance=200)["MTQ"]
+
+    # Same layer through 03 and 04 on files
+    name = f"com-mtq-{pipeline.year}"
+    simplify, clean = pipeline.stages["simplify"], pipeline.stages["clean"]
+    source = tmp_path / f"{name}.parquet"
+    standard.to_parquet(source)
+    temp = tmp_path / f"{name}-temp.parquet"
+    simplify.simplify_coverage(source, [200], manifest=BuildManifest("03", manifest_dir=tmp_path), outputs={200: temp})
+    expected, _ = clean.process_file(temp, clean.territory_threshold(temp))
+
+    assert generalized["com_insee"].tolist() == expected["com_insee"].tolist()
+    assert shapely.equals(generalized.geometry.values, expected.geometry.values).all()
+    assert generalized.crs == expected.crs
+    # Intermediates only written on request, under the usual names
+    persisted = gpd.read_parquet(tmp_path / "persist" / "gen" / f"{name}-gen.parquet")
+    assert sorted(persisted["com_insee"]) == sorted(expected["com_insee"])
+    assert (tmp_path / "persist" / "temp" / f"{name}-temp.parquet").exists()
+    assert (tmp_path / "reports" / f"{name}-gen-diagnostics.csv").exists()
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import scheduler
+import settings
+from scheduler import Scheduler, Task
+
+
+def test_overrides_merge_nested_tables(tmp_path):
+    path = tmp_path / "ngeofr.toml"
+    path.write_text('year = "2026"\n\n[crs]\nFRA = 3857\n\n[workers]\nio = 7\n')
+    loaded = settings.load(path)
+    assert loaded["year"] == "2026"
+    assert loaded["crs"] == {**settings.DEFAULTS["crs"], "FRA": 3857}
+    assert loaded["workers"] == {**settings.DEFAULTS["workers"], "io": 7}
+    assert loaded["paths"] == settings.DEFAULTS["paths"]
+    # The defaults are left untouched
+    assert settings.DEFAULTS["crs"]["FRA"] == 2154
+
+
+def test_json_file_from_environment(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"paths": {"public": "/data/public"}}))
+    monkeypatch.setenv(settings.CONFIG_ENV, str(path))
+    loaded = settings.load()
+    assert loaded["paths"]["public"] == "/data/public"
+    assert loaded["paths"]["raw_data"] == settings.DEFAULTS["paths"]["raw_data"]
+
+
+def test_missing_file(tmp_path, monkeypatch):
+    monkeypatch.delenv(settings.CONFIG_ENV, raising=False)
+    with pytest.raises(FileNotFoundError):
+        settings.load(tmp_path / "missing.toml")
+    # No ngeofr.toml in the working directory: the defaults
+    monkeypatch.chdir(tmp_path)
+    assert settings.load() == settings.DEFAULTS
+
+
+TASKS_SCRIPT = '''
+calls = []
+
+def step(name, fail=False):
+    calls.append(name)
+    if fail:
+        raise RuntimeError(name)
+    return name.upper()
+'''
+
+
+def test_scheduler_runs_dependencies_first_and_skips_failed_branches(tmp_path, monkeypatch):
+    (tmp_path / "99-tasks.py").write_text(TASKS_SCRIPT)
+    monkeypatch.setattr(scheduler, "SCRIPTS_DIR", tmp_path)
+    monkeypatch.setattr(scheduler, "_modules", {})
+
+    def task(name, deps=(), fail=False):
+        return Task(name, "99-tasks.py", "step", (name,), {"fail": fail}, pool="io", deps=deps, manifest=False)
+
+    tasks = [
+        task("convert", deps=("download",)),
+        task("download"),
+        task("broken", deps=("download",), fail=True),
+        task("merge", deps=("convert", "broken")),
+        task("after-merge", deps=("merge",)),
+    ]
+    run = Scheduler(tasks, io_workers=2)
+    results = run.run()
+
+    assert results == {"download": "DOWNLOAD", "convert": "CONVERT"}
+    assert list(run.failed) == ["broken"]
+    assert sorted(run.skipped) == ["after-merge", "merge"]
+    calls = scheduler.load_script("99-tasks.py").calls
+    assert calls[0] == "download" and sorted(calls) == ["broken", "convert", "download"]
+
+    with pytest.raises(ValueError):
+        Scheduler([task("orphan", deps=("unknown",))])
@@ -0,0 +1,16 @@
+import geopandas as gpd
+import pytest
+import shapely
+
+from scheduler import SCRIPTS_DIR, load_script
+
+TEMP_DIR = SCRIPTS_DIR.parent / "processed_data" / "temp"
+
+
+@pytest.mark.parametrize("territory", ["reu", "mtq", "myt"])
+def test_simplify_frame_keeps_a_valid_coverage(territory):
+    simplify = load_script("03-simplify-ign.py")
+    gdf = gpd.read_parquet(TEMP_DIR / f"com-{territory}-2025-temp.parquet")
+    for tolerance, simplified in simplify.simplify_frame(gdf, [50, 200, 1000], "douglas"):
+        edges = shapely.coverage_invalid_edges(simplified.geometry.values)
+        assert shapely.is_empty(edges).all(), f"overlapping communes at {tolerance} m"
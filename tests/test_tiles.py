@@ -0,0 +1,31 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+from pmtiles.tile import tileid_to_zxy
+
+from scheduler import load_script
+
+
+def test_generate_tiles_starts_at_the_first_layer_minzoom():
+    tiles = load_script("07-generate-tiles.py")
+    points = np.array([shapely.Point(250000, 6250000), shapely.Point(260000, 6240000)], dtype=object)
+    layers = {"com-centroid": {
+        "columns": ["com_insee"],
+        "attributes": [{"com_insee": "a"}, {"com_insee": "b"}],
+        "geometries": {zoom: points for zoom in range(6, tiles.MAX_ZOOM + 1)},
+        "bounds": shapely.total_bounds(points),
+        "minzoom": 6,
+    }}
+    encoded = tiles.generate_tiles(layers, workers=1)
+    zooms = {tileid_to_zxy(tile_id)[0] for tile_id in encoded}
+    assert zooms == set(range(6, tiles.MAX_ZOOM + 1))
+
+
+def test_process_territory_with_only_empty_layers(tmp_path):
+    tiles = load_script("07-generate-tiles.py")
+    territory_dir = tmp_path / "glp"
+    territory_dir.mkdir()
+    empty = gpd.GeoDataFrame({"dep_insee": []}, geometry=[], crs=5490)
+    empty.to_parquet(territory_dir / f"dep-glp-{tiles.COG_YEAR}-surface{tiles.SOURCE_SUFFIX}.parquet")
+    tiles.process_territory(territory_dir, workers=1)
+    assert not list(territory_dir.glob("*.pmtiles"))
@@ -0,0 +1,65 @@
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+
+import ngeofr
+from benchmark import DROM_EXTENT, synthetic_coverage
+from geoparquet import write_geoparquet
+from settings import COG_YEAR
+from topology import assemble_mesh, build_topology, shared_borders
+
+
+@pytest.fixture
+def t_junction():
+    """Three unit squares in a row, the middle one with an extra vertex on the border it shares with the first."""
+    squares = [
+        shapely.box(0, 0, 1, 1),
+        shapely.Polygon([(1, 0), (2, 0), (2, 1), (1, 1), (1, 0.5)]),
+        shapely.box(2, 0, 3, 1),
+    ]
+    return build_topology(gpd.GeoDataFrame({"com_insee": ["a", "b", "c"]}, geometry=squares), id_col="com_insee")
+
+
+@pytest.mark.parametrize("units, areas", [
+    (["X", "Y", "Y"], {"X": 1.0, "Y": 2.0}),
+    (["X", "X", "X"], {"X": 3.0}),
+    (["X", "X", "Y"], {"X": 2.0, "Y": 1.0}),
+])
+def test_assemble_mesh_keeps_area_on_non_coincident_borders(t_junction, units, areas):
+    mesh = assemble_mesh(t_junction, pd.Series(units))
+    assert dict(zip(mesh["unit"], mesh.area)) == pytest.approx(areas)
+    assert shapely.is_valid(mesh.geometry.values).all()
+
+
+def test_assemble_mesh_coincident_borders_are_not_dissolved():
+    squares = [shapely.box(i, 0, i + 1, 1) for i in range(4)]
+    topology = build_topology(gpd.GeoDataFrame({"com_insee": list("abcd")}, geometry=squares), id_col="com_insee")
+    mesh = assemble_mesh(topology, pd.Series(["X", "X", None, "Y"]))
+    assert dict(zip(mesh["unit"], mesh.area)) == pytest.approx({"X": 2.0, "Y": 1.0})
+    assert mesh.attrs["dissolved"] == []
+
+
+def test_shared_borders_stored_once(tmp_path):
+    communes = synthetic_coverage(80, extent=DROM_EXTENT, crs=5490)
+    borders = shared_borders(build_topology(communes))
+
+    internal = borders[~borders["external"]]
+    assert not internal[["left_id", "right_id"]].apply(frozenset, axis=1).duplicated().any()
+    assert borders.loc[borders["external"], "right_id"].isna().all()
+    # Each shared border follows the boundaries of both of its communes
+    geometries = communes.set_index("com_insee").geometry
+    for row in internal.sample(10, random_state=0).itertuples():
+        shared = geometries[row.left_id].boundary.intersection(geometries[row.right_id].boundary)
+        assert row.geometry.length == pytest.approx(shared.length)
+    # The borders cover every commune boundary, internal ones for both of their communes
+    assert internal.length.sum() * 2 + borders[borders["external"]].length.sum() == pytest.approx(communes.length.sum())
+
+    # Border layers are loaded by the units on either side
+    layer = tmp_path / "mtq" / f"com-mtq-{COG_YEAR}-border-gen.parquet"
+    layer.parent.mkdir()
+    write_geoparquet(borders, layer)
+    some = communes["com_insee"].iloc[0]
+    loaded = ngeofr.load("com", "mtq", kind="border", ids=[some], root=tmp_path)
+    assert len(loaded) == ((borders["left_id"] == some) | (borders["right_id"] == some)).sum()
+    assert ((loaded["left_id"] == some) | (loaded["right_id"] == some)).all()
@@ -0,0 +1,49 @@
+import py7zr
+import pytest
+
+from manifest import BuildManifest
+from scheduler import load_script
+
+ROOT = "ADMIN-EXPRESS_3-2__SHP_RGAF09UTM20_MTQ_2025-01-01/ADMIN-EXPRESS/1_DONNEES_LIVRAISON/ADE_3-2_SHP_RGAF09UTM20_MTQ"
+
+
+@pytest.fixture
+def unzip():
+    return load_script("01-unzip-ign.py")
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "ADMIN-EXPRESS_MTQ.7z"
+    with py7zr.SevenZipFile(path, "w") as archive:
+        for name in ["COMMUNE.shp", "COMMUNE.shx", "COMMUNE.dbf", "COMMUNE.prj", "COMMUNE.cpg", "COMMUNE.xml",
+                     "DEPARTEMENT.shp", "DEPARTEMENT.dbf", "CANTON.shp"]:
+            archive.writestr(f"content of {name}", f"{ROOT}/{name}")
+    return path
+
+
+def test_select_members(unzip):
+    names = [f"{ROOT}/COMMUNE.SHP", f"{ROOT}/commune.dbf", f"{ROOT}/COMMUNE.xml", f"{ROOT}/COMMUNE_ASSOCIEE.shp", ROOT]
+    assert unzip.select_members(names) == [f"{ROOT}/COMMUNE.SHP", f"{ROOT}/commune.dbf"]
+
+
+def test_only_needed_layers_extracted_once(unzip, archive, tmp_path, monkeypatch):
+    monkeypatch.setattr(unzip, "path", tmp_path)
+    manifest = BuildManifest("01-unzip-ign", manifest_dir=tmp_path / "manifests")
+    assert unzip.unzip_archive(archive, manifest) == 5
+    extracted = sorted(p.name for p in (tmp_path / archive.stem).rglob("*") if p.is_file())
+    assert extracted == ["COMMUNE.cpg", "COMMUNE.dbf", "COMMUNE.prj", "COMMUNE.shp", "COMMUNE.shx"]
+    assert (tmp_path / archive.stem / ROOT / "COMMUNE.shp").read_text() == "content of COMMUNE.shp"
+
+    # Up to date: not extracted again, until the extracted files change
+    assert unzip.unzip_archive(archive, manifest) == 0
+    (tmp_path / archive.stem / ROOT / "COMMUNE.dbf").unlink()
+    assert unzip.unzip_archive(archive, manifest) == 5
+
+
+def test_archive_without_layer(unzip, tmp_path):
+    path = tmp_path / "other.7z"
+    with py7zr.SevenZipFile(path, "w") as archive:
+        archive.writestr("x", "README.txt")
+    with pytest.raises(ValueError):
+        unzip.extract_archive(path, tmp_path / "other")
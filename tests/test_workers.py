@@ -0,0 +1,52 @@
+import sys
+
+import pytest
+
+from benchmark import DROM_EXTENT, fake_membership, synthetic_coverage
+from geoparquet import write_geoparquet
+from manifest import BuildManifest
+from scheduler import load_script
+from settings import COG_YEAR
+
+
+@pytest.fixture
+def generate(tmp_path, monkeypatch):
+    generate = load_script("06-generate-ngeo.py")
+    input_dir = tmp_path / "gen"
+    input_dir.mkdir()
+    # One coverage, written as two territory files
+    communes = synthetic_coverage(80, extent=DROM_EXTENT, crs=5490, dep_codes=["972", "971"])
+    for territory, dep in [("mtq", "972"), ("glp", "971")]:
+        write_geoparquet(communes[communes["com_insee"].str.startswith(dep)], input_dir / f"com-{territory}-{COG_YEAR}-gen.parquet")
+    membership = fake_membership(communes)
+
+    paths = generate.list_geometries_paths([str(input_dir)])
+    monkeypatch.setattr(generate, "list_geometries_paths", lambda: paths)
+    monkeypatch.setattr(generate, "LABEL_CACHE", False)
+    monkeypatch.setattr(generate, "LOD_PYRAMID", False)
+    monkeypatch.setattr(generate, "load_membership", lambda *args: membership)
+    monkeypatch.setattr(generate, "save_snapshot", lambda *args: None)
+    monkeypatch.setattr(generate, "build_manifest", lambda: BuildManifest(generate.MANIFEST_STAGE, manifest_dir=tmp_path))
+    return generate
+
+
+def outputs(directory):
+    return {path.relative_to(directory).as_posix(): path.read_bytes() for path in sorted(directory.rglob("*.parquet"))}
+
+
+def test_mesh_chains_follow_the_hierarchy(generate):
+    chains = generate.mesh_chains(generate.MESHES)
+    assert chains == [["com"], ["arr", "dep", "reg"], ["epci", "ept", "epciept"]]
+
+
+def test_worker_pool_matches_serial_run(generate, tmp_path, monkeypatch):
+    # Tasks are pickled by reference to the module, importable when run as a script
+    monkeypatch.setitem(sys.modules, generate.__name__, generate)
+    runs = {}
+    for workers in (1, 2):
+        monkeypatch.setattr(generate, "OUTPUT_DIR", str(tmp_path / f"public-{workers}"))
+        (tmp_path / f"{generate.MANIFEST_STAGE}.json").unlink(missing_ok=True)
+        assert generate.main(workers=workers, engine="dissolve") == []
+        runs[workers] = outputs(tmp_path / f"public-{workers}")
+    assert any(name.startswith("mtq/") for name in runs[1]) and any(name.startswith("glp/") for name in runs[1])
+    assert runs[2] == runs[1]